@@ -15,13 +15,25 @@ from .contact_count import ContactCount
 
 from .contact_trajectory import ContactTrajectory, RollingContactFrequency
 
-from .min_dist import NearestAtoms, MinimumDistanceCounter
+from .min_dist import (
+    NearestAtoms, NearestAtomsTrajectory, MinimumDistanceCounter
+)
 
 from .concurrence import (
     Concurrence, AtomContactConcurrence, ResidueContactConcurrence,
     ConcurrencePlotter, plot_concurrence
 )
 
+from .lifetimes import ContactLifetimes
+
+from .options import ExecutionOptions
+
+from .checkpoint import ContactCheckpoint
+
+from .cache import ContactCache
+
 from .dask_runner import DaskContactFrequency
 
+from .streaming import StreamingContactFrequency
+
 from . import plot_utils
@@ -2,10 +2,28 @@ import collections
 import numpy as np
 import mdtraj as md
 
-def _atom_slice(traj, indices):
-    """Mock MDTraj.atom_slice without rebuilding topology"""
-    xyz = np.array(traj.xyz[:, indices], order='C')
-    topology = traj.topology.copy()
+def _sliced_topology(topology, indices):
+    """Topology copy that reports only the sliced atoms"""
+    topology = topology.copy()
+    # Hackish to make the smart slicing work
+    topology._atoms = indices
+    topology._numAtoms = len(indices)
+    return topology
+
+
+def _atom_slice(traj, indices, topology=None, out=None):
+    """Mock MDTraj.atom_slice without rebuilding topology
+
+    If ``topology`` is given, it is used as the (already sliced) topology.
+    If ``out`` is given, the coordinates are written into it, instead of
+    into a newly allocated array.
+    """
+    if out is None:
+        xyz = np.array(traj.xyz[:, indices], order='C')
+    else:
+        xyz = np.take(traj.xyz, indices, axis=1, out=out)
+    if topology is None:
+        topology = _sliced_topology(traj.topology, indices)
     if traj._have_unitcell:
         unitcell_lengths = traj._unitcell_lengths.copy()
         unitcell_angles = traj._unitcell_angles.copy()
@@ -14,13 +32,22 @@ def _atom_slice(traj, indices):
         unitcell_angles = None
     time = traj._time.copy()
 
-    # Hackish to make the smart slicing work
-    topology._atoms = indices
-    topology._numAtoms = len(indices)
     return md.Trajectory(xyz=xyz, topology=topology, time=time,
                          unitcell_lengths=unitcell_lengths,
                          unitcell_angles=unitcell_angles)
 
+
+def _frame_blocks(frames, block_size):
+    """Split a slice of frames into slices of at most block_size frames"""
+    return [slice(start, min(start + block_size, frames.stop))
+            for start in range(frames.start, frames.stop, block_size)]
+
+
+def _identity_blocks(trajectory, frames, block_size):
+    for block in _frame_blocks(frames, block_size):
+        # slicing frames without copy gives views on the coordinates
+        yield block, trajectory.slice(block, copy=False)
+
 def residue_query_atom_idxs(sliced_query, atom_idx_to_residue_idx):
     residue_query_atom_idxs = collections.defaultdict(list)
     for sliced_idx in sliced_query:
@@ -29,43 +56,58 @@ def residue_query_atom_idxs(sliced_query, atom_idx_to_residue_idx):
     return residue_query_atom_idxs
 
 
+def _atom_residue_idxs(topology):
+    """Array with the residue index of each atom in the topology"""
+    return np.fromiter((atom.residue.index for atom in topology.atoms),
+                       dtype=np.int64, count=topology.n_atoms)
+
+
 class AtomSlicedIndexer(object):
     """Indexer when using atom slicing.
+
+    The mappings between real (topology) atom indices, sliced atom indices,
+    and residue indices are stored as NumPy arrays, so that they can be
+    used for fancy indexing. Real atoms that are not in the slice map to a
+    sliced index of -1.
+
+    Attributes
+    ----------
+    block_size : int
+        number of frames that are sliced at a time by :meth:`.slice_blocks`
     """
+    block_size = 100
+
     def __init__(self, topology, real_query, real_haystack, all_atoms):
         self.all_atoms = all_atoms
-        self.sliced_idx = {
-            real_idx : sliced_idx
-            for sliced_idx, real_idx in enumerate(all_atoms)
-        }
-        self.real_idx = {
-            sliced_idx: real_idx
-            for real_idx, sliced_idx in self.sliced_idx.items()
-        }
-        self.query = set([self.sliced_idx[q] for q in real_query])
-        self.haystack = set([self.sliced_idx[h] for h in real_haystack])
+        self.real_idx = np.asarray(all_atoms, dtype=np.int64)
+        self.sliced_idx = np.full(topology.n_atoms, -1, dtype=np.int64)
+        self.sliced_idx[self.real_idx] = np.arange(len(self.real_idx))
+        self.query = set(self._to_sliced(real_query).tolist())
+        self.haystack = set(self._to_sliced(real_haystack).tolist())
 
         # atom_idx_to_residue_idx
-        self.real_atom_idx_to_residue_idx = {atom.index: atom.residue.index
-                                             for atom in topology.atoms}
-        self.atom_idx_to_residue_idx = {
-            sliced_idx: self.real_atom_idx_to_residue_idx[real_idx]
-            for sliced_idx, real_idx in enumerate(all_atoms)
-        }
+        self.real_atom_idx_to_residue_idx = _atom_residue_idxs(topology)
+        self.atom_idx_to_residue_idx = \
+                self.real_atom_idx_to_residue_idx[self.real_idx]
         self.residue_query_atom_idxs = residue_query_atom_idxs(
-            self.query, self.atom_idx_to_residue_idx
+            self.query, self.atom_idx_to_residue_idx.tolist()
         )
 
+    def _to_sliced(self, real_idxs):
+        return self.sliced_idx[np.fromiter(real_idxs, dtype=np.int64)]
+
     def ignore_atom_idx(self, atoms, all_atoms_set):
-        result = set(atom.index for atom in atoms)
-        result &= all_atoms_set
-        result = set(self.sliced_idx[a] for a in result)
-        return result
+        sliced = self._to_sliced(atom.index for atom in atoms)
+        return set(sliced[sliced >= 0].tolist())
 
     def convert_atom_contacts(self, atom_contacts):
-        result =  {frozenset(map(self.real_idx.__getitem__, pair)): value
-                   for pair, value in atom_contacts.items()}
-        return collections.Counter(result)
+        if not atom_contacts:
+            return collections.Counter()
+        sliced_pairs = np.array([tuple(pair) for pair in atom_contacts],
+                                dtype=np.int64)
+        real_pairs = self.real_idx[sliced_pairs].tolist()
+        return collections.Counter(dict(zip(map(frozenset, real_pairs),
+                                            atom_contacts.values())))
 
     def slice_trajectory(self, trajectory):
         # Prevent (memory) expensive atom slicing if not needed.
@@ -77,23 +119,66 @@ class AtomSlicedIndexer(object):
             sliced = trajectory
         return sliced
 
+    def slice_blocks(self, trajectory, frames=None):
+        """Iterate over blocks of frames, sliced to the used atoms.
+
+        Only one block is sliced at a time, so the extra memory needed is
+        bounded by ``block_size``, instead of by the length of the
+        trajectory. The sliced coordinates are written into a buffer that
+        is reused for every block, so each block must be used before the
+        next one is requested.
+
+        Parameters
+        ----------
+        trajectory : mdtraj.Trajectory
+            the (unsliced) trajectory
+        frames : slice
+            the frames to include; default ``None`` includes all frames
+
+        Yields
+        ------
+        block : slice
+            frames of ``trajectory`` in this block
+        sliced : mdtraj.Trajectory
+            those frames, with only the atoms used by this indexer
+        """
+        if frames is None:
+            frames = slice(0, len(trajectory))
+        if not len(self.all_atoms) < trajectory.topology.n_atoms:
+            # nothing to slice
+            for block, block_traj in _identity_blocks(trajectory, frames,
+                                                      self.block_size):
+                yield block, block_traj
+            return
+
+        indices = self.real_idx
+        topology = _sliced_topology(trajectory.topology, self.all_atoms)
+        n_buffer = min(self.block_size, frames.stop - frames.start)
+        buffer = np.empty((n_buffer, len(indices), 3),
+                          dtype=trajectory.xyz.dtype)
+        for block in _frame_blocks(frames, self.block_size):
+            block_traj = trajectory.slice(block, copy=False)
+            out = buffer[:len(block_traj)]
+            yield block, _atom_slice(block_traj, indices, topology, out)
+
 
 class IdentityIndexer(object):
     """Indexer when not using atom slicing.
     """
+    block_size = 100
+
     def __init__(self, topology, real_query, real_haystack, all_atoms):
         self.all_atoms = all_atoms
         self.topology = topology
-        identity_mapping = {a: a for a in range(topology.n_atoms)}
+        identity_mapping = np.arange(topology.n_atoms)
         self.sliced_idx = identity_mapping
         self.real_idx = identity_mapping
         self.query = set(real_query)
         self.haystack = set(real_haystack)
-        self.real_atom_idx_to_residue_idx = {atom.index: atom.residue.index
-                                             for atom in topology.atoms}
+        self.real_atom_idx_to_residue_idx = _atom_residue_idxs(topology)
         self.atom_idx_to_residue_idx = self.real_atom_idx_to_residue_idx
         self.residue_query_atom_idxs = residue_query_atom_idxs(
-            self.query, self.atom_idx_to_residue_idx
+            self.query, self.atom_idx_to_residue_idx.tolist()
         )
 
     def ignore_atom_idx(self, atoms, all_atoms_set):
@@ -104,3 +189,12 @@ class IdentityIndexer(object):
 
     def slice_trajectory(self, trajectory):
         return trajectory
+
+    def slice_blocks(self, trajectory, frames=None):
+        """Iterate over blocks of frames; see
+        :meth:`.AtomSlicedIndexer.slice_blocks`. No atoms are sliced, so
+        the blocks are views on the trajectory.
+        """
+        if frames is None:
+            frames = slice(0, len(trajectory))
+        return _identity_blocks(trajectory, frames, self.block_size)
@@ -0,0 +1,97 @@
+"""
+Counting contacts in blocks of frames.
+
+The trajectory is analyzed one block of frames at a time (see the
+indexers' ``slice_blocks``). Within a block, the frames can be split
+between threads, each of which counts the contacts in its frames. The
+counts for each block can be checkpointed, and are merged at the end.
+"""
+
+import collections
+import concurrent.futures
+import contextlib
+import functools
+
+import numpy as np
+
+from .counters import (_join_frame_contacts, _serialize_contact_counter,
+                       _deserialize_contact_counter,
+                       _serialize_frame_contacts, _deserialize_frame_contacts)
+
+
+def thread_pool(n_threads):
+    """Thread pool for the frames, or a null context for one thread"""
+    if n_threads > 1:
+        return concurrent.futures.ThreadPoolExecutor(n_threads)
+    return contextlib.nullcontext()
+
+
+def frame_chunk_results(pool, func, sliced, n_threads):
+    """Results of ``func(sliced, frame_numbers)`` for consecutive chunks of
+    the frames in a block, in order.
+
+    With a thread pool, each thread gets one chunk of frames, and the
+    results (e.g., per-thread counters) are merged by the caller.
+    """
+    if pool is None:
+        return [func(sliced, range(len(sliced)))]
+    chunks = [chunk for chunk
+              in np.array_split(np.arange(len(sliced)), n_threads)
+              if len(chunk)]
+    return list(pool.map(functools.partial(func, sliced), chunks))
+
+
+def serialize_block(atom_contacts, residue_contacts, frame_contacts=None):
+    """Checkpoint representation of the counts from a block of frames"""
+    return {
+        'atom_contacts': _serialize_contact_counter(atom_contacts),
+        'residue_contacts': _serialize_contact_counter(residue_contacts),
+        'frame_contacts': _serialize_frame_contacts(frame_contacts)
+    }
+
+
+def sum_blocks(blocks):
+    """Total counts from checkpoint representations of blocks"""
+    return merge_counts(
+        (_deserialize_contact_counter(block['atom_contacts']),
+         _deserialize_contact_counter(block['residue_contacts']),
+         _deserialize_frame_contacts(block.get('frame_contacts')))
+        for block in blocks
+    )
+
+
+def merge_counts(counts):
+    """Total counts from the counts for consecutive blocks of frames.
+
+    Parameters
+    ----------
+    counts : iterable of tuple
+        (atom_contacts, residue_contacts, frame_contacts) for each block, as
+        returned by :meth:`.ContactFrequency._count_contacts`; consumed one
+        block at a time, so this can be a generator
+
+    Returns
+    -------
+    tuple :
+        (atom_contacts, residue_contacts, frame_contacts) for all the blocks
+    """
+    atom_contacts = collections.Counter()
+    residue_contacts = collections.Counter()
+    frame_contacts = []
+
+    def update(total, counter):
+        if total is None or counter is None:
+            return None  # level not computed
+        total.update(counter)
+        return total
+
+    for (block_atoms, block_residues, block_frames) in counts:
+        atom_contacts = update(atom_contacts, block_atoms)
+        residue_contacts = update(residue_contacts, block_residues)
+        frame_contacts.append(block_frames)
+
+    if frame_contacts and all(f is not None for f in frame_contacts):
+        frame_contacts = _join_frame_contacts(frame_contacts)
+    else:
+        frame_contacts = None
+    return (atom_contacts, residue_contacts, frame_contacts)
@@ -0,0 +1,162 @@
+"""
+On-disk cache for the results of contact calculations.
+
+Results are stored as one pickle file per calculation, named by a hash of
+everything that determines the result (the input coordinates or file, the
+topology, and the parameters of the calculation). The cache is opt-in: pass
+a :class:`.ContactCache` as the ``cache`` parameter of the objects that
+support it.
+
+Files are written to a temporary name and then atomically renamed, so
+readers (including other processes on a shared filesystem) never see a
+partially-written result. The total size of the cache is bounded by evicting
+the least recently used results.
+"""
+
+import os
+import pickle
+import tempfile
+import warnings
+
+
+class ContactCache(object):
+    """Size-bounded on-disk cache of contact results.
+
+    Parameters
+    ----------
+    directory : str
+        directory to store the cached results in; created if it does not
+        exist
+    max_size : int
+        maximum total size of the cached results, in bytes. When this is
+        exceeded, the least recently used results are removed. Default is
+        1 GiB.
+    """
+    _suffix = ".pkl"
+
+    def __init__(self, directory, max_size=2**30):
+        self.directory = directory
+        self.max_size = max_size
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self._suffix)
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        """Load a cached result.
+
+        Parameters
+        ----------
+        key : str
+            identifier for the result
+
+        Returns
+        -------
+        object or None :
+            the cached result, or None if it is not in the cache
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # missing, or removed by another process while we read it
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:  # pragma: no cover
+            pass
+        return result
+
+    def put(self, key, result):
+        """Store a result in the cache.
+
+        Parameters
+        ----------
+        key : str
+            identifier for the result
+        result : object
+            picklable result to store. Results larger than ``max_size``
+            are not stored (with a warning), since they would evict
+            everything else and then themselves.
+        """
+        handle, tmp_path = tempfile.mkstemp(dir=self.directory,
+                                            suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+                size = f.tell()
+            if size > self.max_size:
+                warnings.warn("Result of " + str(size) + " bytes is larger "
+                              "than the cache (max_size="
+                              + str(self.max_size) + "); not cached.")
+                os.remove(tmp_path)
+                return
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self._evict()
+
+    def get_or_compute(self, key, compute):
+        """Load a cached result, or compute and cache it if missing.
+
+        Parameters
+        ----------
+        key : str
+            identifier for the result
+        compute : callable
+            function with no arguments that calculates the result
+
+        Returns
+        -------
+        object :
+            the (possibly cached) result
+        """
+        result = self.get(key)
+        if result is None:
+            result = compute()
+            self.put(key, result)
+        return result
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(self._suffix):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    @property
+    def size(self):
+        """int : total size of the cached results, in bytes"""
+        return sum(size for (_, size, _) in self._entries())
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for (_, size, _) in entries)
+        for (_, size, path) in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # already removed by another process
+                pass
+            total -= size
+
+    def clear(self):
+        """Remove all results from the cache"""
+        for (_, _, path) in self._entries():
+            try:
+                os.remove(path)
+            except OSError:  # pragma: no cover
+                pass
@@ -0,0 +1,313 @@
+"""
+Checkpointing for long-running contact calculations.
+
+A checkpoint file stores partial results for blocks of frames, so that an
+interrupted calculation can be restarted without redoing the blocks that
+have already been completed. Each record in the file is labelled with a key
+that identifies the input (trajectory or file) and the parameters of the
+calculation, so several different calculations can share a single file.
+
+The file is written as JSON lines: one record per completed block. Records
+are only ever appended, so a calculation that is killed while writing can at
+worst leave a truncated final line, which is ignored on reading.
+"""
+
+import os
+import json
+import hashlib
+
+
+def fingerprint(*parts):
+    """Hash JSON-serializable parts into a hex digest.
+
+    Parameters
+    ----------
+    parts :
+        JSON-serializable objects that together identify something
+
+    Returns
+    -------
+    str :
+        hex digest identifying the input
+    """
+    serialized = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
+def trajectory_fingerprint(trajectory):
+    """Identity of an in-memory trajectory, based on its coordinates.
+
+    Parameters
+    ----------
+    trajectory : mdtraj.Trajectory
+        the trajectory to identify
+
+    Returns
+    -------
+    str :
+        hex digest of the coordinates and box of the trajectory
+    """
+    sha = hashlib.sha1()
+    sha.update(str(trajectory.xyz.shape).encode('utf-8'))
+    # hashlib reads the buffer directly; no copy of the coordinates is made
+    # unless the array isn't contiguous
+    for arr in [trajectory.xyz, trajectory.unitcell_vectors]:
+        if arr is not None:
+            sha.update(memoryview(arr.ravel()).cast('B'))
+    return sha.hexdigest()
+
+
+def file_fingerprint(filename, growing=False, **kwargs):
+    """Identity of a trajectory file, based on path, size, and mtime.
+
+    Parameters
+    ----------
+    filename : str
+        the trajectory file
+    growing : bool
+        if True, the file is expected to have frames appended, so only the
+        path identifies it (size and mtime are not used). Default False.
+    kwargs :
+        additional parameters used when loading the file (e.g., ``top``)
+
+    Returns
+    -------
+    str :
+        hex digest identifying the file
+    """
+    if growing:
+        return fingerprint(os.path.abspath(filename), 'growing', kwargs)
+    stat = os.stat(filename)
+    return fingerprint(os.path.abspath(filename), stat.st_size,
+                       stat.st_mtime, kwargs)
+
+
+class ContactCheckpoint(object):
+    """Checkpoint file for partial results of a contact calculation.
+
+    Parameters
+    ----------
+    filename : str
+        name of the checkpoint file; created if it does not exist
+    interval : int
+        number of frames to calculate between writing checkpoints
+    """
+    def __init__(self, filename, interval=1000):
+        self.filename = filename
+        self.interval = interval
+        # key -> {(start, stop): file offset of the record}; payloads are
+        # only read from the file when the results are needed
+        self._index = {}
+        self._n_indexed = 0  # bytes of the file already in the index
+
+    def _update_index(self):
+        """Add any records appended to the file since the last update"""
+        if not os.path.exists(self.filename):
+            size = 0
+        else:
+            size = os.path.getsize(self.filename)
+        if size < self._n_indexed:
+            # file was replaced or truncated; start over
+            self._index = {}
+            self._n_indexed = 0
+        if size == self._n_indexed:
+            return
+
+        with open(self.filename, "rb") as f:
+            f.seek(self._n_indexed)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # write in progress (or interrupted); re-read next time
+                    break
+                offset = self._n_indexed
+                self._n_indexed += len(line)
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # truncated write from an interrupted run
+                    continue
+                blocks = self._index.setdefault(rec['key'], {})
+                blocks[(rec['start'], rec['stop'])] = offset
+
+    def _blocks(self, key):
+        """Sorted ``(start, stop)`` of the completed blocks for ``key``"""
+        self._update_index()
+        return sorted(self._index.get(key, {}))
+
+    def _payloads(self, key, blocks):
+        """Stored results for the given completed blocks of ``key``"""
+        if not blocks:
+            return []
+        offsets = self._index[key]
+        payloads = []
+        with open(self.filename, "rb") as f:
+            for block in blocks:
+                f.seek(offsets[block])
+                payloads.append(json.loads(f.readline())['payload'])
+        return payloads
+
+    def completed(self, key):
+        """Completed blocks for a given calculation.
+
+        Parameters
+        ----------
+        key : str
+            identifier for the calculation
+
+        Returns
+        -------
+        dict :
+            maps ``(start, stop)`` frame ranges to the stored results
+        """
+        blocks = self._blocks(key)
+        return dict(zip(blocks, self._payloads(key, blocks)))
+
+    def record(self, key, block, payload):
+        """Append the results for a completed block to the file.
+
+        Parameters
+        ----------
+        key : str
+            identifier for the calculation
+        block : slice
+            the frames that these results cover
+        payload : dict
+            JSON-serializable results for the block
+        """
+        self._update_index()
+        line = json.dumps({'key': key, 'start': block.start,
+                           'stop': block.stop, 'payload': payload})
+        data = (line + "\n").encode('utf-8')
+        with open(self.filename, "a+b") as f:
+            offset = f.seek(0, os.SEEK_END)
+            complete = True
+            if offset:
+                f.seek(offset - 1)
+                complete = f.read(1) == b"\n"
+            if not complete:
+                # end an interrupted record, so this one isn't lost with it
+                f.write(b"\n")
+                offset += 1
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if offset == self._n_indexed:
+            # nothing else was appended in between; index it directly
+            blocks = self._index.setdefault(key, {})
+            blocks[(block.start, block.stop)] = offset
+            self._n_indexed += len(data)
+
+    def completed_frames(self, key):
+        """Number of frames completed without gaps from the first frame.
+
+        Parameters
+        ----------
+        key : str
+            identifier for the calculation
+
+        Returns
+        -------
+        int :
+            all frames before this one have been completed
+        """
+        n_frames = 0
+        for (done_start, done_stop) in self._blocks(key):
+            if done_start > n_frames:
+                break
+            n_frames = max(n_frames, done_stop)
+        return n_frames
+
+    def missing_slices(self, key, n_total, start=0):
+        """Blocks of frames that have not been completed yet.
+
+        Parameters
+        ----------
+        key : str
+            identifier for the calculation
+        n_total : int
+            total number of frames in the calculation
+        start : int
+            only consider frames from this one on; default 0
+
+        Returns
+        -------
+        list of slice :
+            blocks of at most ``interval`` frames that still need to be
+            calculated
+        """
+        gaps = []
+        for (done_start, done_stop) in self._blocks(key):
+            if done_start >= n_total:
+                break
+            if done_start > start:
+                gaps.append((start, done_start))
+            start = max(start, done_stop)
+        if start < n_total:
+            gaps.append((start, n_total))
+
+        slices = []
+        for (gap_start, gap_stop) in gaps:
+            slices.extend(
+                slice(i, min(i + self.interval, gap_stop))
+                for i in range(gap_start, gap_stop, self.interval)
+            )
+        return slices
+
+    def results(self, key, n_total):
+        """Stored results for a calculation, ordered by frame.
+
+        Parameters
+        ----------
+        key : str
+            identifier for the calculation
+        n_total : int
+            total number of frames in the calculation
+
+        Returns
+        -------
+        list :
+            results for all completed blocks, ordered by frame
+
+        Raises
+        ------
+        RuntimeError :
+            if completed blocks overlap, so some frames would be counted
+            twice, or if a completed block runs past ``n_total``, so its
+            results include frames that are not in the calculation
+        """
+        blocks = [block for block in self._blocks(key)
+                  if block[0] < n_total]
+        for block in blocks:
+            if block[1] > n_total:
+                raise RuntimeError("Checkpoint block " + str(block)
+                                   + " for key " + str(key)
+                                   + " runs past the last frame ("
+                                   + str(n_total) + ")")
+        for (previous, block) in zip(blocks, blocks[1:]):
+            if block[0] < previous[1]:
+                raise RuntimeError("Overlapping checkpoint blocks for key "
+                                   + str(key) + ": " + str(previous)
+                                   + " and " + str(block))
+        return self._payloads(key, blocks)
+
+    def run(self, key, n_total, compute):
+        """Calculate all unfinished blocks, checkpointing after each.
+
+        Parameters
+        ----------
+        key : str
+            identifier for the calculation
+        n_total : int
+            total number of frames in the calculation
+        compute : callable
+            takes a slice of frames and returns the JSON-serializable
+            results for those frames
+
+        Returns
+        -------
+        list :
+            results for all blocks, ordered by frame
+        """
+        for block in self.missing_slices(key, n_total):
+            self.record(key, block, compute(block))
+        return self.results(key, n_total)
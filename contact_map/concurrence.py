@@ -1,9 +1,11 @@
-import itertools
 import mdtraj as md
 import numpy as np
 
 import contact_map
 from .contact_map import ContactObject
+from .checkpoint import fingerprint, trajectory_fingerprint
+from .lifetimes import ContactLifetimes
+from .topology import topology_fingerprint
 
 try:
     import matplotlib.pyplot as plt
@@ -12,6 +14,9 @@ except ImportError:
 else:
     HAS_MATPLOTLIB = True
 
+# float32 sums of 0/1 products are exact up to this many frames per chunk
+_MAX_CHUNK_FRAMES = 2**24
+
 
 class Concurrence(object):
     """Superclass for contact concurrence objects.
@@ -21,22 +26,90 @@ class Concurrence(object):
     based on multiple contacts that are made simultaneously; contact
     concurrences makes it easier to identify those.
 
+    The values are stored as bits (8 frames per byte, with
+    :func:`numpy.packbits`); :attr:`.array` and :attr:`.values` unpack
+    them when needed.
+
     Parameters
     ----------
-        values : list of list of bool
+        values : list of list of bool or np.array
             the whether a contact is present for each contact pair at each
             point in time; inner list is length number of frames, outer list
             in length number of (included) contacts
         labels : list of string
             labels for each contact pair
+        n_frames : int
+            if given, ``values`` is a uint8 array that is already packed
+            along the frame axis, for this number of frames
     """
-    def __init__(self, values, labels=None):
-        self.values = values
+    def __init__(self, values, labels=None, n_frames=None):
+        self._set_values(values, n_frames)
         self.labels = labels
 
-    # @property
-    # def lifetimes(self):
-        # pass
+    def _set_values(self, values, n_frames=None):
+        if n_frames is None:
+            values = np.asarray(values, dtype=bool)
+            if values.ndim != 2:
+                # no contacts
+                values = values.reshape(len(values), 0)
+            n_frames = values.shape[1]
+            values = np.packbits(values, axis=1)
+        self._packed = np.asarray(values, dtype=np.uint8).reshape(
+            len(values), (n_frames + 7) // 8
+        )
+        self._n_frames = n_frames
+
+    @property
+    def lifetimes(self):
+        """:class:`.ContactLifetimes` : lifetime statistics for the
+        contacts"""
+        return ContactLifetimes.from_concurrence(self)
+
+    @property
+    def n_frames(self):
+        """int : number of frames"""
+        return self._n_frames
+
+    @property
+    def n_contacts(self):
+        """int : number of contacts"""
+        return len(self._packed)
+
+    @property
+    def array(self):
+        """np.array : boolean array of whether each contact (row) is
+        present in each frame (column)"""
+        return self._unpack(self._packed)
+
+    @property
+    def values(self):
+        """list of list of bool : whether each contact is present in each
+        frame; calculated from the stored bits each time it is accessed
+        """
+        return self.array.tolist()
+
+    @values.setter
+    def values(self, values):
+        self._set_values(values)
+
+    def _unpack(self, packed):
+        return np.unpackbits(packed, axis=-1,
+                             count=self._n_frames).astype(bool)
+
+    def _row(self, idx):
+        """Boolean values for one contact"""
+        return self._unpack(self._packed[idx])
+
+    def runs(self):
+        """Consecutive frames in which each contact is present.
+
+        Returns
+        -------
+        list of 2-tuple of np.array :
+            for each contact, the first frame of each run of frames with the
+            contact, and the frame after the last frame of the run
+        """
+        return [_true_runs(self._row(idx)) for idx in range(self.n_contacts)]
 
     def set_labels(self, labels):
         """Set the contact labels
@@ -50,21 +123,78 @@ class Concurrence(object):
 
     def __getitem__(self, label):
         idx = self.labels.index(label)
-        return self.values[idx]
-
-    # temporarily removed until we find a good metric here; this metric did
-    # not seem optimal and I stopped using it, so remove from code before
-    # release (can add back in later)
-    # def coincidence(self, label_list):
-        # this_list = np.asarray(self[label_list[0]])
-        # coincidence_list = this_list
-        # norm_sq = sum(this_list)
-        # for label in label_list[1:]:
-            # this_list = np.asarray(self[label])
-            # coincidence_list &= this_list
-            # norm_sq *= sum(this_list)
-
-        # return sum(coincidence_list) / np.sqrt(norm_sq)
+        return self._row(idx).tolist()
+
+    def cooccurrence(self, chunk_size=2**16):
+        """Number of frames in which each pair of contacts is present.
+
+        This is calculated with a matrix product of the (unpacked) values,
+        ``chunk_size`` frames at a time.
+
+        Parameters
+        ----------
+        chunk_size : int
+            number of frames unpacked at a time; rounded up to a multiple
+            of 8, and at most ``2**24`` (the counts for each chunk are
+            exact in single precision up to that). Default 65536.
+
+        Returns
+        -------
+        np.array :
+            (n_contacts, n_contacts) integer array; element ``[i, j]`` is
+            the number of frames with both contact ``i`` and contact ``j``,
+            so the diagonal is the number of frames with each contact
+        """
+        if chunk_size < 1:
+            raise RuntimeError("Bad value for chunk_size: "
+                               + str(chunk_size) + ". Must be positive.")
+        n_chunk_bytes = -(-min(chunk_size, _MAX_CHUNK_FRAMES) // 8)
+        n_bytes = self._packed.shape[1]
+        counts = np.zeros((self.n_contacts, self.n_contacts), dtype=np.int64)
+        for start in range(0, n_bytes, n_chunk_bytes):
+            # padding bits are zero, so they don't add to the counts
+            block = np.unpackbits(self._packed[:, start:start + n_chunk_bytes],
+                                  axis=1).astype(np.float32)
+            counts += np.rint(block @ block.T).astype(np.int64)
+        return counts
+
+    def conditional_probabilities(self, chunk_size=2**16):
+        """Probability of each contact, given that another is present.
+
+        Parameters
+        ----------
+        chunk_size : int
+            number of frames unpacked at a time; see :meth:`.cooccurrence`
+
+        Returns
+        -------
+        np.array :
+            (n_contacts, n_contacts) array; element ``[i, j]`` is the
+            fraction of the frames with contact ``i`` that also have contact
+            ``j``. Rows for contacts that are never present are NaN.
+        """
+        counts = self.cooccurrence(chunk_size)
+        n_present = np.diag(counts).astype(float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return counts / n_present[:, np.newaxis]
+
+
+def _true_runs(row):
+    """Start and stop (exclusive) of each run of True values in a boolean
+    array"""
+    padded = np.concatenate([[False], row, [False]])
+    changes = np.flatnonzero(padded[1:] != padded[:-1])
+    return changes[::2], changes[1::2]
+
+
+def _merge_runs(starts, stops, min_gap):
+    """Merge runs that are separated by fewer than ``min_gap`` frames"""
+    if len(starts) == 0:
+        return starts, stops
+    keep_gap = starts[1:] - stops[:-1] >= min_gap
+    return (starts[np.concatenate([[True], keep_gap])],
+            stops[np.concatenate([keep_gap, [True]])])
+
 
 def _regularize_contact_input(contact_input, atom_or_res):
     """Clean input for concurrence objects.
@@ -97,6 +227,55 @@ def _regularize_contact_input(contact_input, atom_or_res):
     return contact_input
 
 
+def _cached_values(cache, kind, trajectory, pairs, compute, *parameters):
+    """Load concurrence values from ``cache``, or calculate them"""
+    if cache is None:
+        return compute()
+    key = fingerprint(kind, trajectory_fingerprint(trajectory),
+                      topology_fingerprint(trajectory.topology),
+                      pairs, *parameters)
+    return cache.get_or_compute(key, compute)
+
+
+def _concurrence_bits(trajectory, atom_pairs, in_contact, n_contacts,
+                      chunk_size=2**24):
+    """Packed concurrence values, calculated a block of frames at a time.
+
+    Parameters
+    ----------
+    trajectory : :class:`mdtraj.Trajectory`
+        the trajectory to analyze
+    atom_pairs : np.array
+        (n_pairs, 2) atom pairs to measure
+    in_contact : callable
+        takes the (n_block_frames, n_pairs) distances for a block of frames
+        and returns the (n_contacts, n_block_frames) boolean values
+    n_contacts : int
+        number of contacts
+    chunk_size : int
+        maximum number of distances calculated at once (frames times atom
+        pairs); this bounds the memory used
+
+    Returns
+    -------
+    np.array :
+        values packed with :func:`numpy.packbits` along the frame axis,
+        shape (n_contacts, ceil(n_frames / 8))
+    """
+    # blocks are a multiple of 8 frames, so the packed blocks can be joined
+    n_block_frames = max(1, chunk_size // max(1, len(atom_pairs)))
+    n_block_frames = 8 * max(1, n_block_frames // 8)
+    blocks = [np.zeros((n_contacts, 0), dtype=np.uint8)]
+    for start in range(0, len(trajectory), n_block_frames):
+        block = trajectory[start:start + n_block_frames]
+        if len(atom_pairs) > 0:
+            distances = md.compute_distances(block, atom_pairs)
+        else:
+            distances = np.zeros((len(block), 0), dtype=np.float32)
+        blocks.append(np.packbits(in_contact(distances), axis=1))
+    return np.concatenate(blocks, axis=1)
+
+
 class AtomContactConcurrence(Concurrence):
     """Contact concurrences for atom contacts.
 
@@ -108,19 +287,95 @@ class AtomContactConcurrence(Concurrence):
         output from ``contact_map.atom_contacts.most_common()``
     cutoff : float
         cutoff, in nm. Should be the same as used in the contact map.
+    cache : :class:`.ContactCache`
+        if given, the values are loaded from this cache if they have already
+        been calculated, and stored in it otherwise
     """
-    def __init__(self, trajectory, atom_contacts, cutoff=0.45):
+    def __init__(self, trajectory, atom_contacts, cutoff=0.45, cache=None):
         atom_contacts = _regularize_contact_input(atom_contacts, "atom")
         atom_pairs = [[contact[0][0].index, contact[0][1].index]
                       for contact in atom_contacts]
         labels = [str(contact[0]) for contact in atom_contacts]
-        distances = md.compute_distances(trajectory, atom_pairs=atom_pairs)
-        vector_f = np.vectorize(lambda d: d < cutoff)
-        # transpose because distances is ndarray shape (n_frames,
-        # n_contacts); values should be list shape (n_contacts, n_frames)
-        values = vector_f(distances).T.tolist()
-        super(AtomContactConcurrence, self).__init__(values=values,
-                                                     labels=labels)
+
+        def compute():
+            # transpose because distances is ndarray shape (n_frames,
+            # n_contacts); values have shape (n_contacts, n_frames)
+            return _concurrence_bits(
+                trajectory, np.array(atom_pairs, dtype=int).reshape(-1, 2),
+                lambda distances: (distances < cutoff).T, len(atom_pairs)
+            )
+
+        packed = _cached_values(cache, 'atom_concurrence_bits', trajectory,
+                                atom_pairs, compute, cutoff)
+        super(AtomContactConcurrence, self).__init__(
+            values=packed, labels=labels, n_frames=len(trajectory)
+        )
+
+
+def _residue_concurrence_bits(trajectory, residue_pairs, cutoff, select,
+                              chunk_size=2**24):
+    """Whether each residue pair is in contact in each frame.
+
+    The atom pairs for all residue pairs are measured together, a block of
+    frames at a time, and the minimum distance for each residue pair is
+    taken with :func:`numpy.minimum.reduceat`.
+
+    Parameters
+    ----------
+    trajectory : :class:`mdtraj.Trajectory`
+        the trajectory to analyze
+    residue_pairs : list of 2-tuple
+        the pairs of :class:`mdtraj.core.topology.Residue` objects
+    cutoff : float
+        cutoff, in nm
+    select : string
+        additional atom selection string for MDTraj
+    chunk_size : int
+        maximum number of distances calculated at once (frames times atom
+        pairs); this bounds the memory used
+
+    Returns
+    -------
+    np.array :
+        values packed along the frame axis; see :func:`._concurrence_bits`
+    """
+    topology = trajectory.topology
+    selected = np.zeros(topology.n_atoms, dtype=bool)
+    selected[np.asarray(topology.select(("all " + select).strip()),
+                        dtype=int)] = True
+    residue_atoms = {}
+
+    def atoms_for(residue):
+        if residue.index not in residue_atoms:
+            residue_atoms[residue.index] = np.array(
+                [atom.index for atom in residue.atoms
+                 if selected[atom.index]], dtype=int
+            )
+        return residue_atoms[residue.index]
+
+    atom_pairs = [np.zeros((0, 2), dtype=int)]
+    for res_A, res_B in residue_pairs:
+        atoms_A, atoms_B = atoms_for(res_A), atoms_for(res_B)
+        atom_pairs.append(np.column_stack([
+            np.repeat(atoms_A, len(atoms_B)),
+            np.tile(atoms_B, len(atoms_A))
+        ]))
+
+    n_pairs = np.array([len(pairs) for pairs in atom_pairs[1:]], dtype=int)
+    atom_pairs = np.concatenate(atom_pairs)
+    # residue pairs without any selected atom pairs are never in contact
+    has_pairs = n_pairs > 0
+    starts = (np.cumsum(n_pairs) - n_pairs)[has_pairs]
+
+    def in_contact(distances):
+        values = np.zeros((len(residue_pairs), len(distances)), dtype=bool)
+        if has_pairs.any():
+            min_distances = np.minimum.reduceat(distances, starts, axis=1)
+            values[has_pairs] = (min_distances < cutoff).T
+        return values
+
+    return _concurrence_bits(trajectory, atom_pairs, in_contact,
+                             len(residue_pairs), chunk_size)
 
 
 class ResidueContactConcurrence(Concurrence):
@@ -137,29 +392,28 @@ class ResidueContactConcurrence(Concurrence):
     select : string
         additional atom selection string for MDTraj; defaults to "and symbol
         != 'H'"
+    cache : :class:`.ContactCache`
+        if given, the values are loaded from this cache if they have already
+        been calculated, and stored in it otherwise
     """
     def __init__(self, trajectory, residue_contacts, cutoff=0.45,
-                 select="and symbol != 'H'"):
+                 select="and symbol != 'H'", cache=None):
         residue_contacts = _regularize_contact_input(residue_contacts,
                                                      "residue")
         residue_pairs = [[contact[0][0], contact[0][1]]
                          for contact in residue_contacts]
         labels = [str(contact[0]) for contact in residue_contacts]
-        values = []
-        select_residue = lambda idx: trajectory.topology.select(
-            "resid " + str(idx) + " " + select
-        )
-        for res_A, res_B in residue_pairs:
-            atoms_A = select_residue(res_A.index)
-            atoms_B = select_residue(res_B.index)
-            atom_pairs = itertools.product(atoms_A, atoms_B)
-            distances = md.compute_distances(trajectory,
-                                             atom_pairs=atom_pairs)
-            min_dists = [min(dists) for dists in distances]
-            values.append([d < cutoff for d in min_dists])
 
-        super(ResidueContactConcurrence, self).__init__(values=values,
-                                                        labels=labels)
+        def compute():
+            return _residue_concurrence_bits(trajectory, residue_pairs,
+                                             cutoff, select)
+
+        pairs = [[res_A.index, res_B.index] for res_A, res_B in residue_pairs]
+        packed = _cached_values(cache, 'residue_concurrence_bits',
+                                trajectory, pairs, compute, cutoff, select)
+        super(ResidueContactConcurrence, self).__init__(
+            values=packed, labels=labels, n_frames=len(trajectory)
+        )
 
 
 class ConcurrencePlotter(object):
@@ -208,7 +462,7 @@ class ConcurrencePlotter(object):
             if concurrence and concurrence.labels is not None:
                 labels = concurrence.labels
             else:
-                labels = [str(i) for i in range(len(concurrence.values))]
+                labels = [str(i) for i in range(concurrence.n_contacts)]
         return labels
 
     @property
@@ -216,24 +470,37 @@ class ConcurrencePlotter(object):
         """list : values to use for the x-axis (time)"""
         x_values = self._x_values
         if x_values is None:
-            x_values = list(range(len(self.concurrence.values[0])))
+            x_values = list(range(self.concurrence.n_frames))
         return x_values
 
     @x_values.setter
     def x_values(self, x_values):
         self._x_values = x_values
 
-    def plot(self, concurrence=None, **kwargs):
+    def plot(self, concurrence=None, style="markers", decimate=False,
+             **kwargs):
         """Contact concurrence plot based on matplotlib
 
         Additional kwargs given here will be passed to the matplotlib
-        ``Axes.plot()`` method.
+        ``Axes.plot()`` method (for ``style="markers"``) or
+        ``Axes.broken_barh()`` method (for ``style="segments"``).
 
         Parameters
         ----------
         concurrence : :class:`.Concurrence`
             optional; default None uses ``self.concurrence``; this allows
             one to override the use of ``self.concurrence``
+        style : string
+            ``"markers"`` (default) draws a marker for each frame with the
+            contact; ``"segments"`` draws a bar for each run of consecutive
+            frames with the contact, which is much faster for long
+            trajectories (the time depends on the number of times contacts
+            form and break, not on the number of frames)
+        decimate : bool or int
+            only for ``style="segments"``: if True, runs separated by gaps
+            shorter than one pixel of the axes are drawn as a single bar;
+            an integer gives the number of pixels to use instead of the
+            width of the axes. Default False.
 
         Returns
         -------
@@ -244,6 +511,9 @@ class ConcurrencePlotter(object):
         """
         if not HAS_MATPLOTLIB:  # pragma: no cover
             raise ImportError("matplotlib not installed")
+        if style not in ("markers", "segments"):
+            raise RuntimeError("Bad value for style: " + str(style)
+                               + ". Use 'markers' or 'segments'.")
         if concurrence is None:
             concurrence = self.concurrence
         labels = self.get_concurrence_labels(concurrence=concurrence)
@@ -252,29 +522,74 @@ class ConcurrencePlotter(object):
         fig = plt.figure(1)
         ax = fig.add_subplot(111)
 
+        if style == "markers":
+            self._plot_markers(ax, concurrence, labels, x_values, **kwargs)
+        else:
+            self._plot_segments(ax, concurrence, labels, x_values,
+                                decimate, **kwargs)
+
+        ax.set_ylim(top=0.0)
+        if len(x_values):
+            ax.set_xlim(left=min(x_values), right=max(x_values))
+        ax.set_yticks([])
+        lgd = ax.legend(bbox_to_anchor=(1.05, 1), loc=2, borderaxespad=0.)
+        return (fig, ax, lgd)
+
+    @staticmethod
+    def _plot_markers(ax, concurrence, labels, x_values, **kwargs):
+        """One marker per frame with the contact"""
         plot_kwargs = {'markersize': 1}
         plot_kwargs.update(kwargs)
 
         y_val = -1.0
-        for label, val_set in zip(labels, concurrence.values):
-            x_vals = [x for (x, y) in zip(x_values, val_set) if y]
+        x_array = np.asarray(x_values)
+        for idx, label in enumerate(labels):
+            x_vals = x_array[concurrence._row(idx)]
             ax.plot(x_vals, [y_val] * len(x_vals), '.', label=label,
                     **plot_kwargs)
             y_val -= 1.0
 
-        ax.set_ylim(top=0.0)
-        ax.set_xlim(left=min(x_values), right=max(x_values))
-        ax.set_yticks([])
-        lgd = ax.legend(bbox_to_anchor=(1.05, 1), loc=2, borderaxespad=0.)
-        return (fig, ax, lgd)
+    @staticmethod
+    def _plot_segments(ax, concurrence, labels, x_values, decimate,
+                       **kwargs):
+        """One bar per run of frames with the contact"""
+        x_array = np.asarray(x_values, dtype=float)
+        # each frame extends to the next x value
+        frame_width = np.median(np.diff(x_array)) if len(x_array) > 1 else 1
+        last = x_array[-1] if len(x_array) else 0.0
+        x_edges = np.append(x_array, last + frame_width)
+
+        min_gap = 0
+        if decimate:
+            n_pixels = (ax.get_window_extent().width if decimate is True
+                        else decimate)
+            min_gap = len(x_array) / max(n_pixels, 1)
+
+        colors = plt.rcParams['axes.prop_cycle'].by_key().get('color', [])
+        y_val = -1.0
+        for idx, label in enumerate(labels):
+            starts, stops = _true_runs(concurrence._row(idx))
+            if min_gap > 1:
+                starts, stops = _merge_runs(starts, stops, min_gap)
+            bar_kwargs = {}
+            if colors and 'color' not in kwargs \
+                    and 'facecolors' not in kwargs:
+                bar_kwargs['facecolors'] = colors[idx % len(colors)]
+            bar_kwargs.update(kwargs)
+            xranges = list(zip(x_edges[starts],
+                               x_edges[stops] - x_edges[starts]))
+            ax.broken_barh(xranges, (y_val - 0.4, 0.8), label=label,
+                           **bar_kwargs)
+            y_val -= 1.0
 
 
 def plot_concurrence(concurrence, labels=None, x_values=None, **kwargs):  # -no-cov-
     """
     Convenience function for concurrence plots.
 
-    Additional kwargs given here will be passed to the matplotlib
-    ``Axes.plot()`` method.
+    Additional kwargs given here will be passed to
+    :meth:`.ConcurrencePlotter.plot` (such as ``style`` and ``decimate``),
+    and from there to matplotlib.
 
     Parameters
     ----------
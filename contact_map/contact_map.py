@@ -5,6 +5,7 @@ Contact map analysis.
 # Licensed under LGPL, version 2.1 or greater
 import collections
 import itertools
+import operator
 import pickle
 import json
 
@@ -15,9 +16,24 @@ import pandas as pd
 import mdtraj as md
 
 from .contact_count import ContactCount
-from .atom_indexer import AtomSlicedIndexer, IdentityIndexer
 from .py_2_3 import inspect_method_arguments
 from .fix_parameters import ParameterFixer
+from .checkpoint import fingerprint, trajectory_fingerprint
+from .context import get_context, memoized_fingerprint, _NeighborExclusion
+from .context import _sliced_selections
+from .neighbor_search import ResidueSpheres, box_lengths, is_orthorhombic
+from .engines import frame_box, get_engine
+from .counters import (_pair_keys, _pairs_from_keys, _keys_from_counter,
+                       _join_frame_contacts, _counter_items,
+                       _combine_counters, _serialize_contact_counter,
+                       _deserialize_contact_counter,
+                       _serialize_frame_contacts, _deserialize_frame_contacts)
+from .blocks import (thread_pool, frame_chunk_results, serialize_block,
+                     sum_blocks)
+from .options import ExecutionOptions
+from .frequency_ops import (frequencies_for_cutoffs, extend_frequency,
+                            frequency_with_neighbors_ignored,
+                            subset_frequency)
 
 # TODO:
 # * switch to something where you can define the haystack -- the trick is to
@@ -63,10 +79,6 @@ def _residue_for_atom(topology, atom_list):
     return set([topology.atom(a).residue for a in atom_list])
 
 
-def _residue_idx_for_atom(topology, atom_list):
-    return set([topology.atom(a).residue.index for a in atom_list])
-
-
 def _range_from_object_list(object_list):
     """
     Objects must have .index attribute (e.g., MDTraj Residue/Atom)
@@ -75,6 +87,20 @@ def _range_from_object_list(object_list):
     return (min(idxs), max(idxs) + 1)
 
 
+_CONTACT_LEVELS = ('atom', 'residue')
+
+
+def _contact_levels(contacts):
+    """Tuple of the contact levels (atom/residue) to compute"""
+    if isinstance(contacts, str):
+        contacts = (contacts,)
+    levels = tuple(level for level in _CONTACT_LEVELS if level in contacts)
+    if not levels or set(contacts) - set(levels):
+        raise RuntimeError("Bad value for contacts: " + str(contacts)
+                           + "; must contain only 'atom' and 'residue'")
+    return levels
+
+
 class ContactsDict(object):
     """Dict-like object giving access to atom or residue contacts.
 
@@ -123,31 +149,28 @@ class ContactObject(object):
         # all inits required: no defaults for abstract class!
 
         self._topology = topology
-        if query is None:
-            query = topology.select("not water and symbol != 'H'")
-        if haystack is None:
-            haystack = topology.select("not water and symbol != 'H'")
+        # everything derived from the topology and selections is shared
+        # between objects with the same parameters
+        context = get_context(topology, query, haystack, n_neighbors_ignored,
+                              self._class_use_atom_slice)
+        self._context = context
 
         # make things private and accessible through read-only properties so
         # they don't get accidentally changed after analysis
         self._cutoff = cutoff
-        self._query = set(query)
-        self._haystack = set(haystack)
+        self._query = context.query
+        self._haystack = context.haystack
 
         # Make tuple for efficient lookupt
-        all_atoms_set = set(query).union(set(haystack))
-        self._all_atoms = tuple(sorted(list(all_atoms_set)))
-        self._all_residues = _residue_idx_for_atom(self._topology,
-                                                   all_atoms_set)
-        self._use_atom_slice = self._set_atom_slice(self._all_atoms)
+        self._all_atoms = context.all_atoms
+        self._all_residues = context.all_residues
+        self._use_atom_slice = context.use_atom_slice
         has_indexer = getattr(self, 'indexer', None) is not None
         if not has_indexer:
-            Indexer = {True: AtomSlicedIndexer,
-                       False: IdentityIndexer}[self.use_atom_slice]
-            self.indexer = Indexer(topology, self._query, self._haystack,
-                                   self._all_atoms)
+            self.indexer = context.indexer
 
         self._n_neighbors_ignored = n_neighbors_ignored
+        self._contact_levels = _CONTACT_LEVELS
 
     @classmethod
     def from_contacts(cls, atom_contacts, residue_contacts, topology,
@@ -166,21 +189,14 @@ class ContactObject(object):
 
         obj._atom_contacts = get_contact_counter(atom_contacts)
         obj._residue_contacts = get_contact_counter(residue_contacts)
+        # a level given as None was not computed
+        obj._contact_levels = tuple(
+            level for (level, counter) in [('atom', obj._atom_contacts),
+                                           ('residue', obj._residue_contacts)]
+            if counter is not None
+        )
         return obj
 
-    def _set_atom_slice(self, all_atoms):
-        """ Set atom slice logic """
-        if (self._class_use_atom_slice is None and
-            not len(all_atoms) < self._topology.n_atoms):
-            # Don't use if there are no atoms to be sliced
-            return False
-        elif self._class_use_atom_slice is None:
-            # Use if there are atms to be sliced
-            return True
-        else:
-            # Use class default
-            return self._class_use_atom_slice
-
     @property
     def contacts(self):
         """:class:`.ContactsDict` : contact dict for these contacts"""
@@ -249,7 +265,8 @@ class ContactObject(object):
             'haystack': deserialize_set,
             'all_atoms': deserialize_set,
             'all_residues': deserialize_set,
-            'atom_idx_to_residue_idx': deserialize_atom_to_residue_dct
+            'atom_idx_to_residue_idx': deserialize_atom_to_residue_dct,
+            'frame_contacts': _deserialize_frame_contacts
         }
         for key in deserialization_helpers:
             if key in dct:
@@ -282,23 +299,8 @@ class ContactObject(object):
 
     # TODO: adding a separate object for these frozenset counters will be
     # useful for many things, and this serialization should be moved there
-    @staticmethod
-    def _serialize_contact_counter(counter):
-        """JSON string from contact counter"""
-        # have to explicitly convert to int because json doesn't know how to
-        # serialize np.int64 objects, which we get in Python 3
-        serializable = {json.dumps([int(val) for val in key]): counter[key]
-                        for key in counter}
-        return json.dumps(serializable)
-
-    @staticmethod
-    def _deserialize_contact_counter(json_string):
-        """Contact counted from JSON string"""
-        dct = json.loads(json_string)
-        counter = collections.Counter({
-            frozenset(json.loads(key)): dct[key] for key in dct
-        })
-        return counter
+    _serialize_contact_counter = staticmethod(_serialize_contact_counter)
+    _deserialize_contact_counter = staticmethod(_deserialize_contact_counter)
 
     def to_json(self):
         """JSON-serialized version of this object.
@@ -326,6 +328,42 @@ class ContactObject(object):
         dct = json.loads(json_string)
         return cls.from_dict(dct)
 
+    def _calculation_key(self, kind, identity):
+        """Identifier for a calculation with these parameters.
+
+        Parameters
+        ----------
+        kind : str
+            the type of result (results of different kinds are stored
+            differently)
+        identity : str
+            identifier for the input (e.g., a trajectory fingerprint)
+
+        Returns
+        -------
+        str :
+            hex digest identifying the calculation
+        """
+        return fingerprint(kind, identity,
+                           memoized_fingerprint(self.topology),
+                           sorted(int(i) for i in self._query),
+                           sorted(int(i) for i in self._haystack),
+                           self.cutoff, self.n_neighbors_ignored)
+
+    def _input_identity(self, trajectory):
+        """Identifier for the input trajectory (used for keys)"""
+        return trajectory_fingerprint(trajectory)
+
+    def _cached_build(self, kind, trajectory, build):
+        """Run ``build(trajectory)``, loading the result from the cache (if
+        there is one in the options) if it has already been calculated.
+        """
+        cache = self._options.cache
+        if cache is None:
+            return build(trajectory)
+        key = self._calculation_key(kind, self._input_identity(trajectory))
+        return cache.get_or_compute(key, lambda: build(trajectory))
+
     def _check_compatibility(self, other, err=AssertionError):
         compatibility_attrs = ['cutoff', 'topology', 'query', 'haystack',
                                'n_neighbors_ignored']
@@ -347,6 +385,17 @@ class ContactObject(object):
         else:
             return failed_attr
 
+    def _subset_selections(self, query, haystack):
+        """Regularize and check the selections for :meth:`.subset`"""
+        query = self.query if query is None else list(query)
+        haystack = self.haystack if haystack is None else list(haystack)
+        if not (set(query) <= self._query
+                and set(haystack) <= self._haystack):
+            raise RuntimeError("The query and haystack for a subset must "
+                               "be subsets of the original query and "
+                               "haystack.")
+        return query, haystack
+
     def save_to_file(self, filename, mode="w"):
         """Save this object to the given file.
 
@@ -433,26 +482,88 @@ class ContactObject(object):
         the contact map"""
         return self._use_atom_slice
 
+    @property
+    def _shared_context(self):
+        """:class:`.ContactContext` or None : the shared context, if this
+        object uses the indexer from it"""
+        context = getattr(self, '_context', None)
+        if context is not None and context.indexer is self.indexer:
+            return context
+        return None
+
+    @property
+    def _neighbor_exclusion(self):
+        """:class:`._NeighborExclusion` : excluded neighbor residues"""
+        context = self._shared_context
+        if context is not None:
+            return context.exclusion
+        # built once per object; the parameters can't change after init
+        exclusion = getattr(self, '_neighbor_exclusion_table', None)
+        if exclusion is None:
+            exclusion = _NeighborExclusion(self.topology, self.indexer,
+                                           self._n_neighbors_ignored)
+            self._neighbor_exclusion_table = exclusion
+        return exclusion
+
+    @property
+    def _sliced_selections(self):
+        """(np.array, np.array) : sorted sliced query indices, and a mask
+        of which sliced atoms are in the haystack"""
+        context = self._shared_context
+        if context is not None:
+            return context.sliced_selections
+        selections = getattr(self, '_sliced_selection_arrays', None)
+        if selections is None:
+            selections = _sliced_selections(self.indexer)
+            self._sliced_selection_arrays = selections
+        return selections
+
+    @property
+    def _options(self):
+        """:class:`.ExecutionOptions` : how contacts are calculated (the
+        defaults if not set, e.g., for objects made by :meth:`.from_dict`)
+        """
+        options = getattr(self, '_execution_options', None)
+        if options is None:
+            options = ExecutionOptions()
+        return options
+
+    def _restore_context(self):
+        """Rebuild the shared context if this object has no indexer (e.g.,
+        if it was made by :meth:`.from_dict`)"""
+        if getattr(self, 'indexer', None) is not None:
+            return
+        context = get_context(self.topology, self._query, self._haystack,
+                              self._n_neighbors_ignored,
+                              self._use_atom_slice)
+        self._context = context
+        self.indexer = context.indexer
+
+    @property
+    def _search_engine(self):
+        """:class:`.NeighborSearchEngine` : engine for the contact search"""
+        engine = getattr(self, '_search_engine_instance', None)
+        if engine is None:
+            engine = get_engine(self._options.engine)
+            self._search_engine_instance = engine
+        return engine
+
+    @property
+    def _residue_spheres(self):
+        """:class:`.ResidueSpheres` : residue grouping of the (sliced)
+        query and haystack atoms, for the residue prefilter"""
+        spheres = getattr(self, '_residue_sphere_search', None)
+        if spheres is None:
+            query, haystack_mask = self._sliced_selections
+            spheres = ResidueSpheres(query, haystack_mask,
+                                     self._neighbor_exclusion)
+            self._residue_sphere_search = spheres
+        return spheres
+
     @property
     def _residue_ignore_atom_idxs(self):
         """dict : maps query residue index to atom indices to ignore"""
-        all_atoms_set = set(self._all_atoms)
-        result = {}
-        for residue_idx in self.indexer.residue_query_atom_idxs.keys():
-            residue = self.topology.residue(residue_idx)
-            # Several steps to go residue indices -> atom indices
-            ignore_residue_idxs = residue_neighborhood(
-                residue,
-                self._n_neighbors_ignored
-            )
-            ignore_residues = [self.topology.residue(idx)
-                               for idx in ignore_residue_idxs]
-            ignore_atoms = sum([list(res.atoms)
-                                for res in ignore_residues], [])
-            ignore_atom_idxs = self.indexer.ignore_atom_idx(ignore_atoms,
-                                                            all_atoms_set)
-            result[residue_idx] = ignore_atom_idxs
-        return result
+        return self._neighbor_exclusion.residue_ignored_atoms
 
     @property
     def haystack_residues(self):
@@ -537,17 +648,16 @@ class ContactObject(object):
                   if frozenset(contact[0]) in all_atom_pairs]
         return result
 
-    def _contact_map(self, trajectory, frame_number, residue_query_atom_idxs,
-                     residue_ignore_atom_idxs):
+    def _contact_map(self, trajectory, frame_number):
         """
         Returns atom and residue contact maps for the given frame.
 
         Parameters
         ----------
-        frame : mdtraj.Trajectory
-            the desired frame (uses the first frame in this trajectory)
-        residue_query_atom_idxs : dict
-        residue_ignore_atom_idxs : dict
+        trajectory : mdtraj.Trajectory
+            the trajectory
+        frame_number : int
+            the frame of the trajectory to use
 
         Returns
         -------
@@ -555,57 +665,120 @@ class ContactObject(object):
         residue_contact : collections.Counter
         """
         used_trajectory = self.indexer.slice_trajectory(trajectory)
+        contact_pairs = self._search_pairs(used_trajectory, frame_number,
+                                           self.cutoff)
+        return self._contact_counters(*contact_pairs)
+
+    def _search_pairs(self, trajectory, frame_number, cutoff):
+        """
+        Atom pairs in contact in one frame of a sliced trajectory.
+
+        Parameters
+        ----------
+        trajectory : mdtraj.Trajectory
+            the trajectory, sliced by the indexer
+        frame_number : int
+            the frame of the trajectory to use
+        cutoff : float
+            cutoff distance for contacts
+
+        Returns
+        -------
+        first, second : np.array
+            the smaller and larger (sliced) atom index of each unique pair
+            in contact
+        """
+        xyz = trajectory.xyz[frame_number]
+        if (self._options.residue_prefilter
+                and is_orthorhombic(trajectory)):
+            return self._unique_pairs(*self._residue_spheres.contact_pairs(
+                xyz, cutoff, box_lengths(trajectory, frame_number)
+            ))
+
+        query, haystack_mask = self._sliced_selections
+        pairs = self._search_engine.search(
+            xyz, frame_box(trajectory, frame_number), query,
+            np.nonzero(haystack_mask)[0], cutoff
+        )
+        return self._unique_pairs(*pairs)
+
+    def _unique_pairs(self, first, second):
+        """
+        Unique query/haystack pairs that are not excluded as neighbors.
+
+        Parameters
+        ----------
+        first, second : np.array
+            (sliced) query and candidate haystack atom indices of pairs
+            within the cutoff
+
+        Returns
+        -------
+        first, second : np.array
+            the smaller and larger (sliced) atom index of each unique pair
+            in contact
+        """
+        _, haystack_mask = self._sliced_selections
+        keep = haystack_mask[second]
+        keep[keep] = ~self._neighbor_exclusion.excluded(first[keep],
+                                                        second[keep])
+        n_sliced = len(haystack_mask)
+        keys = np.unique(_pair_keys(first[keep], second[keep], n_sliced))
+        return _pairs_from_keys(keys, n_sliced)
+
+    def _contact_counters(self, first, second):
+        """
+        Atom and residue contact counters for the pairs in one frame.
+
+        Parameters
+        ----------
+        first, second : np.array
+            (sliced) atom indices of the pairs in contact
 
-        neighborlist = md.compute_neighborlist(used_trajectory, self.cutoff,
-                                               frame_number)
-
-        contact_pairs = set([])
-        residue_pairs = set([])
-        haystack = self.indexer.haystack
-        atom_idx_to_residue_idx = self.indexer.atom_idx_to_residue_idx
-        for residue_idx in residue_query_atom_idxs:
-            ignore_atom_idxs = set(residue_ignore_atom_idxs[residue_idx])
-            query_idxs = residue_query_atom_idxs[residue_idx]
-            for atom_idx in query_idxs:
-                # sets should make this fast, esp since neighbor_idxs
-                # should be small and s-t is avg cost len(s)
-                neighbor_idxs = set(neighborlist[atom_idx])
-                contact_neighbors = neighbor_idxs - ignore_atom_idxs
-                contact_neighbors = contact_neighbors & haystack
-                # frozenset is unique key independent of order
-                # local_pairs = set(frozenset((atom_idx, neighb))
-                #                   for neighb in contact_neighbors)
-                local_pairs = set(map(
-                    frozenset,
-                    itertools.product([atom_idx], contact_neighbors)
-                ))
-                contact_pairs |= local_pairs
-                # contact_pairs |= set(frozenset((atom_idx, neighb))
-                #                      for neighb in contact_neighbors)
-                local_residue_partners = set(atom_idx_to_residue_idx[a]
-                                             for a in contact_neighbors)
-                local_res_pairs = set(map(
-                    frozenset,
-                    itertools.product([residue_idx], local_residue_partners)
-                ))
-                residue_pairs |= local_res_pairs
-
-        atom_contacts = collections.Counter(contact_pairs)
-        # residue_pairs = set(
-        #     frozenset(self._atom_idx_to_residue_idx[aa] for aa in pair)
-        #     for pair in contact_pairs
-        # )
-        residue_contacts = collections.Counter(residue_pairs)
+        Returns
+        -------
+        atom_contacts : collections.Counter or None
+            None if atom contacts are not computed
+        residue_contact : collections.Counter or None
+            None if residue contacts are not computed
+        """
+        levels = getattr(self, '_contact_levels', _CONTACT_LEVELS)
+        atom_contacts = None
+        residue_contacts = None
+        if 'atom' in levels:
+            atom_pairs = zip(first.tolist(), second.tolist())
+            atom_contacts = collections.Counter(map(frozenset, atom_pairs))
+        if 'residue' in levels:
+            atom_residue = self._neighbor_exclusion.atom_residue
+            n_residues = self.topology.n_residues
+            residue_keys = np.unique(_pair_keys(atom_residue[first],
+                                                atom_residue[second],
+                                                n_residues))
+            residue_pairs = zip(*(
+                idxs.tolist()
+                for idxs in _pairs_from_keys(residue_keys, n_residues)
+            ))
+            residue_contacts = collections.Counter(map(frozenset,
+                                                       residue_pairs))
         return (atom_contacts, residue_contacts)
 
+    def _missing_contact_level(self, level):
+        raise RuntimeError("No {0} contacts: they were not computed for "
+                           "this object. Include '{0}' in the contacts "
+                           "parameter to compute them.".format(level))
+
     @property
     def atom_contacts(self):
+        if self._atom_contacts is None:
+            self._missing_contact_level('atom')
         n_atoms = self.topology.n_atoms
         return ContactCount(self._atom_contacts, self.topology.atom,
                             n_atoms, n_atoms)
 
     @property
     def residue_contacts(self):
+        if self._residue_contacts is None:
+            self._missing_contact_level('residue')
         n_res = self.topology.n_residues
         return ContactCount(self._residue_contacts, self.topology.residue,
                             n_res, n_res)
@@ -642,7 +815,20 @@ class ContactFrequency(ContactObject):
         Cutoff distance for contacts, in nanometers. Default 0.45.
     n_neighbors_ignored : int
         Number of neighboring residues (in the same chain) to ignore.
-        Default 2.
+        Default 2. Larger values can be applied afterwards with
+        :meth:`.with_neighbors_ignored`.
+    store_frames : bool
+        If True, also store which atom contacts are made in each frame (as
+        a compact array). This is needed to restrict the map to new query
+        and haystack selections with :meth:`.subset`. Default False.
+    contacts : tuple of str
+        Which contacts to compute: any of ``"atom"`` and ``"residue"``.
+        Levels that are not included are not counted or stored, and
+        accessing them raises a ``RuntimeError``. Default computes both.
+    options :
+        Execution options: ``checkpoint``, ``cache``, ``residue_prefilter``,
+        ``engine``, and ``n_threads``. These change how the contacts are
+        calculated, but not the results; see :class:`.ExecutionOptions`.
     """
     # Default for use_atom_slice, None tries to be smart
     _class_use_atom_slice = None
@@ -653,14 +839,23 @@ class ContactFrequency(ContactObject):
     )
 
     def __init__(self, trajectory, query=None, haystack=None, cutoff=0.45,
-                 n_neighbors_ignored=2):
+                 n_neighbors_ignored=2, store_frames=False,
+                 contacts=_CONTACT_LEVELS, **options):
         warnings.warn(self._pending_dep_msg, PendingDeprecationWarning)
         self._n_frames = len(trajectory)
+        self._execution_options = ExecutionOptions(**options)
+        self._store_frames = store_frames
+        contact_levels = _contact_levels(contacts)
+        if store_frames and 'atom' not in contact_levels:
+            raise RuntimeError("store_frames requires atom contacts")
         super(ContactFrequency, self).__init__(trajectory.topology,
                                                query, haystack, cutoff,
                                                n_neighbors_ignored)
-        contacts = self._build_contact_map(trajectory)
-        (self._atom_contacts, self._residue_contacts) = contacts
+        self._contact_levels = contact_levels
+        contacts = self._cached_build(self._build_kind(), trajectory,
+                                      self._build_contact_map)
+        (self._atom_contacts, self._residue_contacts,
+         self._frame_contacts) = contacts
 
     @classmethod
     def from_contacts(cls, atom_contacts, residue_contacts, n_frames,
@@ -672,8 +867,46 @@ class ContactFrequency(ContactObject):
             cutoff, n_neighbors_ignored, indexer
         )
         obj._n_frames = n_frames
+        obj._frame_contacts = None
         return obj
 
+    @classmethod
+    def from_cutoffs(cls, trajectory, cutoffs, query=None, haystack=None,
+                     n_neighbors_ignored=2, engine="mdtraj"):
+        """Contact frequencies for several cutoffs in a single pass.
+
+        The neighbor search is only done once per frame, at the largest
+        cutoff. The distances of the pairs found are then compared against
+        each of the smaller cutoffs.
+
+        Parameters
+        ----------
+        trajectory : mdtraj.Trajectory
+            Trajectory (segment) to analyze
+        cutoffs : list of float
+            Cutoff distances for contacts, in nanometers.
+        query : list of int
+            Indices of the atoms to be included as query. Default ``None``
+            means all heavy, non-water atoms.
+        haystack : list of int
+            Indices of the atoms to be included as haystack. Default
+            ``None`` means all heavy, non-water atoms.
+        n_neighbors_ignored : int
+            Number of neighboring residues (in the same chain) to ignore.
+            Default 2.
+        engine : str or :class:`.NeighborSearchEngine`
+            Neighbor search engine; see :mod:`contact_map.engines`. Default
+            ``"mdtraj"``.
+
+        Returns
+        -------
+        dict :
+            maps each cutoff to the :class:`.ContactFrequency` for that
+            cutoff
+        """
+        return frequencies_for_cutoffs(cls, trajectory, cutoffs, query,
+                                       haystack, n_neighbors_ignored, engine)
+
     @classmethod
     def from_dict(cls, dct):
         warnings.warn(cls._pending_dep_msg, PendingDeprecationWarning)
@@ -686,8 +919,8 @@ class ContactFrequency(ContactObject):
 
     def __hash__(self):
         return hash((super(ContactFrequency, self).__hash__(),
-                     tuple(self._atom_contacts.items()),
-                     tuple(self._residue_contacts.items()),
+                     _counter_items(self._atom_contacts),
+                     _counter_items(self._residue_contacts),
                      self.n_frames))
 
     def __eq__(self, other):
@@ -700,8 +933,21 @@ class ContactFrequency(ContactObject):
     def to_dict(self):
         dct = super(ContactFrequency, self).to_dict()
         dct.update({'n_frames': self.n_frames})
+        frame_contacts = getattr(self, '_frame_contacts', None)
+        if frame_contacts is not None:
+            dct['frame_contacts'] = \
+                    _serialize_frame_contacts(frame_contacts)
         return dct
 
+    def _build_kind(self):
+        """Kind of calculation, for cache and checkpoint keys"""
+        kind = ('frequency_frames' if getattr(self, '_store_frames', False)
+                else 'frequency')
+        levels = getattr(self, '_contact_levels', _CONTACT_LEVELS)
+        if levels != _CONTACT_LEVELS:
+            kind += '_' + '_'.join(levels)
+        return kind
+
     def _build_contact_map(self, trajectory):
         # We actually build the contact map on a per-residue basis, although
         # we save it on a per-atom basis. This allows us ignore
@@ -709,27 +955,110 @@ class ContactFrequency(ContactObject):
         # TODO: this whole thing should be cleaned up and should replace
         # MDTraj's really slow old compute_contacts by using MDTraj's new
         # neighborlists (unless the MDTraj people do that first).
-        atom_contacts_count = collections.Counter([])
-        residue_contacts_count = collections.Counter([])
+        frames = slice(0, len(trajectory))
+        checkpoint = self._options.checkpoint
+        if checkpoint is None:
+            return self._count_contacts(trajectory, frames)
 
-        # cache things that can be calculated once based on the topology
-        # (namely, which atom indices matter for each residue)
-        residue_ignore_atom_idxs = self._residue_ignore_atom_idxs
-        residue_query_atom_idxs = self.indexer.residue_query_atom_idxs
+        key = self._calculation_key(self._build_kind(),
+                                    self._input_identity(trajectory))
 
-        used_trajectory = self.indexer.slice_trajectory(trajectory)
-        for frame_num in range(len(trajectory)):
-            frame_contacts = self._contact_map(used_trajectory, frame_num,
-                                               residue_query_atom_idxs,
-                                               residue_ignore_atom_idxs)
-            frame_atom_contacts = frame_contacts[0]
-            frame_residue_contacts = frame_contacts[1]
-            atom_contacts_count.update(frame_atom_contacts)
-            residue_contacts_count += frame_residue_contacts
+        def compute(block):
+            return serialize_block(*self._count_contacts(trajectory, block))
+
+        blocks = checkpoint.run(key, len(trajectory), compute)
+        return sum_blocks(blocks)
+
+    def _count_contacts(self, trajectory, frames):
+        """Count the contacts in some frames of a trajectory.
+
+        The trajectory is sliced by the indexer one block of frames at a
+        time.
 
-        atom_contacts_count = \
-                self.indexer.convert_atom_contacts(atom_contacts_count)
-        return (atom_contacts_count, residue_contacts_count)
+        Parameters
+        ----------
+        trajectory : mdtraj.Trajectory
+            the (unsliced) trajectory
+        frames : slice
+            the frames to include
+
+        Returns
+        -------
+        atom_contacts : collections.Counter or None
+        residue_contacts : collections.Counter or None
+        frame_contacts : tuple of np.array or None
+            (keys, offsets) for the atom contacts in each frame, if
+            ``store_frames`` is set; otherwise None
+        """
+        levels = getattr(self, '_contact_levels', _CONTACT_LEVELS)
+        atom_contacts_count = (collections.Counter([]) if 'atom' in levels
+                               else None)
+        residue_contacts_count = (collections.Counter([])
+                                  if 'residue' in levels else None)
+        frame_keys = [] if getattr(self, '_store_frames', False) else None
+
+        self._restore_context()
+        n_threads = self._options.n_threads
+        with thread_pool(n_threads) as pool:
+            for _, sliced in self.indexer.slice_blocks(trajectory, frames):
+                # the block must be finished before the next is sliced
+                chunks = frame_chunk_results(pool, self._count_frames,
+                                             sliced, n_threads)
+                for (atom_counts, residue_counts, keys) in chunks:
+                    if atom_contacts_count is not None:
+                        atom_contacts_count.update(atom_counts)
+                    if residue_contacts_count is not None:
+                        residue_contacts_count.update(residue_counts)
+                    if frame_keys is not None:
+                        frame_keys.extend(keys)
+
+        if atom_contacts_count is not None:
+            atom_contacts_count = \
+                    self.indexer.convert_atom_contacts(atom_contacts_count)
+
+        frame_contacts = None
+        if frame_keys is not None:
+            lengths = [len(keys) for keys in frame_keys]
+            offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+            keys = np.concatenate([np.zeros(0, dtype=np.int64)] + frame_keys)
+            frame_contacts = _join_frame_contacts([(keys, offsets)])
+        return (atom_contacts_count, residue_contacts_count, frame_contacts)
+
+    def _count_frames(self, sliced, frame_numbers):
+        """Count the contacts in some frames of a sliced block.
+
+        This is the work done by each thread; see :meth:`._count_contacts`.
+
+        Returns
+        -------
+        atom_contacts : collections.Counter or None
+            counts for the sliced atom indices
+        residue_contacts : collections.Counter or None
+        frame_keys : list of np.array or None
+            (real) atom pair keys of the contacts in each frame, if
+            ``store_frames`` is set; otherwise None
+        """
+        levels = getattr(self, '_contact_levels', _CONTACT_LEVELS)
+        atom_contacts = (collections.Counter() if 'atom' in levels
+                         else None)
+        residue_contacts = (collections.Counter() if 'residue' in levels
+                            else None)
+        n_atoms = self.topology.n_atoms
+        frame_keys = [] if getattr(self, '_store_frames', False) else None
+        for frame_num in frame_numbers:
+            frame_atom_contacts, frame_residue_contacts = \
+                    self._contact_map(sliced, frame_num)
+            if atom_contacts is not None:
+                atom_contacts.update(frame_atom_contacts)
+            if residue_contacts is not None:
+                residue_contacts.update(frame_residue_contacts)
+            if frame_keys is not None:
+                real_contacts = self.indexer.convert_atom_contacts(
+                    frame_atom_contacts
+                )
+                frame_keys.append(_keys_from_counter(real_contacts,
+                                                     n_atoms)[0])
+        return atom_contacts, residue_contacts, frame_keys
 
     @property
     def n_frames(self):
@@ -746,9 +1075,33 @@ class ContactFrequency(ContactObject):
             contact frequency
         """
         self._check_compatibility(other)
-        self._atom_contacts += other._atom_contacts
-        self._residue_contacts += other._residue_contacts
+        self._atom_contacts = _combine_counters(
+            self._atom_contacts, other._atom_contacts, operator.iadd
+        )
+        self._residue_contacts = _combine_counters(
+            self._residue_contacts, other._residue_contacts, operator.iadd
+        )
         self._n_frames += other._n_frames
+        frame_contacts = [getattr(self, '_frame_contacts', None),
+                          getattr(other, '_frame_contacts', None)]
+        if all(f is not None for f in frame_contacts):
+            self._frame_contacts = _join_frame_contacts(frame_contacts)
+        else:
+            self._frame_contacts = None
+
+    def extend(self, trajectory):
+        """Add the contacts from new frames to this contact frequency.
+
+        This reuses everything derived from the topology and selections
+        (such as the atom slicing and the excluded neighbor pairs), so only
+        the new frames are analyzed.
+
+        Parameters
+        ----------
+        trajectory : mdtraj.Trajectory
+            the new frames, for the same topology as this contact frequency
+        """
+        extend_frequency(self, trajectory)
 
     def subtract_contact_frequency(self, other):
         """Subtracts results from `other` from internal counter.
@@ -765,13 +1118,67 @@ class ContactFrequency(ContactObject):
             contact frequency
         """
         self._check_compatibility(other)
-        self._atom_contacts -= other._atom_contacts
-        self._residue_contacts -= other._residue_contacts
+        self._atom_contacts = _combine_counters(
+            self._atom_contacts, other._atom_contacts, operator.isub
+        )
+        self._residue_contacts = _combine_counters(
+            self._residue_contacts, other._residue_contacts, operator.isub
+        )
         self._n_frames -= other._n_frames
+        # we don't know which frames were removed
+        self._frame_contacts = None
+
+    def with_neighbors_ignored(self, n_neighbors_ignored):
+        """Contact frequency ignoring more neighboring residues.
+
+        Contacts between residues that are within ``n_neighbors_ignored``
+        of each other in the same chain are removed from the stored
+        results, so no distances are recalculated. To compare several
+        settings, calculate the map with ``n_neighbors_ignored=0`` and
+        filter it for each value.
+
+        Parameters
+        ----------
+        n_neighbors_ignored : int
+            Number of neighboring residues (in the same chain) to ignore.
+            Must be at least the value used for this map.
+
+        Returns
+        -------
+        :class:`.ContactFrequency` :
+            contact frequency for the new number of ignored neighbors
+        """
+        return frequency_with_neighbors_ignored(self, n_neighbors_ignored)
+
+    def subset(self, query=None, haystack=None):
+        """Contact frequency restricted to new query/haystack selections.
+
+        The new selections must be subsets of the original ones. The atom
+        contacts are filtered from the stored results. Recounting the
+        residue contacts requires the per-frame information stored when the
+        map is created with ``store_frames=True``.
+
+        Parameters
+        ----------
+        query : list of int
+            Indices of the atoms to be included as query. Default ``None``
+            keeps the current query.
+        haystack : list of int
+            Indices of the atoms to be included as haystack. Default
+            ``None`` keeps the current haystack.
+
+        Returns
+        -------
+        :class:`.ContactFrequency` :
+            contact frequency for the new selections
+        """
+        return subset_frequency(self, query, haystack)
 
     @property
     def atom_contacts(self):
         """Atoms pairs mapped to fraction of trajectory with that contact"""
+        if self._atom_contacts is None:
+            self._missing_contact_level('atom')
         n_x = self.topology.n_atoms
         n_y = self.topology.n_atoms
         return ContactCount(collections.Counter({
@@ -782,6 +1189,8 @@ class ContactFrequency(ContactObject):
     @property
     def residue_contacts(self):
         """Residue pairs mapped to fraction of trajectory with that contact"""
+        if self._residue_contacts is None:
+            self._missing_contact_level('residue')
         n_x = self.topology.n_residues
         n_y = self.topology.n_residues
         return ContactCount(collections.Counter({
@@ -1,6 +1,16 @@
 from collections import abc, Counter
 
+import numpy as np
+
 from .contact_map import ContactFrequency, ContactObject
+from .contact_map import _contact_levels, _CONTACT_LEVELS
+from .atom_indexer import _atom_residue_idxs as _atom_residue_array
+from .counters import (_counter_from_keys, _frame_contacts_from_counters,
+                       _subset_frame_contacts, _counter_items, _pair_keys,
+                       _selection_mask)
+from .blocks import thread_pool, frame_chunk_results
+from .options import ExecutionOptions
+from .concurrence import Concurrence, _regularize_contact_input
 import json
 
 class ContactTrajectory(ContactObject, abc.Sequence):
@@ -23,28 +33,45 @@ class ContactTrajectory(ContactObject, abc.Sequence):
         Cutoff distance for contacts, in nanometers. Default 0.45.
     n_neighbors_ignored : int
         Number of neighboring residues (in the same chain) to ignore.
-        Default 2.
+        Default 2. Larger values can be applied afterwards with
+        :meth:`.with_neighbors_ignored`.
+    contacts : tuple of str
+        Which contacts to compute for each frame: any of ``"atom"`` and
+        ``"residue"``. Default computes both; see
+        :class:`.ContactFrequency`.
+    options :
+        Execution options: ``checkpoint``, ``cache``, ``residue_prefilter``,
+        ``engine``, and ``n_threads``; see :class:`.ExecutionOptions`.
     """
     _class_use_atom_slice = None
     def __init__(self, trajectory, query=None, haystack=None, cutoff=0.45,
-                 n_neighbors_ignored=2):
+                 n_neighbors_ignored=2, contacts=_CONTACT_LEVELS, **options):
+        contact_levels = _contact_levels(contacts)
         super(ContactTrajectory, self).__init__(trajectory.topology, query,
                                                 haystack, cutoff,
                                                 n_neighbors_ignored)
-        contacts = self._build_contacts(trajectory)
-        self._contact_maps = [
+        self._execution_options = ExecutionOptions(**options)
+        self._contact_levels = contact_levels
+        contacts = self._cached_build(self._build_kind(), trajectory,
+                                      self._build_contacts)
+        self._contact_maps = self._maps_from_contacts(*contacts)
+
+    def _maps_from_contacts(self, atom_contacts, residue_contacts):
+        """Single-frame contact frequencies from the contacts per frame"""
+        return [
             ContactFrequency.from_contacts(
                 topology=self.topology,
                 query=self.query,
                 haystack=self.haystack,
                 cutoff=self.cutoff,
                 n_neighbors_ignored=self.n_neighbors_ignored,
-                atom_contacts=atom_contacts,
-                residue_contacts=residue_contacts,
+                atom_contacts=frame_atom_contacts,
+                residue_contacts=frame_residue_contacts,
                 n_frames=1,
                 indexer=self.indexer
             )
-            for atom_contacts, residue_contacts in zip(*contacts)
+            for frame_atom_contacts, frame_residue_contacts
+            in zip(atom_contacts, residue_contacts)
         ]
 
     def __getitem__(self, num):
@@ -55,10 +82,10 @@ class ContactTrajectory(ContactObject, abc.Sequence):
 
     def __hash__(self):
         return hash((super(ContactTrajectory, self).__hash__(),
-                     tuple([frozenset(frame.counter.items())
-                            for frame in self.atom_contacts]),
-                     tuple([frozenset(frame.counter.items())
-                            for frame in self.residue_contacts])))
+                     tuple([_counter_items(cmap._atom_contacts)
+                            for cmap in self._contact_maps]),
+                     tuple([_counter_items(cmap._residue_contacts)
+                            for cmap in self._contact_maps])))
 
     def __eq__(self, other):
         return hash(self) == hash(other)
@@ -82,30 +109,173 @@ class ContactTrajectory(ContactObject, abc.Sequence):
         ]
         return cls.from_contact_maps(contact_maps)
 
+    def _build_kind(self):
+        """Kind of calculation, for cache and checkpoint keys"""
+        levels = getattr(self, '_contact_levels', _CONTACT_LEVELS)
+        if levels == _CONTACT_LEVELS:
+            return 'trajectory'
+        return '_'.join(('trajectory',) + levels)
+
     def _build_contacts(self, trajectory):
-        # atom_contacts, residue_contacts = self._empty_contacts()
+        frames = slice(0, len(trajectory))
+        checkpoint = self._options.checkpoint
+        if checkpoint is None:
+            return self._frame_contacts(trajectory, frames)
+
+        key = self._calculation_key(self._build_kind(),
+                                    self._input_identity(trajectory))
+        serialize = self._serialize_contact_counter
+        deserialize = self._deserialize_contact_counter
+
+        def compute(block):
+            block_contacts = self._frame_contacts(trajectory, block)
+            return {'atom_contacts': [serialize(c) for c in block_contacts[0]],
+                    'residue_contacts': [serialize(c)
+                                         for c in block_contacts[1]]}
+
         atom_contacts = []
         residue_contacts = []
+        for block in checkpoint.run(key, len(trajectory), compute):
+            atom_contacts.extend(deserialize(c)
+                                 for c in block['atom_contacts'])
+            residue_contacts.extend(deserialize(c)
+                                    for c in block['residue_contacts'])
+        return atom_contacts, residue_contacts
+
+    def _frame_contacts(self, trajectory, frames):
+        """Contacts for each frame in some frames of a trajectory.
 
-        residue_ignore_atom_idxs = self._residue_ignore_atom_idxs
-        residue_query_atom_idxs = self.indexer.residue_query_atom_idxs
-        used_trajectory = self.indexer.slice_trajectory(trajectory)
+        Parameters
+        ----------
+        trajectory : mdtraj.Trajectory
+            the (unsliced) trajectory
+        frames : slice
+            the frames to include
+
+        Returns
+        -------
+        atom_contacts : list of collections.Counter
+            (counters are None if atom contacts are not computed)
+        residue_contacts : list of collections.Counter
+            (counters are None if residue contacts are not computed)
+        """
+        atom_contacts = []
+        residue_contacts = []
+        n_threads = self._options.n_threads
+        with thread_pool(n_threads) as pool:
+            for _, sliced in self.indexer.slice_blocks(trajectory, frames):
+                chunks = frame_chunk_results(pool, self._chunk_contacts,
+                                             sliced, n_threads)
+                for chunk_atom_contacts, chunk_residue_contacts in chunks:
+                    atom_contacts.extend(chunk_atom_contacts)
+                    residue_contacts.extend(chunk_residue_contacts)
+        return atom_contacts, residue_contacts
 
-        # range(len(trajectory)) avoids recopying topology, as would occur
+    def _chunk_contacts(self, sliced, frame_numbers):
+        """Contacts for each of some frames of a sliced block"""
+        atom_contacts = []
+        residue_contacts = []
+        # range over frame numbers avoids recopying topology, as would occur
         # in `for frame in trajectory`
-        for frame_num in range(len(trajectory)):
-            frame_contacts = self._contact_map(used_trajectory, frame_num,
-                                               residue_query_atom_idxs,
-                                               residue_ignore_atom_idxs)
+        for frame_num in frame_numbers:
+            frame_contacts = self._contact_map(sliced, frame_num)
             frame_atom_contacts, frame_residue_contacts = frame_contacts
-            frame_atom_contacts = \
-                    self.indexer.convert_atom_contacts(frame_atom_contacts)
-            # TODO unify contact building with something like this?
-            # atom_contacts, residue_contact = self._update_contacts(...)
+            if frame_atom_contacts is not None:
+                frame_atom_contacts = self.indexer.convert_atom_contacts(
+                    frame_atom_contacts
+                )
             atom_contacts.append(frame_atom_contacts)
             residue_contacts.append(frame_residue_contacts)
         return atom_contacts, residue_contacts
 
+    def extend(self, trajectory):
+        """Add the contacts for new frames to the end of this trajectory.
+
+        Only the new frames are analyzed; everything derived from the
+        topology and selections is reused.
+
+        Parameters
+        ----------
+        trajectory : mdtraj.Trajectory
+            the new frames, for the same topology as this contact trajectory
+        """
+        if trajectory.n_atoms != self.topology.n_atoms:
+            raise RuntimeError("Trajectory has " + str(trajectory.n_atoms)
+                               + " atoms; expected "
+                               + str(self.topology.n_atoms))
+        contacts = self._frame_contacts(trajectory, slice(0, len(trajectory)))
+        self._contact_maps = (self._contact_maps
+                              + self._maps_from_contacts(*contacts))
+
+    def concurrence(self, contacts, level="atom"):
+        """Concurrence for some contacts, from the contacts in each frame.
+
+        This uses the stored contacts for each frame, so no distances are
+        calculated. A contact is present in a frame if it is within the
+        cutoff of this contact trajectory.
+
+        Parameters
+        ----------
+        contacts : list or :class:`.ContactCount` or :class:`.ContactObject`
+            the contacts to include, in any of the forms accepted by
+            :class:`.AtomContactConcurrence`; usually the output of
+            ``most_common()``
+        level : str
+            ``"atom"`` or ``"residue"``: whether these are atom or residue
+            contacts
+
+        Returns
+        -------
+        :class:`.Concurrence` :
+            whether each of the contacts is present in each frame
+        """
+        if level not in _CONTACT_LEVELS:
+            raise RuntimeError("Bad value for level: " + str(level)
+                               + ". Use 'atom' or 'residue'.")
+        if level not in getattr(self, '_contact_levels', _CONTACT_LEVELS):
+            self._missing_contact_level(level)
+        contacts = _regularize_contact_input(contacts, level)
+        pairs = np.array([[contact[0][0].index, contact[0][1].index]
+                          for contact in contacts],
+                         dtype=np.int64).reshape(-1, 2)
+        labels = [str(contact[0]) for contact in contacts]
+        n_objects = {'atom': self.topology.n_atoms,
+                     'residue': self.topology.n_residues}[level]
+        keys = _pair_keys(pairs[:, 0], pairs[:, 1], n_objects)
+        # repeated contacts share a row of the unique keys
+        unique_keys, rows = np.unique(keys, return_inverse=True)
+
+        counters = [{'atom': cmap._atom_contacts,
+                     'residue': cmap._residue_contacts}[level]
+                    for cmap in self._contact_maps]
+        frame_keys, offsets = _frame_contacts_from_counters(counters,
+                                                            n_objects)
+        frames = np.repeat(np.arange(len(self)), np.diff(offsets))
+        matched = np.isin(frame_keys, unique_keys)
+
+        values = np.zeros((len(unique_keys), len(self)), dtype=bool)
+        values[np.searchsorted(unique_keys, frame_keys[matched]),
+               frames[matched]] = True
+        return Concurrence(values[rows.ravel()], labels=labels)
+
+    def lifetimes(self, contacts, level="atom"):
+        """Lifetime statistics for some contacts.
+
+        Parameters
+        ----------
+        contacts : list or :class:`.ContactCount` or :class:`.ContactObject`
+            the contacts to include; see :meth:`.concurrence`
+        level : str
+            ``"atom"`` or ``"residue"``: whether these are atom or residue
+            contacts
+
+        Returns
+        -------
+        :class:`.ContactLifetimes` :
+            lifetimes of the contacts in this trajectory
+        """
+        return self.concurrence(contacts, level).lifetimes
+
     def contact_frequency(self):
         """Create a :class:`.ContactFrequency` from this contact trajectory
         """
@@ -126,6 +296,92 @@ class ContactTrajectory(ContactObject, abc.Sequence):
 
         return freq
 
+    def with_neighbors_ignored(self, n_neighbors_ignored):
+        """Contact trajectory ignoring more neighboring residues.
+
+        See :meth:`.ContactFrequency.with_neighbors_ignored`.
+
+        Parameters
+        ----------
+        n_neighbors_ignored : int
+            Number of neighboring residues (in the same chain) to ignore.
+            Must be at least the value used for this trajectory.
+
+        Returns
+        -------
+        :class:`.ContactTrajectory` :
+            contact trajectory for the new number of ignored neighbors
+        """
+        return self.from_contact_maps([
+            cmap.with_neighbors_ignored(n_neighbors_ignored)
+            for cmap in self._contact_maps
+        ])
+
+    def subset(self, query=None, haystack=None):
+        """Contact trajectory restricted to new query/haystack selections.
+
+        The new selections must be subsets of the original ones. The atom
+        contacts in each frame are filtered, and the residue contacts are
+        recounted from them, without recalculating any distances.
+
+        Parameters
+        ----------
+        query : list of int
+            Indices of the atoms to be included as query. Default ``None``
+            keeps the current query.
+        haystack : list of int
+            Indices of the atoms to be included as haystack. Default
+            ``None`` keeps the current haystack.
+
+        Returns
+        -------
+        :class:`.ContactTrajectory` :
+            contact trajectory for the new selections
+        """
+        query, haystack = self._subset_selections(query, haystack)
+        if any(cmap._atom_contacts is None for cmap in self._contact_maps):
+            raise RuntimeError("A subset can only be made from a contact "
+                               "trajectory with atom contacts.")
+        topology = self.topology
+        n_atoms = topology.n_atoms
+        n_residues = topology.n_residues
+        frame_contacts = _frame_contacts_from_counters(
+            [cmap._atom_contacts for cmap in self._contact_maps], n_atoms
+        )
+        (keys, offsets), residue_frames, residue_keys = \
+                _subset_frame_contacts(
+                    frame_contacts,
+                    query_mask=_selection_mask(query, n_atoms),
+                    haystack_mask=_selection_mask(haystack, n_atoms),
+                    atom_residue=_atom_residue_array(topology),
+                    n_atoms=n_atoms,
+                    n_residues=n_residues
+                )
+        residue_offsets = np.searchsorted(residue_frames,
+                                          np.arange(len(self) + 1))
+        contact_maps = []
+        indexer = None  # all frames share the indexer made for the first
+        for i in range(len(self)):
+            cmap = ContactFrequency.from_contacts(
+                atom_contacts=_counter_from_keys(
+                    keys[offsets[i]:offsets[i + 1]], n_atoms
+                ),
+                residue_contacts=_counter_from_keys(
+                    residue_keys[residue_offsets[i]:residue_offsets[i + 1]],
+                    n_residues
+                ),
+                n_frames=1,
+                topology=topology,
+                query=query,
+                haystack=haystack,
+                cutoff=self.cutoff,
+                n_neighbors_ignored=self.n_neighbors_ignored,
+                indexer=indexer
+            )
+            indexer = cmap.indexer
+            contact_maps.append(cmap)
+        return self.from_contact_maps(contact_maps)
+
     def to_dict(self):
         return {
             'contact_maps': [cmap.to_dict() for cmap in self._contact_maps]
@@ -156,6 +412,9 @@ class ContactTrajectory(ContactObject, abc.Sequence):
         for cmap in maps:
             obj._check_compatibility(cmap)
 
+        obj._contact_levels = getattr(maps[0], '_contact_levels',
+                                      _CONTACT_LEVELS)
+
         obj._contact_maps = maps
         return obj
 
@@ -212,8 +471,15 @@ class MutableContactTrajectory(ContactTrajectory, abc.MutableSequence):
         Cutoff distance for contacts, in nanometers. Default 0.45.
     n_neighbors_ignored : int
         Number of neighboring residues (in the same chain) to ignore.
-        Default 2.
-
+        Default 2. Larger values can be applied afterwards with
+        :meth:`.with_neighbors_ignored`.
+    contacts : tuple of str
+        Which contacts to compute for each frame: any of ``"atom"`` and
+        ``"residue"``. Default computes both; see
+        :class:`.ContactFrequency`.
+    options :
+        Execution options: ``checkpoint``, ``cache``, ``residue_prefilter``,
+        ``engine``, and ``n_threads``; see :class:`.ExecutionOptions`.
     """
     def __setitem__(self, key, value):
         self._contact_maps[key] = value
@@ -357,8 +623,8 @@ class RollingContactFrequency(abc.Iterator):
         # otherwise they get copies of only the last version!
         cmap = self._contact_map
         map_copy = ContactFrequency.from_contacts(
-            cmap._atom_contacts.copy(),
-            cmap._residue_contacts.copy(),
+            _copy_counter(cmap._atom_contacts),
+            _copy_counter(cmap._residue_contacts),
             topology=cmap.topology,
             query=cmap.query,
             haystack=cmap.haystack,
@@ -367,3 +633,7 @@ class RollingContactFrequency(abc.Iterator):
             n_frames=cmap.n_frames
         )
         return map_copy
+
+
+def _copy_counter(counter):
+    return None if counter is None else counter.copy()
@@ -0,0 +1,311 @@
+"""
+Shared setup for contact objects with the same topology and parameters.
+
+Setting up a contact calculation (default selections, the atom indexer, and
+the table of excluded neighbor residues) only depends on the topology and
+the parameters, not on the coordinates. Objects such as
+:class:`.ContactTrajectory` create many contact objects for the same
+topology, so this setup is stored in a :class:`.ContactContext` that is
+memoized in a bounded cache and shared by all objects created with the same
+parameters.
+
+Contexts assume that a topology is not modified after it has been used to
+create contact objects.
+"""
+
+import collections
+import threading
+import weakref
+
+import numpy as np
+
+from .atom_indexer import (AtomSlicedIndexer, IdentityIndexer,
+                           _atom_residue_idxs)
+from .topology import topology_fingerprint
+
+DEFAULT_SELECTION = "not water and symbol != 'H'"
+
+CONTEXT_CACHE_SIZE = 32
+
+
+class _TopologyMemo(object):
+    """Memoize a function of a topology object.
+
+    Results are keyed by the identity of the topology, and are dropped when
+    the topology is garbage collected.
+    """
+    def __init__(self, func):
+        self.func = func
+        self._results = {}
+
+    def __call__(self, topology):
+        key = id(topology)
+        entry = self._results.get(key)
+        if entry is not None and entry[0]() is topology:
+            return entry[1]
+
+        result = self.func(topology)
+
+        def forget(ref, key=key):
+            if self._results.get(key, (None,))[0] is ref:
+                del self._results[key]
+
+        self._results[key] = (weakref.ref(topology, forget), result)
+        return result
+
+
+memoized_fingerprint = _TopologyMemo(topology_fingerprint)
+_default_selection = _TopologyMemo(
+    lambda topology: frozenset(topology.select(DEFAULT_SELECTION).tolist())
+)
+
+
+class _NeighborExclusion(object):
+    """Exclusion of contacts between neighboring residues.
+
+    Two (sliced) atoms are excluded from contact if their residues are in
+    the same chain and within ``n_neighbors_ignored`` of each other. This
+    replaces explicit lists of ignored atoms with a test on per-atom residue
+    and chain arrays.
+
+    Parameters
+    ----------
+    topology : mdtraj.Topology
+    indexer : :class:`.AtomSlicedIndexer` or :class:`.IdentityIndexer`
+        indexer mapping sliced atom indices to residues
+    n_neighbors_ignored : int
+        number of neighboring residues (in the same chain) to ignore
+    """
+    def __init__(self, topology, indexer, n_neighbors_ignored):
+        self.n_neighbors_ignored = n_neighbors_ignored
+        self.residue_chain = np.fromiter(
+            (res.chain.index for res in topology.residues),
+            dtype=np.int64, count=topology.n_residues
+        )
+        self.atom_residue = np.asarray(indexer.atom_idx_to_residue_idx)
+        self.atom_chain = self.residue_chain[self.atom_residue]
+        self._query_residues = list(indexer.residue_query_atom_idxs)
+        self._residue_ignored_atoms = None
+
+    def excluded(self, first, second):
+        """Whether each pair of (sliced) atoms is excluded from contact"""
+        separation = np.abs(self.atom_residue[first]
+                            - self.atom_residue[second])
+        return ((self.atom_chain[first] == self.atom_chain[second])
+                & (separation <= self.n_neighbors_ignored))
+
+    @property
+    def residue_ignored_atoms(self):
+        """dict : maps each query residue index to the set of (sliced) atom
+        indices excluded from contact with it; built once"""
+        if self._residue_ignored_atoms is None:
+            self._residue_ignored_atoms = self._ignored_atoms_by_residue()
+        return self._residue_ignored_atoms
+
+    def _ignored_atoms_by_residue(self):
+        n_neighbors = self.n_neighbors_ignored
+        # atoms sorted by (chain, residue), so the atoms ignored for a
+        # residue are a contiguous range of that order
+        stride = len(self.residue_chain) + n_neighbors + 1
+        atom_keys = self.atom_chain * stride + self.atom_residue
+        order = np.argsort(atom_keys, kind='stable')
+        sorted_keys = atom_keys[order]
+
+        residues = np.array(sorted(self._query_residues), dtype=np.int64)
+        base = self.residue_chain[residues] * stride
+        lower = np.searchsorted(
+            sorted_keys, base + np.maximum(residues - n_neighbors, 0),
+            side='left'
+        )
+        upper = np.searchsorted(sorted_keys, base + residues + n_neighbors,
+                                side='right')
+        return {int(residue): set(order[lo:hi].tolist())
+                for (residue, lo, hi) in zip(residues, lower, upper)}
+
+
+def _sliced_selections(indexer):
+    """Sorted sliced query indices, and mask of sliced haystack atoms"""
+    n_sliced = len(indexer.atom_idx_to_residue_idx)
+    query = np.array(sorted(indexer.query), dtype=np.int64)
+    haystack_mask = np.zeros(n_sliced, dtype=bool)
+    haystack_mask[list(indexer.haystack)] = True
+    return query, haystack_mask
+
+
+class ContactContext(object):
+    """Topology-derived setup shared by contact objects.
+
+    Contexts are immutable and hashable; two contexts are equal if they
+    were made from equal topologies with the same parameters. Use
+    :func:`.get_context` to reuse existing contexts.
+
+    Parameters
+    ----------
+    topology : mdtraj.Topology
+        topology for the contact objects
+    query : frozenset of int
+        Indices of the atoms to be included as query
+    haystack : frozenset of int
+        Indices of the atoms to be included as haystack
+    n_neighbors_ignored : int
+        Number of neighboring residues (in the same chain) to ignore
+    use_atom_slice : bool
+        whether to slice the trajectory to the used atoms
+    """
+    def __init__(self, topology, query, haystack, n_neighbors_ignored,
+                 use_atom_slice):
+        self._topology = topology
+        self._fingerprint = memoized_fingerprint(topology)
+        self._query = frozenset(query)
+        self._haystack = frozenset(haystack)
+        self._n_neighbors_ignored = n_neighbors_ignored
+        self._use_atom_slice = use_atom_slice
+
+        all_atoms = sorted(self._query | self._haystack)
+        self._all_atoms = tuple(all_atoms)
+        atom_residue = _atom_residue_idxs(topology)
+        self._all_residues = frozenset(atom_residue[all_atoms].tolist())
+        Indexer = {True: AtomSlicedIndexer,
+                   False: IdentityIndexer}[use_atom_slice]
+        self._indexer = Indexer(topology, self._query, self._haystack,
+                                self._all_atoms)
+        self._exclusion = _NeighborExclusion(topology, self._indexer,
+                                             n_neighbors_ignored)
+        self._sliced_selections = _sliced_selections(self._indexer)
+
+    @property
+    def key(self):
+        """tuple : the parameters that identify this context"""
+        return (self._fingerprint, self._query, self._haystack,
+                self._n_neighbors_ignored, self._use_atom_slice)
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __eq__(self, other):
+        return isinstance(other, ContactContext) and self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    @property
+    def topology(self):
+        """mdtraj.Topology : topology of this context"""
+        return self._topology
+
+    @property
+    def fingerprint(self):
+        """str : fingerprint of the topology"""
+        return self._fingerprint
+
+    @property
+    def query(self):
+        """frozenset : indices of atoms to include as query"""
+        return self._query
+
+    @property
+    def haystack(self):
+        """frozenset : indices of atoms to include as haystack"""
+        return self._haystack
+
+    @property
+    def all_atoms(self):
+        """tuple : sorted indices of all atoms used"""
+        return self._all_atoms
+
+    @property
+    def all_residues(self):
+        """frozenset : indices of all residues used"""
+        return self._all_residues
+
+    @property
+    def n_neighbors_ignored(self):
+        """int : number of neighboring residues ignored"""
+        return self._n_neighbors_ignored
+
+    @property
+    def use_atom_slice(self):
+        """bool : whether trajectories are sliced to the used atoms"""
+        return self._use_atom_slice
+
+    @property
+    def indexer(self):
+        """
+        :class:`.AtomSlicedIndexer` or :class:`.IdentityIndexer` :
+            indexer for these atoms
+        """
+        return self._indexer
+
+    @property
+    def exclusion(self):
+        """:class:`._NeighborExclusion` : excluded neighbor residues"""
+        return self._exclusion
+
+    @property
+    def sliced_selections(self):
+        """
+        (np.array, np.array) :
+            sorted sliced query indices, and mask of sliced haystack atoms
+        """
+        return self._sliced_selections
+
+
+_contexts = collections.OrderedDict()
+_contexts_lock = threading.Lock()
+
+
+def get_context(topology, query=None, haystack=None, n_neighbors_ignored=2,
+                use_atom_slice=None):
+    """Get the (possibly cached) context for a topology and parameters.
+
+    Parameters
+    ----------
+    topology : mdtraj.Topology
+        topology for the contact objects
+    query : list of int
+        Indices of the atoms to be included as query. Default ``None``
+        means all heavy, non-water atoms.
+    haystack : list of int
+        Indices of the atoms to be included as haystack. Default ``None``
+        means all heavy, non-water atoms.
+    n_neighbors_ignored : int
+        Number of neighboring residues (in the same chain) to ignore.
+        Default 2.
+    use_atom_slice : bool
+        Whether to slice the trajectory to the used atoms. Default ``None``
+        slices if any atoms are not used.
+
+    Returns
+    -------
+    :class:`.ContactContext` :
+        context for these parameters
+    """
+    query = (_default_selection(topology) if query is None
+             else frozenset(query))
+    haystack = (_default_selection(topology) if haystack is None
+                else frozenset(haystack))
+    if use_atom_slice is None:
+        # Use if there are atoms to be sliced
+        use_atom_slice = len(query | haystack) < topology.n_atoms
+
+    key = (memoized_fingerprint(topology), query, haystack,
+           n_neighbors_ignored, use_atom_slice)
+    with _contexts_lock:
+        context = _contexts.get(key)
+        if context is not None:
+            _contexts.move_to_end(key)
+            return context
+
+    context = ContactContext(topology, query, haystack, n_neighbors_ignored,
+                             use_atom_slice)
+    with _contexts_lock:
+        _contexts[key] = context
+        while len(_contexts) > CONTEXT_CACHE_SIZE:
+            _contexts.popitem(last=False)
+    return context
+
+
+def clear_context_cache():
+    """Remove all contexts from the cache"""
+    with _contexts_lock:
+        _contexts.clear()
@@ -0,0 +1,209 @@
+"""
+Helpers for contact counters, and for the integer pair keys that store
+contacts compactly.
+
+A contact counter maps a frozenset of two (atom or residue) indices to the
+number of frames with that contact. The same pairs can be stored as integer
+keys ``low * n_objects + high``, which are used for the contacts in each
+frame: ``(keys, offsets)``, where the contacts of frame ``i`` are
+``keys[offsets[i]:offsets[i+1]]``.
+"""
+
+import collections
+import itertools
+import json
+
+import numpy as np
+
+
+def _pair_keys(first, second, n_objects):
+    """Order-independent integer keys for pairs of indices"""
+    low = np.minimum(first, second).astype(np.int64)
+    high = np.maximum(first, second).astype(np.int64)
+    return low * n_objects + high
+
+
+def _pairs_from_keys(keys, n_objects):
+    """Arrays of the (smaller, larger) indices in the pairs for keys"""
+    return keys // n_objects, keys % n_objects
+
+
+def _counter_from_keys(keys, n_objects, counts=None):
+    """Contact counter (frozenset keys) from integer pair keys.
+
+    If ``counts`` is not given, each occurrence of a key counts once.
+    """
+    if counts is None:
+        keys, counts = np.unique(keys, return_counts=True)
+    first, second = _pairs_from_keys(np.asarray(keys), n_objects)
+    pairs = zip(first.tolist(), second.tolist())
+    return collections.Counter({frozenset(pair): count
+                                for pair, count in zip(pairs,
+                                                       counts.tolist())})
+
+
+def _keys_from_counter(counter, n_objects):
+    """Integer pair keys and counts from a contact counter"""
+    pairs = np.array([sorted(pair) for pair in counter],
+                     dtype=np.int64).reshape(-1, 2)
+    counts = np.array(list(counter.values()))
+    return _pair_keys(pairs[:, 0], pairs[:, 1], n_objects), counts
+
+
+def _frame_contacts_from_counters(counters, n_objects):
+    """Per-frame contacts (keys, offsets) from one contact counter per frame
+    """
+    lengths = [len(counter) for counter in counters]
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    # both indices of every pair in every frame, as one flat array
+    indices = np.fromiter(
+        itertools.chain.from_iterable(
+            itertools.chain.from_iterable(counters)
+        ),
+        dtype=np.int64, count=2 * offsets[-1]
+    ).reshape(-1, 2)
+    return _pair_keys(indices[:, 0], indices[:, 1], n_objects), offsets
+
+
+def _unique_per_frame(frames, keys):
+    """Remove repeated keys within each frame.
+
+    Parameters
+    ----------
+    frames : np.array
+        frame number for each entry
+    keys : np.array
+        key for each entry
+
+    Returns
+    -------
+    frames, keys : np.array
+        the unique (frame, key) entries, sorted by frame
+    """
+    order = np.lexsort((keys, frames))
+    frames = frames[order]
+    keys = keys[order]
+    is_new = np.ones(len(keys), dtype=bool)
+    is_new[1:] = (keys[1:] != keys[:-1]) | (frames[1:] != frames[:-1])
+    return frames[is_new], keys[is_new]
+
+
+def _join_frame_contacts(frame_contacts):
+    """Concatenate per-frame contacts (keys, offsets) of successive blocks
+    """
+    keys = [block_keys for (block_keys, _) in frame_contacts]
+    lengths = [np.diff(offsets) for (_, offsets) in frame_contacts]
+    offsets = np.concatenate([[0], np.cumsum(np.concatenate(lengths))])
+    return (np.concatenate(keys).astype(np.int64, copy=False),
+            offsets.astype(np.int64, copy=False))
+
+
+def _subset_frame_contacts(frame_contacts, query_mask, haystack_mask,
+                           atom_residue, n_atoms, n_residues):
+    """Restrict per-frame atom contacts to a new query and haystack.
+
+    Parameters
+    ----------
+    frame_contacts : tuple of np.array
+        (keys, offsets) for the atom contacts in each frame, where the atom
+        contacts for frame ``i`` are ``keys[offsets[i]:offsets[i+1]]``
+    query_mask, haystack_mask : np.array of bool
+        whether each atom is in the new query/haystack
+    atom_residue : np.array
+        residue index for each atom
+    n_atoms, n_residues : int
+        number of atoms and residues in the topology (for the keys)
+
+    Returns
+    -------
+    frame_contacts : tuple of np.array
+        (keys, offsets) for the remaining atom contacts
+    residue_frames, residue_keys : np.array
+        frame number and residue pair key for each frame where a residue
+        contact is made
+    """
+    keys, offsets = frame_contacts
+    first, second = _pairs_from_keys(keys, n_atoms)
+    keep = ((query_mask[first] & haystack_mask[second])
+            | (query_mask[second] & haystack_mask[first]))
+    frames, frame_contacts = _mask_frame_contacts(frame_contacts, keep)
+    residue_keys = _pair_keys(atom_residue[first[keep]],
+                              atom_residue[second[keep]], n_residues)
+    residue_frames, residue_keys = _unique_per_frame(frames, residue_keys)
+    return (frame_contacts, residue_frames, residue_keys)
+
+
+def _mask_frame_contacts(frame_contacts, keep):
+    """Keep only some entries of per-frame contacts.
+
+    Returns
+    -------
+    frames : np.array
+        frame number for each kept entry
+    frame_contacts : tuple of np.array
+        (keys, offsets) for the kept entries
+    """
+    keys, offsets = frame_contacts
+    n_frames = len(offsets) - 1
+    frames = np.repeat(np.arange(n_frames), np.diff(offsets))[keep]
+    new_offsets = np.concatenate(
+        [[0], np.cumsum(np.bincount(frames, minlength=n_frames))]
+    )
+    return frames, (keys[keep], new_offsets.astype(np.int64))
+
+
+def _selection_mask(selection, n_atoms):
+    """Boolean mask over all atoms for the atom indices in ``selection``"""
+    mask = np.zeros(n_atoms, dtype=bool)
+    mask[np.asarray(list(selection), dtype=np.int64)] = True
+    return mask
+
+
+def _counter_items(counter):
+    """Hashable items of a contact counter (None if not computed)"""
+    return None if counter is None else frozenset(counter.items())
+
+
+def _combine_counters(counter, other, operation):
+    """Combine two contact counters; None if either level is missing"""
+    if counter is None or other is None:
+        return None
+    return operation(counter, other)
+
+
+def _serialize_frame_contacts(frame_contacts):
+    """JSON-serializable version of per-frame contact keys/offsets"""
+    if frame_contacts is None:
+        return None
+    keys, offsets = frame_contacts
+    return {'keys': keys.tolist(), 'offsets': offsets.tolist()}
+
+
+def _deserialize_frame_contacts(dct):
+    """Per-frame contact keys/offsets from serialized version"""
+    if dct is None:
+        return None
+    return (np.array(dct['keys'], dtype=np.int64),
+            np.array(dct['offsets'], dtype=np.int64))
+
+
+def _serialize_contact_counter(counter):
+    """JSON string from contact counter"""
+    if counter is None:
+        return None
+    # have to explicitly convert to int because json doesn't know how to
+    # serialize np.int64 objects, which we get in Python 3
+    serializable = {json.dumps([int(val) for val in key]): counter[key]
+                    for key in counter}
+    return json.dumps(serializable)
+
+
+def _deserialize_contact_counter(json_string):
+    """Contact counted from JSON string"""
+    if json_string is None:
+        return None
+    dct = json.loads(json_string)
+    counter = collections.Counter({
+        frozenset(json.loads(key)): dct[key] for key in dct
+    })
+    return counter
@@ -4,10 +4,13 @@ Implementation of ContactFrequency parallelization using dask.distributed
 
 from . import frequency_task
 from .contact_map import ContactFrequency, ContactObject
+from .checkpoint import file_fingerprint
+from .blocks import serialize_block, sum_blocks
+from .options import ExecutionOptions
 import mdtraj as md
 
 
-def dask_run(trajectory, client, run_info):
+def dask_run(trajectory, client, run_info, checkpoint=None, key=None):
     """
     Runs dask version of ContactFrequency. Note that this API on this will
     definitely change before the release.
@@ -21,12 +24,22 @@ def dask_run(trajectory, client, run_info):
         keys are 'trajectory_file' (trajectory filename), 'load_kwargs'
         (additional kwargs passed to md.load), and 'parameters' (dict of
         kwargs for the ContactFrequency object)
+    checkpoint : :class:`.ContactCheckpoint`
+        if given, the result of each task is written to this checkpoint as
+        it finishes, and blocks already in the checkpoint are skipped
+    key : str
+        identifier for this calculation in the checkpoint; required if
+        ``checkpoint`` is given
 
     Returns
     -------
     :class:`.ContactFrequency` :
         total contact frequency for the trajectory
     """
+    if checkpoint is not None:
+        return _checkpointed_dask_run(trajectory, client, run_info,
+                                      checkpoint, key)
+
     slices = frequency_task.default_slices(n_total=len(trajectory),
                                            n_workers=len(client.ncores()))
 
@@ -40,6 +53,34 @@ def dask_run(trajectory, client, run_info):
     return freq.result()
 
 
+def _checkpointed_dask_run(trajectory, client, run_info, checkpoint, key):
+    """Dask run where each task covers one checkpoint block"""
+    from dask.distributed import as_completed
+    slices = checkpoint.missing_slices(key, len(trajectory))
+    subtrajs = client.map(frequency_task.load_trajectory_task, slices,
+                          file_name=run_info['trajectory_file'],
+                          **run_info['load_kwargs'])
+    maps = client.map(frequency_task.map_task, subtrajs,
+                      parameters=run_info['parameters'])
+    block_for_task = {task.key: block for task, block in zip(maps, slices)}
+    for task in as_completed(maps):
+        block_freq = task.result()
+        payload = serialize_block(block_freq._atom_contacts,
+                                  block_freq._residue_contacts)
+        checkpoint.record(key, block_for_task[task.key], payload)
+
+    blocks = checkpoint.results(key, len(trajectory))
+    atom_contacts, residue_contacts, _ = sum_blocks(blocks)
+    parameters = dict(run_info['parameters'])
+    # from_contacts infers the levels, and does no neighbor search
+    parameters.pop('contacts', None)
+    ExecutionOptions.from_kwargs(parameters)
+    return ContactFrequency.from_contacts(
+        atom_contacts, residue_contacts, n_frames=len(trajectory),
+        topology=trajectory.topology, **parameters
+    )
+
+
 class DaskContactFrequency(ContactFrequency):
     """Dask-based parallelization of contact frequency.
 
@@ -78,30 +119,56 @@ class DaskContactFrequency(ContactFrequency):
     n_neighbors_ignored : int
         Number of neighboring residues (in the same chain) to ignore.
         Default 2.
+    contacts : tuple of str
+        Which contacts to compute: any of ``"atom"`` and ``"residue"``.
+        Default computes both; see :class:`.ContactFrequency`.
+    kwargs :
+        Execution options (see :class:`.ExecutionOptions`), and additional
+        parameters for :func:`mdtraj.load`. With a checkpoint, the result
+        of each task is written to it, and blocks of frames that are
+        already in it are not recalculated; the checkpoint is keyed on the
+        file name, size, and modification time. The ``engine``,
+        ``residue_prefilter``, and ``n_threads`` are used by the workers.
     """
     def __init__(self, client, filename, query=None, haystack=None,
-                 cutoff=0.45, n_neighbors_ignored=2, **kwargs):
+                 cutoff=0.45, n_neighbors_ignored=2,
+                 contacts=("atom", "residue"), **kwargs):
         self.client = client
         self.filename = filename
+        options = ExecutionOptions.from_kwargs(kwargs)
         trajectory = md.load(filename, **kwargs)
 
         self.kwargs = kwargs
 
         super(DaskContactFrequency, self).__init__(
             trajectory, query, haystack, cutoff, n_neighbors_ignored,
+            contacts=contacts, **vars(options)
         )
 
+    def _input_identity(self, trajectory):
+        return file_fingerprint(self.filename, **self.kwargs)
+
     def _build_contact_map(self, trajectory):
-        freq = dask_run(trajectory, self.client, self.run_info)
+        checkpoint = self._options.checkpoint
+        key = None
+        if checkpoint is not None:
+            key = self._calculation_key(self._build_kind(),
+                                        self._input_identity(trajectory))
+        freq = dask_run(trajectory, self.client, self.run_info,
+                        checkpoint, key)
         self._frames = freq.n_frames
-        return (freq._atom_contacts, freq._residue_contacts)
+        return (freq._atom_contacts, freq._residue_contacts, None)
 
     @property
     def parameters(self):
         return {'query': self.query,
                 'haystack': self.haystack,
                 'cutoff': self.cutoff,
-                'n_neighbors_ignored': self.n_neighbors_ignored}
+                'n_neighbors_ignored': self.n_neighbors_ignored,
+                'contacts': self._contact_levels,
+                'engine': self._options.engine,
+                'residue_prefilter': self._options.residue_prefilter,
+                'n_threads': self._options.n_threads}
 
     @property
     def run_info(self):
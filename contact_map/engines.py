@@ -0,0 +1,345 @@
+"""
+Neighbor search engines.
+
+An engine finds the pairs of query and haystack atoms that are within a
+cutoff of each other in a single frame. Engines are registered by name, so
+that contact objects can be created with, for example,
+``ContactFrequency(traj, engine="kdtree")``. The available engines are:
+
+* ``"mdtraj"``: :func:`mdtraj.compute_neighborlist` (the default)
+* ``"kdtree"``: :class:`scipy.spatial.cKDTree`, with periodic boxes
+* ``"cell_list"``: the vectorized cell list from
+  :mod:`contact_map.neighbor_search`
+* ``"numba"``: a cell list compiled with Numba (if Numba is installed)
+* ``"auto"``: chooses one of the above, based on system size and a quick
+  timing of the candidates on the first frame searched
+
+The ``kdtree``, ``cell_list``, and ``numba`` engines support orthorhombic
+periodic boxes (using the minimum image); for other boxes, they fall back to
+the ``mdtraj`` engine. New engines can be added by subclassing
+:class:`.NeighborSearchEngine` and decorating the class with
+:func:`.register_engine`.
+"""
+
+import time
+
+import numpy as np
+import mdtraj as md
+from scipy.spatial import cKDTree
+
+from .neighbor_search import (cell_grid, cell_ids, cell_list_pairs,
+                              minimum_image)
+
+try:
+    import numba
+except ImportError:
+    HAS_NUMBA = False
+else:
+    HAS_NUMBA = True
+
+
+ENGINES = {}
+
+
+def register_engine(engine_class):
+    """Class decorator to register a neighbor search engine by its name"""
+    ENGINES[engine_class.name] = engine_class
+    return engine_class
+
+
+def available_engines():
+    """list of str : names of the engines that can be used here"""
+    return [name for (name, engine_class) in ENGINES.items()
+            if engine_class.is_available()]
+
+
+def get_engine(engine):
+    """Engine instance from an engine name (or instance).
+
+    Parameters
+    ----------
+    engine : str or :class:`.NeighborSearchEngine`
+        name of a registered engine, or an engine instance
+
+    Returns
+    -------
+    :class:`.NeighborSearchEngine` :
+        the engine
+    """
+    if isinstance(engine, NeighborSearchEngine):
+        return engine
+    try:
+        engine_class = ENGINES[engine]
+    except KeyError:
+        raise RuntimeError("Unknown neighbor search engine: " + str(engine)
+                           + ". Registered engines are: "
+                           + ", ".join(ENGINES))
+    if not engine_class.is_available():  # pragma: no cover
+        raise ImportError("Neighbor search engine '" + engine_class.name
+                          + "' is not available; it needs "
+                          + engine_class.requires)
+    return engine_class()
+
+
+def frame_box(trajectory, frame_number):
+    """Unit cell vectors of a frame; None if not periodic"""
+    if trajectory.unitcell_vectors is None:
+        return None
+    return trajectory.unitcell_vectors[frame_number]
+
+
+def _orthorhombic_lengths(box):
+    """Box lengths, if the unit cell vectors are orthorhombic, else None"""
+    lengths = np.diag(box)
+    if np.allclose(box, np.diag(lengths)):
+        return lengths
+    return None
+
+
+class NeighborSearchEngine(object):
+    """Superclass for neighbor search engines.
+
+    Subclasses set the registry ``name`` and implement :meth:`._search`.
+    Engines that only handle orthorhombic boxes set ``orthorhombic_only``;
+    other boxes are then searched with the ``mdtraj`` engine.
+    """
+    name = None
+    requires = None
+    orthorhombic_only = False
+
+    @classmethod
+    def is_available(cls):
+        """Whether the dependencies for this engine are installed"""
+        return True
+
+    def search(self, xyz, box, query, haystack, cutoff):
+        """Query/haystack atom pairs within the cutoff in one frame.
+
+        Parameters
+        ----------
+        xyz : np.array
+            (n_atoms, 3) coordinates of the atoms
+        box : np.array or None
+            (3, 3) unit cell vectors; None means not periodic
+        query : np.array
+            sorted indices of the query atoms
+        haystack : np.array
+            sorted indices of the haystack atoms
+        cutoff : float
+            cutoff distance
+
+        Returns
+        -------
+        first, second : np.array
+            query and haystack atom indices of each pair within the cutoff;
+            pairs of an atom with itself are not included, and a pair may
+            be found more than once
+        """
+        lengths = None
+        if box is not None:
+            lengths = _orthorhombic_lengths(box)
+            if lengths is None and self.orthorhombic_only:
+                return ENGINES['mdtraj']().search(xyz, box, query, haystack,
+                                                  cutoff)
+        return self._search(xyz, box, lengths, query, haystack, cutoff)
+
+    def _search(self, xyz, box, lengths, query, haystack, cutoff):
+        """Engine-specific search; ``lengths`` are the orthorhombic box
+        lengths (None if not periodic or not orthorhombic)"""
+        raise NotImplementedError()
+
+
+@register_engine
+class MDTrajEngine(NeighborSearchEngine):
+    """Neighbor search with :func:`mdtraj.compute_neighborlist`"""
+    name = "mdtraj"
+
+    def _search(self, xyz, box, lengths, query, haystack, cutoff):
+        frame = md.Trajectory(xyz[np.newaxis], topology=None)
+        if box is not None:
+            frame.unitcell_vectors = box[np.newaxis]
+        neighborlist = md.compute_neighborlist(frame, cutoff, 0)
+        neighbors = [neighborlist[atom_idx] for atom_idx in query]
+        n_neighbors = np.fromiter((len(n) for n in neighbors),
+                                  dtype=np.int64, count=len(query))
+        first = np.repeat(query, n_neighbors)
+        second = np.concatenate(neighbors + [np.zeros(0, dtype=np.int64)])
+        is_haystack = np.zeros(len(xyz), dtype=bool)
+        is_haystack[haystack] = True
+        in_haystack = is_haystack[second]
+        return first[in_haystack], second[in_haystack]
+
+
+@register_engine
+class KDTreeEngine(NeighborSearchEngine):
+    """Neighbor search with :class:`scipy.spatial.cKDTree`"""
+    name = "kdtree"
+    orthorhombic_only = True
+
+    def _search(self, xyz, box, lengths, query, haystack, cutoff):
+        points = np.asarray(xyz, dtype=np.float64)
+        if lengths is not None:
+            lengths = np.asarray(lengths, dtype=np.float64)
+            points = points % lengths
+            # rounding can put points exactly on the upper edge
+            points[points >= lengths] = 0.0
+        query_tree = cKDTree(points[query], boxsize=lengths)
+        haystack_tree = cKDTree(points[haystack], boxsize=lengths)
+        found = query_tree.sparse_distance_matrix(haystack_tree, cutoff,
+                                                  output_type='ndarray')
+        first = query[found['i']]
+        second = haystack[found['j']]
+        not_self = first != second
+        return first[not_self], second[not_self]
+
+
+@register_engine
+class CellListEngine(NeighborSearchEngine):
+    """Neighbor search with the vectorized NumPy cell list"""
+    name = "cell_list"
+    orthorhombic_only = True
+
+    def _search(self, xyz, box, lengths, query, haystack, cutoff):
+        atoms = np.union1d(query, haystack)
+        first, second = cell_list_pairs(xyz[atoms], cutoff, lengths)
+        delta = minimum_image(xyz[atoms[first]] - xyz[atoms[second]],
+                              lengths)
+        near = np.einsum('ij,ij->i', delta, delta) <= cutoff * cutoff
+        first = atoms[first[near]]
+        second = atoms[second[near]]
+        is_query = np.zeros(len(xyz), dtype=bool)
+        is_query[query] = True
+        is_haystack = np.zeros(len(xyz), dtype=bool)
+        is_haystack[haystack] = True
+        forward = is_query[first] & is_haystack[second]
+        backward = is_query[second] & is_haystack[first]
+        return (np.concatenate([first[forward], second[backward]]),
+                np.concatenate([second[forward], first[backward]]))
+
+
+if HAS_NUMBA:
+    @numba.njit
+    def _numba_cell_search(xyz, query, query_cells, haystack_sorted,
+                           sorted_ids, n_cells, lengths, periodic, cutoff_sq,
+                           out_first, out_second, fill):
+        """Count (or, with ``fill``, store) the pairs within the cutoff"""
+        n_found = 0
+        for q_idx in range(len(query)):
+            atom = query[q_idx]
+            for dx in range(-1, 2):
+                cx = query_cells[q_idx, 0] + dx
+                if periodic:
+                    cx %= n_cells[0]
+                elif cx < 0 or cx >= n_cells[0]:
+                    continue
+                for dy in range(-1, 2):
+                    cy = query_cells[q_idx, 1] + dy
+                    if periodic:
+                        cy %= n_cells[1]
+                    elif cy < 0 or cy >= n_cells[1]:
+                        continue
+                    for dz in range(-1, 2):
+                        cz = query_cells[q_idx, 2] + dz
+                        if periodic:
+                            cz %= n_cells[2]
+                        elif cz < 0 or cz >= n_cells[2]:
+                            continue
+                        cell = (cx * n_cells[1] + cy) * n_cells[2] + cz
+                        start = np.searchsorted(sorted_ids, cell)
+                        stop = np.searchsorted(sorted_ids, cell,
+                                               side='right')
+                        for k in range(start, stop):
+                            other = haystack_sorted[k]
+                            if other == atom:
+                                continue
+                            dist_sq = 0.0
+                            for dim in range(3):
+                                delta = xyz[atom, dim] - xyz[other, dim]
+                                if periodic:
+                                    delta -= (lengths[dim]
+                                              * np.round(delta
+                                                         / lengths[dim]))
+                                dist_sq += delta * delta
+                            if dist_sq <= cutoff_sq:
+                                if fill:
+                                    out_first[n_found] = atom
+                                    out_second[n_found] = other
+                                n_found += 1
+        return n_found
+
+
+@register_engine
+class NumbaEngine(NeighborSearchEngine):
+    """Neighbor search with a cell list compiled by Numba"""
+    name = "numba"
+    requires = "numba"
+    orthorhombic_only = True
+
+    @classmethod
+    def is_available(cls):
+        return HAS_NUMBA
+
+    def _search(self, xyz, box, lengths, query, haystack, cutoff):
+        xyz = np.asarray(xyz, dtype=np.float64)
+        atoms = np.union1d(query, haystack)
+        cells = np.zeros((len(xyz), 3), dtype=np.int64)
+        cells[atoms], n_cells = cell_grid(xyz[atoms], cutoff, lengths)
+        ids = cell_ids(cells[haystack], n_cells)
+        order = np.argsort(ids, kind='stable')
+        periodic = lengths is not None
+        lengths = (np.asarray(lengths, dtype=np.float64) if periodic
+                   else np.ones(3))
+        args = (xyz, np.asarray(query, dtype=np.int64), cells[query],
+                np.asarray(haystack, dtype=np.int64)[order], ids[order],
+                n_cells, lengths, periodic, float(cutoff) ** 2)
+        empty = np.zeros(0, dtype=np.int64)
+        n_found = _numba_cell_search(*(args + (empty, empty, False)))
+        first = np.empty(n_found, dtype=np.int64)
+        second = np.empty(n_found, dtype=np.int64)
+        _numba_cell_search(*(args + (first, second, True)))
+        return first, second
+
+
+@register_engine
+class AutoEngine(NeighborSearchEngine):
+    """Engine that chooses among the others.
+
+    Small systems use the ``mdtraj`` engine. For larger systems, each
+    available engine is timed on the first frame searched, and the fastest
+    one is used from then on. The choice is remembered for systems of the
+    same size and selections, so calibration happens once per process.
+    """
+    name = "auto"
+    small_system = 5000
+    candidates = ("mdtraj", "kdtree", "cell_list", "numba")
+    _choices = {}
+
+    def __init__(self):
+        self.engine = None
+
+    def _search(self, xyz, box, lengths, query, haystack, cutoff):
+        if self.engine is None:
+            self.engine = self._select(xyz, box, query, haystack, cutoff)
+        return self.engine.search(xyz, box, query, haystack, cutoff)
+
+    def _select(self, xyz, box, query, haystack, cutoff):
+        """Choose the engine, timing the candidates if needed"""
+        if len(xyz) < self.small_system:
+            return MDTrajEngine()
+        key = (len(xyz), len(query), len(haystack), float(cutoff),
+               box is None)
+        name = self._choices.get(key)
+        if name is None:
+            timings = {}
+            for candidate in self.candidates:
+                if not ENGINES[candidate].is_available():
+                    continue
+                engine = ENGINES[candidate]()
+                # first call is a warm-up (e.g., for JIT compilation)
+                engine.search(xyz, box, query, haystack, cutoff)
+                start = time.perf_counter()
+                engine.search(xyz, box, query, haystack, cutoff)
+                timings[candidate] = time.perf_counter() - start
+            name = min(timings, key=timings.get)
+            self._choices[key] = name
+        return ENGINES[name]()
@@ -0,0 +1,185 @@
+"""
+Contact frequencies derived from existing ones.
+
+These reuse what a :class:`.ContactFrequency` already has -- its stored
+counts, or the setup derived from its topology and selections -- instead of
+starting over from the trajectory. They implement the corresponding
+:class:`.ContactFrequency` methods.
+"""
+
+import collections
+
+import numpy as np
+import mdtraj as md
+
+from .atom_indexer import _atom_residue_idxs as _atom_residue_array
+from .counters import (_pairs_from_keys, _counter_from_keys,
+                       _keys_from_counter, _subset_frame_contacts,
+                       _mask_frame_contacts, _selection_mask)
+from .blocks import merge_counts
+from .options import ExecutionOptions
+from .topology import _beyond_neighbors
+
+
+def frequencies_for_cutoffs(cls, trajectory, cutoffs, query=None,
+                            haystack=None, n_neighbors_ignored=2,
+                            engine="mdtraj"):
+    """Contact frequencies for several cutoffs in a single pass.
+
+    See :meth:`.ContactFrequency.from_cutoffs`.
+    """
+    cutoffs = sorted(set(cutoffs))
+    max_cutoff = cutoffs[-1]
+    n_frames = len(trajectory)
+    # empty map at the largest cutoff, to set up indexer and exclusions
+    template = cls.from_contacts(
+        collections.Counter(), collections.Counter(), n_frames=n_frames,
+        topology=trajectory.topology, query=query, haystack=haystack,
+        cutoff=max_cutoff, n_neighbors_ignored=n_neighbors_ignored
+    )
+    template._execution_options = ExecutionOptions(engine=engine)
+    counts = {cutoff: (collections.Counter(), collections.Counter())
+              for cutoff in cutoffs}
+    for _, sliced in template.indexer.slice_blocks(trajectory):
+        for frame_num in range(len(sliced)):
+            first, second = template._search_pairs(sliced, frame_num,
+                                                   max_cutoff)
+            if not len(first):
+                continue
+
+            pairs = np.stack([first, second], axis=1)
+            frame = sliced.slice(frame_num, copy=False)
+            distances = md.compute_distances(frame, pairs)[0]
+            for cutoff in cutoffs:
+                if cutoff == max_cutoff:
+                    in_contact = np.ones(len(pairs), dtype=bool)
+                else:
+                    in_contact = distances < cutoff
+                atom_contacts, residue_contacts = \
+                        template._contact_counters(first[in_contact],
+                                                   second[in_contact])
+                counts[cutoff][0].update(atom_contacts)
+                counts[cutoff][1].update(residue_contacts)
+
+    return {
+        cutoff: cls.from_contacts(
+            atom_contacts=template.indexer.convert_atom_contacts(
+                counts[cutoff][0]
+            ),
+            residue_contacts=counts[cutoff][1],
+            n_frames=n_frames,
+            topology=template.topology,
+            query=template.query,
+            haystack=template.haystack,
+            cutoff=cutoff,
+            n_neighbors_ignored=n_neighbors_ignored,
+            indexer=template.indexer
+        )
+        for cutoff in cutoffs
+    }
+
+
+def extend_frequency(frequency, trajectory):
+    """Add the contacts from new frames to a contact frequency, in place.
+
+    See :meth:`.ContactFrequency.extend`.
+    """
+    if trajectory.n_atoms != frequency.topology.n_atoms:
+        raise RuntimeError("Trajectory has " + str(trajectory.n_atoms)
+                           + " atoms; expected "
+                           + str(frequency.topology.n_atoms))
+    if getattr(frequency, '_store_frames', None) is None:
+        # made by from_dict: keep storing frames if there are any
+        frequency._store_frames = \
+                getattr(frequency, '_frame_contacts', None) is not None
+    new_contacts = frequency._count_contacts(trajectory,
+                                             slice(0, len(trajectory)))
+    old_contacts = (frequency._atom_contacts, frequency._residue_contacts,
+                    getattr(frequency, '_frame_contacts', None))
+    (frequency._atom_contacts, frequency._residue_contacts,
+     frequency._frame_contacts) = merge_counts([old_contacts, new_contacts])
+    frequency._n_frames += len(trajectory)
+
+
+def frequency_with_neighbors_ignored(frequency, n_neighbors_ignored):
+    """Contact frequency ignoring more neighboring residues.
+
+    See :meth:`.ContactFrequency.with_neighbors_ignored`.
+    """
+    if n_neighbors_ignored < frequency.n_neighbors_ignored:
+        raise RuntimeError("Can not reduce n_neighbors_ignored from "
+                           "{0} to {1}: contacts between those "
+                           "neighbors were not calculated."
+                           .format(frequency.n_neighbors_ignored,
+                                   n_neighbors_ignored))
+    topology = frequency.topology
+    n_atoms = topology.n_atoms
+    n_residues = topology.n_residues
+    atom_residue = _atom_residue_array(topology)
+
+    def filtered(counter, residue_of, n_objects):
+        if counter is None:
+            return None
+        keys, counts = _keys_from_counter(counter, n_objects)
+        first, second = _pairs_from_keys(keys, n_objects)
+        keep = _beyond_neighbors(topology, residue_of[first],
+                                 residue_of[second], n_neighbors_ignored)
+        return _counter_from_keys(keys[keep], n_objects, counts[keep])
+
+    result = frequency.from_contacts(
+        atom_contacts=filtered(frequency._atom_contacts, atom_residue,
+                               n_atoms),
+        residue_contacts=filtered(frequency._residue_contacts,
+                                  np.arange(n_residues), n_residues),
+        n_frames=frequency.n_frames,
+        topology=topology,
+        query=frequency.query,
+        haystack=frequency.haystack,
+        cutoff=frequency.cutoff,
+        n_neighbors_ignored=n_neighbors_ignored,
+        indexer=getattr(frequency, 'indexer', None)
+    )
+    frame_contacts = getattr(frequency, '_frame_contacts', None)
+    if frame_contacts is not None:
+        first, second = _pairs_from_keys(frame_contacts[0], n_atoms)
+        keep = _beyond_neighbors(topology, atom_residue[first],
+                                 atom_residue[second], n_neighbors_ignored)
+        _, result._frame_contacts = _mask_frame_contacts(frame_contacts,
+                                                         keep)
+    return result
+
+
+def subset_frequency(frequency, query=None, haystack=None):
+    """Contact frequency restricted to new query/haystack selections.
+
+    See :meth:`.ContactFrequency.subset`.
+    """
+    query, haystack = frequency._subset_selections(query, haystack)
+    frame_contacts = getattr(frequency, '_frame_contacts', None)
+    if frame_contacts is None:
+        raise RuntimeError("Residue contacts can only be recounted for "
+                           "a subset if the contact frequency was made "
+                           "with store_frames=True.")
+    topology = frequency.topology
+    n_atoms = topology.n_atoms
+    n_residues = topology.n_residues
+    frame_contacts, _, residue_keys = _subset_frame_contacts(
+        frame_contacts,
+        query_mask=_selection_mask(query, n_atoms),
+        haystack_mask=_selection_mask(haystack, n_atoms),
+        atom_residue=_atom_residue_array(topology),
+        n_atoms=n_atoms,
+        n_residues=n_residues
+    )
+    subset = frequency.from_contacts(
+        atom_contacts=_counter_from_keys(frame_contacts[0], n_atoms),
+        residue_contacts=_counter_from_keys(residue_keys, n_residues),
+        n_frames=frequency.n_frames,
+        topology=topology,
+        query=query,
+        haystack=haystack,
+        cutoff=frequency.cutoff,
+        n_neighbors_ignored=frequency.n_neighbors_ignored
+    )
+    subset._frame_contacts = frame_contacts
+    return subset
@@ -0,0 +1,230 @@
+"""
+Contact lifetimes: how long contacts last once they form.
+
+The lifetimes are found by run-length encoding whether each contact is
+present in each frame. The frames can be added a block at a time (e.g., as
+they are read from a long trajectory); runs that continue from one block to
+the next are joined.
+"""
+
+import numpy as np
+
+
+class ContactLifetimes(object):
+    """Lifetime statistics for a set of contacts.
+
+    Frames are added with :meth:`.add`; usually this object is created from
+    a concurrence, with :meth:`.from_concurrence` or
+    :attr:`.Concurrence.lifetimes`.
+
+    Runs that start in the first frame or are still going in the last frame
+    are "truncated": the contact may have lasted longer than the trajectory
+    shows. Most statistics can include or exclude these runs.
+
+    Parameters
+    ----------
+    n_contacts : int
+        number of contacts
+    labels : list of string
+        labels for each contact (optional)
+    """
+    def __init__(self, n_contacts, labels=None):
+        self.labels = labels
+        self.n_frames = 0
+        self._n_contacts = n_contacts
+        self._n_present = np.zeros(n_contacts, dtype=np.int64)
+        self._in_first_frame = np.zeros(n_contacts, dtype=np.int64)
+        # runs still going at the end of the frames added so far
+        self._open_length = np.zeros(n_contacts, dtype=np.int64)
+        # completed runs: contact index, length, whether it started at 0
+        self._contact_idx = []
+        self._lengths = []
+        self._from_start = []
+
+    @classmethod
+    def from_concurrence(cls, concurrence, chunk_size=2**16):
+        """Lifetimes from a :class:`.Concurrence`.
+
+        Parameters
+        ----------
+        concurrence : :class:`.Concurrence`
+            whether each contact is present in each frame
+        chunk_size : int
+            number of frames unpacked at a time; rounded up to a multiple
+            of 8. Default 65536.
+
+        Returns
+        -------
+        :class:`.ContactLifetimes` :
+            lifetimes for the contacts in the concurrence
+        """
+        lifetimes = cls(concurrence.n_contacts, labels=concurrence.labels)
+        n_chunk_frames = 8 * max(1, -(-chunk_size // 8))
+        packed = concurrence._packed
+        for start in range(0, concurrence.n_frames, n_chunk_frames):
+            n_block_frames = min(n_chunk_frames,
+                                 concurrence.n_frames - start)
+            block = packed[:, start // 8:(start + n_block_frames + 7) // 8]
+            lifetimes.add(np.unpackbits(block, axis=1,
+                                        count=n_block_frames).astype(bool))
+        return lifetimes
+
+    def add(self, values):
+        """Add the next block of frames.
+
+        Parameters
+        ----------
+        values : np.array
+            boolean array, shape (n_contacts, n_block_frames): whether each
+            contact is present in each of the new frames
+        """
+        values = np.asarray(values, dtype=bool)
+        n_block = values.shape[-1] if values.ndim else 0
+        values = values.reshape(self._n_contacts, n_block)
+        if self.n_frames == 0 and n_block > 0:
+            self._in_first_frame = values[:, 0].astype(np.int64)
+        was_open = self._open_length > 0
+        padded = np.concatenate([was_open[:, np.newaxis], values,
+                                 np.zeros((self._n_contacts, 1), dtype=bool)],
+                                axis=1)
+        changes = np.diff(padded.astype(np.int8), axis=1)
+        # columns are frames within the block
+        start_rows, start_cols = np.nonzero(changes == 1)
+        stop_rows, stop_cols = np.nonzero(changes == -1)
+
+        # runs continuing from earlier blocks start before this block
+        open_rows = np.nonzero(was_open)[0]
+        start_rows = np.concatenate([open_rows, start_rows])
+        start_cols = np.concatenate([-self._open_length[open_rows],
+                                     start_cols])
+        order = np.lexsort((start_cols, start_rows))
+        start_rows, start_cols = start_rows[order], start_cols[order]
+        # nonzero gives row-major order, so starts and stops now match up
+        lengths = stop_cols - start_cols
+
+        # runs reaching the padding column are still going
+        is_open = stop_cols == n_block
+        self._open_length = np.zeros(self._n_contacts, dtype=np.int64)
+        self._open_length[stop_rows[is_open]] = lengths[is_open]
+
+        done = ~is_open
+        self._contact_idx.append(stop_rows[done])
+        self._lengths.append(lengths[done])
+        self._from_start.append(self.n_frames + start_cols[done] == 0)
+        self._n_present += values.sum(axis=1)
+        self.n_frames += n_block
+
+    def _runs(self, include_truncated=True):
+        """Contact index and length of each run (including the runs that
+        are still going)"""
+        open_rows = np.nonzero(self._open_length)[0]
+        contact_idx = np.concatenate(self._contact_idx + [open_rows])
+        lengths = np.concatenate(self._lengths
+                                 + [self._open_length[open_rows]])
+        if not include_truncated:
+            from_start = np.concatenate(
+                self._from_start + [np.ones(len(open_rows), dtype=bool)]
+            )
+            contact_idx = contact_idx[~from_start]
+            lengths = lengths[~from_start]
+        return contact_idx.astype(np.int64), lengths.astype(np.int64)
+
+    def lifetimes(self, include_truncated=True):
+        """Length (in frames) of each run of each contact.
+
+        Parameters
+        ----------
+        include_truncated : bool
+            whether to include runs that start in the first frame or last
+            until the last frame. Default True.
+
+        Returns
+        -------
+        list of np.array :
+            for each contact, the lengths of its runs, in frame order
+        """
+        if self._n_contacts == 0:
+            return []
+        contact_idx, lengths = self._runs(include_truncated)
+        order = np.argsort(contact_idx, kind='stable')
+        splits = np.searchsorted(contact_idx[order],
+                                 np.arange(1, self._n_contacts))
+        return np.split(lengths[order], splits)
+
+    def mean_lifetimes(self, include_truncated=True):
+        """Mean length (in frames) of the runs of each contact.
+
+        Parameters
+        ----------
+        include_truncated : bool
+            whether to include truncated runs. Default True.
+
+        Returns
+        -------
+        np.array :
+            mean lifetime for each contact; NaN if there are no runs
+        """
+        contact_idx, lengths = self._runs(include_truncated)
+        total = np.bincount(contact_idx, weights=lengths,
+                            minlength=self._n_contacts)
+        n_runs = np.bincount(contact_idx, minlength=self._n_contacts)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return total / n_runs
+
+    def _n_runs(self):
+        """Number of runs of each contact, including truncated runs"""
+        return np.bincount(self._runs(True)[0], minlength=self._n_contacts)
+
+    @property
+    def n_formed(self):
+        """np.array : number of times each contact forms (runs that start
+        after the first frame)"""
+        return self._n_runs() - self._in_first_frame
+
+    @property
+    def n_broken(self):
+        """np.array : number of times each contact breaks (runs that end
+        before the last frame)"""
+        return self._n_runs() - (self._open_length > 0)
+
+    @property
+    def formation_rates(self):
+        """np.array : times each contact forms, per frame without the
+        contact; NaN if the contact is always present"""
+        n_absent = self.n_frames - self._n_present
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.n_formed / n_absent
+
+    @property
+    def breaking_rates(self):
+        """np.array : times each contact breaks, per frame with the
+        contact; NaN if the contact is never present"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.n_broken / self._n_present
+
+    def survival(self, include_truncated=True):
+        """Survival function for the runs of each contact.
+
+        Parameters
+        ----------
+        include_truncated : bool
+            whether to include truncated runs. Default True.
+
+        Returns
+        -------
+        np.array :
+            shape (n_contacts, max_lifetime + 1); element ``[i, t]`` is the
+            fraction of the runs of contact ``i`` that last more than ``t``
+            frames (so ``[i, 0]`` is 1). Rows for contacts without runs are
+            NaN.
+        """
+        contact_idx, lengths = self._runs(include_truncated)
+        max_length = lengths.max() if len(lengths) else 0
+        counts = np.bincount(contact_idx * (max_length + 1) + lengths,
+                             minlength=self._n_contacts * (max_length + 1))
+        counts = counts.reshape(self._n_contacts, max_length + 1)
+        # runs longer than t: total minus runs of length <= t
+        n_runs = counts.sum(axis=1)
+        longer = n_runs[:, np.newaxis] - np.cumsum(counts, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return longer / n_runs[:, np.newaxis]
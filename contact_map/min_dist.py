@@ -1,6 +1,11 @@
 import collections
 import itertools
+import numpy as np
 import mdtraj as md
+from scipy.spatial import cKDTree
+
+from .engines import frame_box, get_engine, _orthorhombic_lengths
+from .atom_indexer import _atom_residue_idxs
 
 class NearestAtoms(object):
     """
@@ -23,6 +28,9 @@ class NearestAtoms(object):
         the atom for the key atom_index. Default is ``None``, which ignores
         all atoms in the same residue. Passing an empty dict, ``{}``, will
         result in all atom pairs being considered
+    engine : str or :class:`.NeighborSearchEngine`
+        neighbor search engine used to find the atoms within the cutoff;
+        see :mod:`contact_map.engines`. Default ``"mdtraj"``.
 
 
     Attributes
@@ -36,37 +44,108 @@ class NearestAtoms(object):
     # TODO: this can probably be refactored to match the behavior of the
     # mindist object; can't be fully removed because this will be a more
     # expensive calc
-    def __init__(self, trajectory, cutoff, frame_number=0, excluded=None):
+    def __init__(self, trajectory, cutoff, frame_number=0, excluded=None,
+                 engine="mdtraj"):
         self.cutoff = cutoff
         self.frame_number = frame_number
+        self.engine = engine
         self.excluded = self._parse_excluded(excluded, trajectory)
         self.nearest, self.nearest_distance = \
                 self._calculate_nearest(trajectory, self.cutoff,
-                                        self.frame_number, self.excluded)
+                                        self.frame_number, self.excluded,
+                                        self.engine)
+
+    @staticmethod
+    def _neighbor_pairs(trajectory, cutoff, frame_number, engine="mdtraj"):
+        """Pairs of atoms within the cutoff, using ``engine``.
+
+        Each pair is included in both directions, once, ordered by the
+        first atom.
+        """
+        n_atoms = trajectory.n_atoms
+        atoms = np.arange(n_atoms)
+        first, second = get_engine(engine).search(
+            trajectory.xyz[frame_number], frame_box(trajectory, frame_number),
+            atoms, atoms, cutoff
+        )
+        keys = np.unique(np.concatenate([first * n_atoms + second,
+                                         second * n_atoms + first]))
+        return keys // n_atoms, keys % n_atoms
+
+    @staticmethod
+    def _excluded_keys(excluded, n_atoms):
+        """Sorted integer keys (``atom * n_atoms + excluded_atom``) for the
+        excluded pairs"""
+        atoms = np.fromiter(excluded.keys(), dtype=np.int64,
+                            count=len(excluded))
+        n_excluded = [len(excl) for excl in excluded.values()]
+        excluded_atoms = np.concatenate(
+            [np.asarray(excl, dtype=np.int64) for excl in excluded.values()]
+            + [np.zeros(0, dtype=np.int64)]
+        )
+        return np.unique(np.repeat(atoms, n_excluded) * n_atoms
+                         + excluded_atoms)
+
+    @staticmethod
+    def _nearest_of_pairs(first, second, distances):
+        """Nearest ``second`` atom for each ``first`` atom.
+
+        Ties in distance go to the smaller atom index.
+
+        Returns
+        -------
+        atoms, nearest, nearest_distance : np.array
+            each atom with a neighbor, its nearest neighbor, and the
+            distance to it
+        """
+        order = np.lexsort((second, distances, first))
+        first = first[order]
+        # the nearest neighbor is first in each segment of the same atom
+        is_nearest = np.ones(len(first), dtype=bool)
+        is_nearest[1:] = first[1:] != first[:-1]
+        return (first[is_nearest], second[order][is_nearest],
+                distances[order][is_nearest])
+
+    @staticmethod
+    def _frame_nearest(trajectory, cutoff, frame_number, excluded_keys,
+                       engine="mdtraj"):
+        """Nearest allowed neighbor of each atom in one frame.
+
+        Parameters
+        ----------
+        excluded_keys : np.array
+            excluded pairs, from :meth:`._excluded_keys`
+
+        Returns
+        -------
+        atoms, nearest, nearest_distance : np.array
+            see :meth:`._nearest_of_pairs`
+        """
+        n_atoms = trajectory.n_atoms
+        first, second = NearestAtoms._neighbor_pairs(trajectory, cutoff,
+                                                     frame_number, engine)
+        allowed = ~np.isin(first * n_atoms + second, excluded_keys)
+        first, second = first[allowed], second[allowed]
+        distances = md.compute_distances(
+            trajectory[frame_number], np.column_stack([first, second])
+        )[0]
+        return NearestAtoms._nearest_of_pairs(first, second, distances)
 
     @staticmethod
-    def _calculate_nearest(trajectory, cutoff, frame_number, excluded):
+    def _calculate_nearest(trajectory, cutoff, frame_number, excluded,
+                           engine="mdtraj"):
         """
         Calculate the nearest atoms from the input data.
 
         Useful in alterative constructors. See class docs for parameters.
         """
-        neighborlist = md.compute_neighborlist(trajectory, cutoff,
-                                               frame_number)
-        nearest = {}
-        nearest_distance = {}
-        for (atom, neighbors) in enumerate(neighborlist):
-            allowed_neighbors = [n for n in neighbors
-                                 if n not in excluded[atom]]
-            pairs = list(itertools.product([atom], allowed_neighbors))
-            if len(pairs) != 0:
-                distances = md.compute_distances(trajectory,
-                                                 pairs)[frame_number]
-
-                nearest_tuple = \
-                        sorted(list(zip(distances, allowed_neighbors)))[0]
-                nearest[atom] = nearest_tuple[1]
-                nearest_distance[atom] = nearest_tuple[0]
+        excluded_keys = NearestAtoms._excluded_keys(excluded,
+                                                    trajectory.n_atoms)
+        atoms, nearest_atoms, distances = NearestAtoms._frame_nearest(
+            trajectory, cutoff, frame_number, excluded_keys, engine
+        )
+        nearest = dict(zip(atoms.tolist(), nearest_atoms.tolist()))
+        nearest_distance = dict(zip(atoms.tolist(), distances.tolist()))
         return (nearest, nearest_distance)
 
     @staticmethod
@@ -106,6 +185,164 @@ class NearestAtoms(object):
         return list(sorted(listed, key=lambda tup: tup[2]))
 
 
+class NearestAtomsTrajectory(object):
+    """
+    Nearest atoms (within a cutoff) to each atom, in every frame.
+
+    This is the trajectory-wide version of :class:`.NearestAtoms`. The
+    excluded pairs are prepared once and reused for every frame. For
+    trajectories that don't fit in memory, use :meth:`.iter_chunks`; to find
+    the first frame with a clash, use :meth:`.first_frame_below`.
+
+    Parameters
+    ----------
+    trajectory : :class:`mdtraj.Trajectory`
+        trajectory to be analyzed
+    cutoff : float
+        cutoff distance (in nm)
+    excluded : dict
+        atoms not counted for each atom; see :class:`.NearestAtoms`. Default
+        ``None`` ignores all atoms in the same residue.
+    engine : str or :class:`.NeighborSearchEngine`
+        neighbor search engine; see :mod:`contact_map.engines`. Default
+        ``"mdtraj"``.
+    chunk_size : int
+        number of frames processed at a time. Default 100.
+
+    Attributes
+    ----------
+    nearest : np.array
+        (n_frames, n_atoms) index of the nearest atom to each atom in each
+        frame; -1 if no atom is within the cutoff
+    nearest_distance : np.array
+        (n_frames, n_atoms) distance to the nearest atom; NaN if no atom is
+        within the cutoff
+    """
+    def __init__(self, trajectory, cutoff, excluded=None, engine="mdtraj",
+                 chunk_size=100):
+        self.cutoff = cutoff
+        self.engine = engine
+        self.excluded = NearestAtoms._parse_excluded(excluded, trajectory)
+        n_atoms = trajectory.n_atoms
+        nearest = [np.zeros((0, n_atoms), dtype=np.int64)]
+        nearest_distance = [np.zeros((0, n_atoms), dtype=np.float32)]
+        for (_, chunk_nearest, chunk_distance) in self.iter_chunks(
+                trajectory, cutoff, self.excluded, engine, chunk_size):
+            nearest.append(chunk_nearest)
+            nearest_distance.append(chunk_distance)
+        self.nearest = np.concatenate(nearest)
+        self.nearest_distance = np.concatenate(nearest_distance)
+
+    @staticmethod
+    def _iter_frames(trajectory, cutoff, excluded=None, engine="mdtraj",
+                     chunk_size=100):
+        """Nearest atoms for each frame; see :meth:`.iter_chunks`.
+
+        Yields
+        ------
+        nearest, nearest_distance : np.array
+            (n_atoms,) arrays for the next frame
+        """
+        chunks = trajectory
+        if isinstance(trajectory, md.Trajectory):
+            chunks = (trajectory[start:start + chunk_size]
+                      for start in range(0, len(trajectory), chunk_size))
+        excluded_keys = None
+        for chunk in chunks:
+            if excluded_keys is None:
+                excluded = NearestAtoms._parse_excluded(excluded, chunk)
+                excluded_keys = NearestAtoms._excluded_keys(excluded,
+                                                            chunk.n_atoms)
+            for frame_number in range(len(chunk)):
+                atoms, nearest_atoms, distances = NearestAtoms._frame_nearest(
+                    chunk, cutoff, frame_number, excluded_keys, engine
+                )
+                nearest = np.full(chunk.n_atoms, -1, dtype=np.int64)
+                nearest[atoms] = nearest_atoms
+                nearest_distance = np.full(chunk.n_atoms, np.nan,
+                                           dtype=np.float32)
+                nearest_distance[atoms] = distances
+                yield nearest, nearest_distance
+
+    @staticmethod
+    def iter_chunks(trajectory, cutoff, excluded=None, engine="mdtraj",
+                    chunk_size=100):
+        """Nearest atoms, one chunk of frames at a time.
+
+        Parameters
+        ----------
+        trajectory : :class:`mdtraj.Trajectory` or iterable
+            the trajectory, or its chunks (e.g., from
+            :func:`mdtraj.iterload`, so the whole trajectory is never in
+            memory)
+        cutoff : float
+            cutoff distance (in nm)
+        excluded : dict
+            atoms not counted for each atom; see :class:`.NearestAtoms`
+        engine : str or :class:`.NeighborSearchEngine`
+            neighbor search engine
+        chunk_size : int
+            number of frames in each chunk, if ``trajectory`` is a
+            :class:`mdtraj.Trajectory`
+
+        Yields
+        ------
+        start : int
+            frame number of the first frame in the chunk
+        nearest : np.array
+            (n_chunk_frames, n_atoms) nearest atoms, as :attr:`.nearest`
+        nearest_distance : np.array
+            (n_chunk_frames, n_atoms) distances, as
+            :attr:`.nearest_distance`
+        """
+        frames = NearestAtomsTrajectory._iter_frames(
+            trajectory, cutoff, excluded, engine, chunk_size
+        )
+        start = 0
+        while True:
+            chunk = list(itertools.islice(frames, chunk_size))
+            if not chunk:
+                return
+            nearest, nearest_distance = zip(*chunk)
+            yield start, np.stack(nearest), np.stack(nearest_distance)
+            start += len(chunk)
+
+    @staticmethod
+    def first_frame_below(trajectory, threshold, excluded=None,
+                          engine="mdtraj", chunk_size=100):
+        """First frame where any two atoms are closer than ``threshold``.
+
+        Frames are analyzed in order, and the search stops as soon as a
+        frame is found.
+
+        Parameters
+        ----------
+        trajectory : :class:`mdtraj.Trajectory` or iterable
+            the trajectory, or its chunks; see :meth:`.iter_chunks`
+        threshold : float
+            distance (in nm)
+        excluded : dict
+            atoms not counted for each atom; see :class:`.NearestAtoms`
+        engine : str or :class:`.NeighborSearchEngine`
+            neighbor search engine
+        chunk_size : int
+            number of frames loaded at a time, if ``trajectory`` is a
+            :class:`mdtraj.Trajectory`
+
+        Returns
+        -------
+        int or None :
+            the frame number, or None if no frame has atoms that close
+        """
+        frames = NearestAtomsTrajectory._iter_frames(
+            trajectory, threshold, excluded, engine, chunk_size
+        )
+        for (frame_number, (_, nearest_distance)) in enumerate(frames):
+            if np.any(nearest_distance < threshold):
+                return frame_number
+        return None
+
+
 class MinimumDistanceCounter(object):
     """Count how often each atom pair is the minimum distance.
 
@@ -117,7 +354,10 @@ class MinimumDistanceCounter(object):
         list of the (integer) atom indices to use as the query
     haystack : list
         list of the (integer) atom indices to use as the haystack
-
+    chunk_size : int
+        number of frames processed at a time. The minimum distance in each
+        frame is found with a KD-tree, so memory use scales with the number
+        of query and haystack atoms, not the number of pairs. Default 100.
 
     Attributes
     ----------
@@ -131,17 +371,29 @@ class MinimumDistanceCounter(object):
         frame of the trajectory
     """
     # count how many times each atom pair has minimum distance
-    def __init__(self, trajectory, query, haystack):
-        # TODO: better approach is to make the initialization based on
-        # atom_pairs
+    def __init__(self, trajectory, query, haystack, chunk_size=100):
         self.topology = trajectory.topology
-        self.atom_pairs = list(itertools.product(query, haystack))
-        self.minimum_distances, self._min_pairs = \
-                self._compute_from_atom_pairs(trajectory, self.atom_pairs)
+        self._query = np.asarray(query, dtype=int)
+        self._haystack = np.asarray(haystack, dtype=int)
+        self._atom_residue = _atom_residue_idxs(self.topology)
+        self.minimum_distances, self._min_pairs = self._compute_minimum(
+            trajectory, self._query, self._haystack, chunk_size
+        )
+
+    @property
+    def atom_pairs(self):
+        """
+        list :
+            list of 2-tuples representing atom index pairs to use when
+            looking for the minimum distance (built when requested; the
+            minimum distances are found without it)
+        """
+        return list(itertools.product(self._query.tolist(),
+                                      self._haystack.tolist()))
 
     @staticmethod
-    def _compute_from_atom_pairs(trajectory, atom_pairs):
-        """Compute minimum distances/atom index pairs from atom_pairs.
+    def _compute_minimum(trajectory, query, haystack, chunk_size=100):
+        """Compute minimum distances/atom index pairs for each frame.
 
         Useful for alternative constructors.
 
@@ -149,27 +401,92 @@ class MinimumDistanceCounter(object):
         ----------
         trajectory : :class:`mdtraj.Trajectory`
             trajectory to be analyzed
-        atom_pairs : list
-            list of 2-tuples representing atom index pairs to use when
-            looking for the minimum distance
+        query : np.array
+            indices of the query atoms
+        haystack : np.array
+            indices of the haystack atoms
+        chunk_size : int
+            number of frames processed at a time
 
         Returns
         -------
-        minimum_distances : list
+        minimum_distances : np.array
             the minimum distance between query group and haystack group at
             each frame of the trajectory
-        min_pairs : list of 2-tuple
-            the atom indices for the pair of atoms corresponding to the
-            reported minimum distance each frame of the trajectory
+        min_pairs : np.array
+            (n_frames, 2) atom indices for the pair of atoms corresponding
+            to the reported minimum distance each frame of the trajectory
         """
-        distances = md.compute_distances(trajectory, atom_pairs)
-        min_pairs = distances.argmin(axis=1)
-        minimum_distances = distances.min(axis=1)
+        n_frames = len(trajectory)
+        minimum_distances = np.zeros(n_frames, dtype=np.float32)
+        min_pairs = np.zeros((n_frames, 2), dtype=np.int64)
+        for start in range(0, n_frames, chunk_size):
+            chunk = trajectory[start:start + chunk_size]
+            for frame_number in range(len(chunk)):
+                idx = start + frame_number
+                (minimum_distances[idx], min_pairs[idx, 0],
+                 min_pairs[idx, 1]) = MinimumDistanceCounter._frame_minimum(
+                     chunk.xyz[frame_number], frame_box(chunk, frame_number),
+                     query, haystack
+                 )
         return minimum_distances, min_pairs
 
-    def _remap(self, pair_number):
+    @staticmethod
+    def _frame_minimum(xyz, box, query, haystack):
+        """Minimum query-haystack distance in one frame, and its atoms.
+
+        The nearest haystack atom to each query atom is found with a
+        :class:`scipy.spatial.cKDTree` (periodic for orthorhombic boxes);
+        other boxes are searched with :func:`mdtraj.compute_distances`, one
+        block of query atoms at a time.
+
+        Returns
+        -------
+        distance : float
+            the minimum distance
+        query_atom, haystack_atom : int
+            the atom indices of the pair at that distance
+        """
+        lengths = None
+        if box is not None:
+            lengths = _orthorhombic_lengths(box)
+            if lengths is None:
+                return MinimumDistanceCounter._triclinic_minimum(
+                    xyz, box, query, haystack
+                )
+            lengths = np.asarray(lengths, dtype=np.float64)
+        points = np.asarray(xyz, dtype=np.float64)
+        if lengths is not None:
+            points = points % lengths
+            # rounding can put points exactly on the upper edge
+            points[points >= lengths] = 0.0
+        tree = cKDTree(points[haystack], boxsize=lengths)
+        distances, nearest = tree.query(points[query])
+        idx = distances.argmin()
+        return distances[idx], query[idx], haystack[nearest[idx]]
+
+    @staticmethod
+    def _triclinic_minimum(xyz, box, query, haystack, block_size=2**20):
+        """Minimum distance in a triclinic box; see :meth:`._frame_minimum`.
+
+        At most ``block_size`` distances are computed at a time.
+        """
+        frame = md.Trajectory(xyz[np.newaxis], topology=None)
+        frame.unitcell_vectors = box[np.newaxis]
+        n_block_query = max(1, block_size // len(haystack))
+        best = (np.inf, -1, -1)
+        for start in range(0, len(query), n_block_query):
+            block_query = query[start:start + n_block_query]
+            pairs = np.column_stack([np.repeat(block_query, len(haystack)),
+                                     np.tile(haystack, len(block_query))])
+            distances = md.compute_distances(frame, pairs)[0]
+            idx = distances.argmin()
+            if distances[idx] < best[0]:
+                best = (distances[idx], pairs[idx, 0], pairs[idx, 1])
+        return best
+
+    def _remap(self, pair):
         """Remap a pair of atom indices to the Atom objects"""
-        pair = self.atom_pairs[pair_number]
         return (self.topology.atom(pair[0]), self.topology.atom(pair[1]))
 
     @property
@@ -179,7 +496,19 @@ class MinimumDistanceCounter(object):
             list of atom pairs when represent the minimum distance at each
             frame of the trajectory
         """
-        return [self._remap(k) for k in self._min_pairs]
+        return [self._remap(pair) for pair in self._min_pairs.tolist()]
+
+    @staticmethod
+    def _count_pairs(pairs, n_items):
+        """Unique rows of an (n, 2) integer array, with their counts"""
+        keys = pairs[:, 0] * n_items + pairs[:, 1]
+        unique, counts = np.unique(keys, return_counts=True)
+        return np.column_stack([unique // n_items, unique % n_items]), counts
+
+    @property
+    def _residue_pairs(self):
+        """(n_frames, 2) residue indices of the minimum distance pairs"""
+        return self._atom_residue[self._min_pairs]
 
     @property
     def atom_count(self):
@@ -188,7 +517,12 @@ class MinimumDistanceCounter(object):
             map from atom pair to the number of times that pair is the
             minimum distance
         """
-        return collections.Counter(self.atom_history)
+        pairs, counts = self._count_pairs(self._min_pairs,
+                                          self.topology.n_atoms)
+        return collections.Counter({
+            self._remap(pair): count
+            for (pair, count) in zip(pairs.tolist(), counts.tolist())
+        })
 
     @property
     def residue_history(self):
@@ -197,7 +531,9 @@ class MinimumDistanceCounter(object):
             list of residue pairs when represent the minimum distance at
             each frame of the trajectory
         """
-        return [(a[0].residue, a[1].residue) for a in self.atom_history]
+        residue = self.topology.residue
+        return [(residue(pair[0]), residue(pair[1]))
+                for pair in self._residue_pairs.tolist()]
 
     @property
     def residue_count(self):
@@ -206,4 +542,10 @@ class MinimumDistanceCounter(object):
             map from residue pair to the number of times that pair is the
             minimum distance
         """
-        return collections.Counter(self.residue_history)
+        residue = self.topology.residue
+        pairs, counts = self._count_pairs(self._residue_pairs,
+                                          self.topology.n_residues)
+        return collections.Counter({
+            (residue(pair[0]), residue(pair[1])): count
+            for (pair, count) in zip(pairs.tolist(), counts.tolist())
+        })
@@ -0,0 +1,335 @@
+"""
+Two-level neighbor search using residue bounding spheres.
+
+Most residue pairs in a large system are far from each other. Instead of
+searching for neighbors of every atom, the search here first computes a
+bounding sphere (centroid and radius) for each residue, and uses a coarse
+cell list to find the residue pairs whose spheres are within the cutoff of
+each other. Atom distances are then only calculated for atoms in those
+candidate residue pairs.
+
+Periodic boundary conditions are supported for orthorhombic boxes; for
+other boxes, use :func:`mdtraj.compute_neighborlist`.
+"""
+
+import itertools
+
+import numpy as np
+
+
+def is_orthorhombic(trajectory):
+    """Whether the search here supports the box of a trajectory.
+
+    Parameters
+    ----------
+    trajectory : mdtraj.Trajectory
+
+    Returns
+    -------
+    bool :
+        True if the trajectory has no unit cell or an orthorhombic one
+    """
+    if trajectory.unitcell_angles is None:
+        return True
+    return bool(np.allclose(trajectory.unitcell_angles, 90.0))
+
+
+def box_lengths(trajectory, frame_number):
+    """Orthorhombic box lengths of a frame; None if not periodic"""
+    if trajectory.unitcell_lengths is None:
+        return None
+    return trajectory.unitcell_lengths[frame_number]
+
+
+def minimum_image(delta, box):
+    """Apply the minimum image convention for an orthorhombic box.
+
+    Parameters
+    ----------
+    delta : np.array
+        (n, 3) array of displacements
+    box : np.array or None
+        box lengths; None means not periodic
+
+    Returns
+    -------
+    np.array :
+        the displacements of the nearest periodic images
+    """
+    if box is None:
+        return delta
+    return delta - box * np.round(delta / box)
+
+
+# the cell itself and half of the adjacent cells; the other half is covered
+# by the pairs in the opposite direction
+_HALF_SHELL = np.array([offset for offset
+                        in itertools.product([-1, 0, 1], repeat=3)
+                        if offset > (0, 0, 0)])
+
+
+def cell_grid(points, cell_size, box=None):
+    """Assign points to the cells of a grid.
+
+    Parameters
+    ----------
+    points : np.array
+        (n, 3) array of positions
+    cell_size : float
+        minimum width of each cell
+    box : np.array or None
+        orthorhombic box lengths; None means not periodic
+
+    Returns
+    -------
+    cells : np.array
+        (n, 3) integer cell coordinates of each point
+    n_cells : np.array
+        number of cells along each axis
+    """
+    if box is None:
+        origin = points.min(axis=0)
+        extent = points.max(axis=0) - origin
+        n_cells = np.floor(extent / cell_size).astype(np.int64) + 1
+        cells = np.floor((points - origin) / cell_size).astype(np.int64)
+    else:
+        box = np.asarray(box, dtype=np.float64)
+        n_cells = np.maximum(np.floor(box / cell_size).astype(np.int64), 1)
+        fractional = points / box
+        fractional -= np.floor(fractional)
+        cells = (fractional * n_cells).astype(np.int64)
+    return np.minimum(cells, n_cells - 1), n_cells
+
+
+def cell_ids(cells, n_cells):
+    """Flat index of each cell in a grid"""
+    return (cells[:, 0] * n_cells[1] + cells[:, 1]) * n_cells[2] + cells[:, 2]
+
+
+def cell_list_pairs(points, cell_size, box=None):
+    """Candidate pairs of points, from a cell list.
+
+    Points are binned into cells with a width of at least ``cell_size``.
+    All pairs of points in the same or in adjacent cells are returned, so
+    every pair that is closer than ``cell_size`` (using the minimum image,
+    if ``box`` is given) is included, as are some pairs that are further
+    apart. Only the occupied cells are stored, so memory use is independent
+    of the number of cells.
+
+    Parameters
+    ----------
+    points : np.array
+        (n, 3) array of positions
+    cell_size : float
+        minimum width of each cell
+    box : np.array or None
+        orthorhombic box lengths; None means not periodic
+
+    Returns
+    -------
+    first, second : np.array
+        indices of the points in each pair, with ``first < second``
+    """
+    n_points = len(points)
+    if n_points < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    cells, n_cells = cell_grid(points, cell_size, box)
+    ids = cell_ids(cells, n_cells)
+    order = np.argsort(ids, kind='stable')
+    sorted_ids = ids[order]
+
+    # same cell
+    start = np.searchsorted(sorted_ids, sorted_ids, side='left')
+    stop = np.searchsorted(sorted_ids, sorted_ids, side='right')
+    first, second = _expand(order, order, start, stop)
+    lower = first < second
+    pairs = [(first[lower], second[lower])]
+
+    for offset in _HALF_SHELL:
+        neighbor_cells = cells + offset
+        if box is None:
+            valid = np.all((neighbor_cells >= 0)
+                           & (neighbor_cells < n_cells), axis=1)
+        else:
+            neighbor_cells %= n_cells
+            valid = np.ones(n_points, dtype=bool)
+        neighbor_ids = cell_ids(neighbor_cells, n_cells)
+        start = np.searchsorted(sorted_ids, neighbor_ids, side='left')
+        stop = np.where(valid, np.searchsorted(sorted_ids, neighbor_ids,
+                                               side='right'), start)
+        first, second = _expand(np.arange(n_points), order, start, stop)
+        pairs.append((np.minimum(first, second),
+                      np.maximum(first, second)))
+
+    first = np.concatenate([pair[0] for pair in pairs])
+    second = np.concatenate([pair[1] for pair in pairs])
+    if box is not None and np.any(n_cells < 3):
+        # with fewer than 3 cells, different offsets can reach the same
+        # cell, so the same pair can be found more than once
+        keys = first * n_points + second
+        keys = np.unique(keys[first != second])
+        return keys // n_points, keys % n_points
+    return first, second
+
+
+def _expand(points, sorted_points, start, stop):
+    """Pairs of each point with the sorted points from start to stop"""
+    counts = stop - start
+    first = np.repeat(points, counts)
+    within = np.arange(len(first)) - np.repeat(np.cumsum(counts) - counts,
+                                               counts)
+    second = sorted_points[np.repeat(start, counts) + within]
+    return first, second
+
+
+def _grouped(atoms, groups, n_groups):
+    """Atoms sorted by group, and the offsets of each group"""
+    order = np.argsort(groups, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(groups,
+                                                         minlength=n_groups))])
+    return atoms[order], offsets
+
+
+def _cross_pairs(left, right, left_groups, right_groups):
+    """All pairs of atoms between the groups in each pair of groups"""
+    left_atoms, left_offsets = left
+    right_atoms, right_offsets = right
+    left_start = left_offsets[left_groups]
+    right_start = right_offsets[right_groups]
+    n_left = left_offsets[left_groups + 1] - left_start
+    n_right = right_offsets[right_groups + 1] - right_start
+    sizes = n_left * n_right
+    group_pair = np.repeat(np.arange(len(sizes)), sizes)
+    within = np.arange(len(group_pair)) - np.repeat(np.cumsum(sizes) - sizes,
+                                                    sizes)
+    n_right = n_right[group_pair]
+    first = left_atoms[left_start[group_pair] + within // n_right]
+    second = right_atoms[right_start[group_pair] + within % n_right]
+    return first, second
+
+
+class ResidueSpheres(object):
+    """Contact search that prefilters with residue bounding spheres.
+
+    The grouping of atoms into residues only depends on the selections, so
+    it is set up once and reused for every frame.
+
+    Parameters
+    ----------
+    query : np.array
+        (sliced) indices of the query atoms
+    haystack_mask : np.array
+        mask of the (sliced) atoms in the haystack
+    exclusion : :class:`._NeighborExclusion`
+        residue of each (sliced) atom, and the neighboring residues that
+        are excluded from contact; excluded residue pairs are skipped
+        before any atom distances are calculated
+    """
+    def __init__(self, query, haystack_mask, exclusion):
+        self.exclusion = exclusion
+        atom_residue = exclusion.atom_residue
+        residues, atom_group = np.unique(atom_residue, return_inverse=True)
+        self.n_groups = len(residues)
+        self.atom_group = atom_group.reshape(-1)
+        # the first atom of each residue is the reference for making
+        # residues whole in periodic boxes
+        self.reference_atom = np.full(self.n_groups, len(atom_residue),
+                                      dtype=np.int64)
+        np.minimum.at(self.reference_atom, self.atom_group,
+                      np.arange(len(atom_residue)))
+        self.n_atoms = np.bincount(self.atom_group, minlength=self.n_groups)
+
+        query = np.asarray(query, dtype=np.int64)
+        haystack = np.nonzero(haystack_mask)[0]
+        self.query = _grouped(query, self.atom_group[query], self.n_groups)
+        self.haystack = _grouped(haystack, self.atom_group[haystack],
+                                 self.n_groups)
+
+    def spheres(self, xyz, box=None):
+        """Centroid and radius of each residue's bounding sphere.
+
+        Parameters
+        ----------
+        xyz : np.array
+            (n_atoms, 3) coordinates of the (sliced) atoms in one frame
+        box : np.array or None
+            orthorhombic box lengths; None means not periodic
+
+        Returns
+        -------
+        centers : np.array
+            (n_residues, 3) centroid of each residue
+        radii : np.array
+            distance from the centroid to the furthest atom of each residue
+        """
+        xyz = np.asarray(xyz, dtype=np.float64)
+        reference = xyz[self.reference_atom][self.atom_group]
+        # the images of the atoms nearest the reference atom of the residue
+        whole = reference + minimum_image(xyz - reference, box)
+        centers = np.zeros((self.n_groups, 3))
+        for dim in range(3):
+            centers[:, dim] = np.bincount(self.atom_group,
+                                          weights=whole[:, dim],
+                                          minlength=self.n_groups)
+        centers /= self.n_atoms[:, np.newaxis]
+        distances = np.linalg.norm(whole - centers[self.atom_group], axis=1)
+        radii = np.zeros(self.n_groups)
+        np.maximum.at(radii, self.atom_group, distances)
+        return centers, radii
+
+    def candidate_residues(self, xyz, cutoff, box=None):
+        """Pairs of residues that may have atoms within the cutoff.
+
+        Returns
+        -------
+        first, second : np.array
+            indices (in the order of the sorted residues) of residue pairs
+            whose bounding spheres are within ``cutoff``, including each
+            residue paired with itself, but without excluded neighbors
+        """
+        centers, radii = self.spheres(xyz, box)
+        first, second = cell_list_pairs(centers, cutoff + 2 * radii.max(),
+                                        box)
+        delta = minimum_image(centers[first] - centers[second], box)
+        reach = cutoff + radii[first] + radii[second]
+        near = np.einsum('ij,ij->i', delta, delta) <= reach * reach
+        diagonal = np.arange(self.n_groups)
+        first = np.concatenate([diagonal, first[near]])
+        second = np.concatenate([diagonal, second[near]])
+        keep = ~self.exclusion.excluded(self.reference_atom[first],
+                                        self.reference_atom[second])
+        return first[keep], second[keep]
+
+    def contact_pairs(self, xyz, cutoff, box=None):
+        """Query/haystack atom pairs within the cutoff in one frame.
+
+        Parameters
+        ----------
+        xyz : np.array
+            (n_atoms, 3) coordinates of the (sliced) atoms in one frame
+        cutoff : float
+            cutoff distance for contacts
+        box : np.array or None
+            orthorhombic box lengths; None means not periodic
+
+        Returns
+        -------
+        first, second : np.array
+            (sliced) query and haystack atom indices of each pair within
+            the cutoff; a pair may be found in both orders
+        """
+        res_first, res_second = self.candidate_residues(xyz, cutoff, box)
+        off_diagonal = res_first != res_second
+        pairs = [
+            _cross_pairs(self.query, self.haystack, res_first, res_second),
+            _cross_pairs(self.query, self.haystack,
+                         res_second[off_diagonal], res_first[off_diagonal]),
+        ]
+        first = np.concatenate([pair[0] for pair in pairs])
+        second = np.concatenate([pair[1] for pair in pairs])
+        delta = minimum_image(xyz[first] - xyz[second], box)
+        in_contact = ((np.einsum('ij,ij->i', delta, delta)
+                       <= cutoff * cutoff)
+                      & (first != second))
+        return first[in_contact], second[in_contact]
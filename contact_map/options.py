@@ -0,0 +1,73 @@
+"""
+Execution options for contact calculations.
+
+These options change how the contacts are calculated (where partial results
+are kept, which neighbor search is used, how many threads are used), but
+not the results. Contact objects take them as keyword arguments, e.g.,
+``ContactFrequency(traj, engine="kdtree", n_threads=4)``.
+"""
+
+
+class ExecutionOptions(object):
+    """How contacts are calculated.
+
+    Parameters
+    ----------
+    checkpoint : :class:`.ContactCheckpoint`
+        If given, partial results are written to this checkpoint, and
+        blocks of frames that are already in the checkpoint are not
+        recalculated. Default ``None`` means no checkpointing.
+    cache : :class:`.ContactCache`
+        If given, the result is loaded from this cache if it has already
+        been calculated for this input and these parameters, and stored in
+        it otherwise. Default ``None`` means no caching.
+    residue_prefilter : bool
+        If True, search for contacts in two levels: first find the pairs of
+        residues whose bounding spheres are within the cutoff, then only
+        check the distances between atoms in those residue pairs. This
+        gives the same contacts, and is faster for large, sparse systems.
+        Boxes that are not orthorhombic use the normal search. Default
+        False.
+    engine : str or :class:`.NeighborSearchEngine`
+        Neighbor search engine: ``"mdtraj"``, ``"kdtree"``,
+        ``"cell_list"``, ``"numba"``, ``"auto"``, or any engine registered
+        in :mod:`contact_map.engines`. Default ``"mdtraj"``.
+    n_threads : int
+        Number of threads used to process the frames of each block
+        concurrently. Each thread counts the contacts of its frames, and
+        the counts are merged afterwards. The neighbor search and array
+        operations release the GIL for much of their work, so this helps
+        where processes can't be used. Default 1.
+
+    A value of ``None`` gives the default for that option.
+    """
+    names = ('checkpoint', 'cache', 'residue_prefilter', 'engine',
+             'n_threads')
+
+    def __init__(self, checkpoint=None, cache=None, residue_prefilter=False,
+                 engine="mdtraj", n_threads=1):
+        self.checkpoint = checkpoint
+        self.cache = cache
+        self.residue_prefilter = bool(residue_prefilter)
+        self.engine = "mdtraj" if engine is None else engine
+        self.n_threads = 1 if n_threads is None else n_threads
+
+    @classmethod
+    def from_kwargs(cls, kwargs):
+        """Options from the option keywords in ``kwargs``.
+
+        The option keywords are removed from ``kwargs``, so the remaining
+        keywords can be passed on (e.g., to :func:`mdtraj.iterload`).
+
+        Parameters
+        ----------
+        kwargs : dict
+            keyword arguments, including any of :attr:`.names`
+
+        Returns
+        -------
+        :class:`.ExecutionOptions` :
+            options from those keywords; defaults for the others
+        """
+        return cls(**{name: kwargs.pop(name) for name in cls.names
+                      if name in kwargs})
@@ -0,0 +1,276 @@
+"""
+Contact frequencies for trajectory files that are read in chunks.
+
+Reading a chunk of frames from a compressed trajectory file (XTC, DCD, ...)
+takes time that would otherwise be spent on the contact search. With
+:func:`.prefetched`, the next chunks are read in a background thread while
+the current chunk is analyzed, so the total time approaches the larger of
+the reading time and the analysis time, instead of their sum. Only a
+bounded number of chunks are held in memory at once.
+"""
+
+import queue
+import threading
+import warnings
+
+import mdtraj as md
+
+from .contact_map import ContactFrequency, _contact_levels, _CONTACT_LEVELS
+from .checkpoint import file_fingerprint
+from .blocks import serialize_block, sum_blocks, merge_counts
+from .options import ExecutionOptions
+
+_ITEM, _ERROR, _DONE = range(3)
+
+# formats where mdtraj.iterload can't start partway through the file
+_UNSEEKABLE = ('.pdb', '.pdb.gz', '.gsd')
+
+
+def prefetched(iterable, size=2):
+    """Iterate over ``iterable``, with items produced in a background thread.
+
+    The thread stays at most ``size`` items ahead of the consumer.
+    Exceptions raised while producing items are raised in the consumer,
+    when the item that failed would have been returned. If the consumer
+    stops early (e.g., breaks out of the loop), the thread is stopped.
+
+    Parameters
+    ----------
+    iterable : iterable
+        the items, e.g., chunks from :func:`mdtraj.iterload`
+    size : int
+        maximum number of items waiting in the queue. Default 2.
+
+    Yields
+    ------
+    the items of ``iterable``, in order
+    """
+    if size < 1:
+        raise RuntimeError("Prefetch size must be at least 1")
+    items = queue.Queue(maxsize=size)
+    stop = threading.Event()
+
+    def put(message):
+        while not stop.is_set():
+            try:
+                items.put(message, timeout=0.1)
+            except queue.Full:
+                continue
+            return True
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((_ITEM, item)):
+                    return
+        except Exception as err:  # raised in the consumer instead
+            put((_ERROR, err))
+        else:
+            put((_DONE, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            kind, value = items.get()
+            if kind == _DONE:
+                return
+            if kind == _ERROR:
+                raise value
+            yield value
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _skip_frames(chunks, n_frames):
+    """Drop the first ``n_frames`` frames from a sequence of chunks"""
+    for chunk in chunks:
+        if n_frames >= len(chunk):
+            n_frames -= len(chunk)
+            continue
+        yield chunk[n_frames:]
+        n_frames = 0
+
+
+def _seek_chunks(chunks, skip):
+    """Chunks from an iterator that starts after ``skip`` frames; empty if
+    the file has no more frames"""
+    try:
+        first_chunk = next(chunks)
+    except StopIteration:
+        return
+    except OSError:
+        # some readers raise when seeking to the end of the file
+        if skip == 0:
+            raise
+        return
+    yield first_chunk
+    yield from chunks
+
+
+class StreamingContactFrequency(ContactFrequency):
+    """Contact frequency for a trajectory file, read in chunks.
+
+    The contact frequency is the fraction of a trajectory that a contact is
+    made. See :class:`.ContactFrequency` for details. This implementation
+    reads the file one chunk at a time with :func:`mdtraj.iterload`, so the
+    whole trajectory is never in memory. While a chunk is analyzed, the
+    next chunks are read in a background thread.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the file where the trajectory is located.
+    query : list of int
+        Indices of the atoms to be included as query. Default ``None``
+        means all atoms.
+    haystack : list of int
+        Indices of the atoms to be included as haystack. Default ``None``
+        means all atoms.
+    cutoff : float
+        Cutoff distance for contacts, in nanometers. Default 0.45.
+    n_neighbors_ignored : int
+        Number of neighboring residues (in the same chain) to ignore.
+        Default 2.
+    store_frames : bool
+        If True, also store which atom contacts are made in each frame; see
+        :class:`.ContactFrequency`. Default False.
+    contacts : tuple of str
+        Which contacts to compute: any of ``"atom"`` and ``"residue"``.
+        Default computes both; see :class:`.ContactFrequency`.
+    chunk : int
+        Number of frames read from the file at a time (must be positive).
+        Default 100.
+    prefetch : int
+        Number of chunks that may be read ahead of the analysis. Default 2;
+        0 reads each chunk only when it is needed, without a background
+        thread.
+    growing : bool
+        If True, the file is expected to grow (e.g., the output of a running
+        simulation). The checkpoint is then keyed on the file name only
+        (not its size or modification time), so a new run only analyzes
+        the frames appended since the frames in the checkpoint. Frames must
+        only ever be appended to the file. See also :meth:`.update`.
+        Default False.
+    kwargs :
+        Execution options (``checkpoint``, ``cache``, ``residue_prefilter``,
+        ``engine``, and ``n_threads``; see :class:`.ExecutionOptions`), and
+        additional parameters for :func:`mdtraj.iterload`, such as ``top``,
+        ``stride``, or ``atom_indices``. With a checkpoint, the results for
+        each chunk are written to it, and frames at the start of the file
+        that are already in it are skipped without being analyzed. The
+        checkpoint is keyed on the file name, size, and modification time
+        (but see ``growing``).
+    """
+    def __init__(self, filename, query=None, haystack=None, cutoff=0.45,
+                 n_neighbors_ignored=2, store_frames=False,
+                 contacts=_CONTACT_LEVELS, chunk=100, prefetch=2,
+                 growing=False, **kwargs):
+        warnings.warn(self._pending_dep_msg, PendingDeprecationWarning)
+        self.filename = filename
+        self._execution_options = ExecutionOptions.from_kwargs(kwargs)
+        self.kwargs = kwargs
+        self.chunk = chunk
+        self.prefetch = prefetch
+        self.growing = growing
+        self._store_frames = store_frames
+        contact_levels = _contact_levels(contacts)
+        if store_frames and 'atom' not in contact_levels:
+            raise RuntimeError("store_frames requires atom contacts")
+        first_frame = md.load_frame(filename, 0, top=kwargs.get('top'),
+                                    atom_indices=kwargs.get('atom_indices'))
+        # skip ContactFrequency.__init__: there is no trajectory in memory
+        super(ContactFrequency, self).__init__(first_frame.topology, query,
+                                               haystack, cutoff,
+                                               n_neighbors_ignored)
+        self._contact_levels = contact_levels
+        contacts = self._cached_build(self._build_kind(), None,
+                                      self._build_contact_map)
+        (self._atom_contacts, self._residue_contacts,
+         self._frame_contacts, self._n_frames) = contacts
+
+    def _input_identity(self, trajectory):
+        return file_fingerprint(self.filename, **self.kwargs)
+
+    def _chunks(self, skip=0):
+        """Chunks of the trajectory, after the first ``skip`` frames"""
+        if self.filename.endswith(_UNSEEKABLE):
+            # MDTraj reads these formats completely and ignores ``skip``
+            chunks = _skip_frames(
+                md.iterload(self.filename, chunk=self.chunk, **self.kwargs),
+                skip
+            )
+        else:
+            # MDTraj skips frames in the file, before applying the stride
+            stride = self.kwargs.get('stride') or 1
+            chunks = _seek_chunks(
+                md.iterload(self.filename, chunk=self.chunk,
+                            skip=skip * stride, **self.kwargs),
+                skip
+            )
+        if self.prefetch:
+            chunks = prefetched(chunks, self.prefetch)
+        return chunks
+
+    def _build_contact_map(self, trajectory):
+        # trajectory is None: the frames are read from the file
+        checkpoint = self._options.checkpoint
+        if checkpoint is None:
+            return self._count_new_frames(skip=0)
+
+        identity = file_fingerprint(self.filename, growing=self.growing,
+                                    **self.kwargs)
+        key = self._calculation_key(self._build_kind(), identity)
+        start = checkpoint.completed_frames(key)
+        n_frames = start
+        for chunk in self._chunks(skip=start):
+            stop = n_frames + len(chunk)
+            for block in checkpoint.missing_slices(key, stop, n_frames):
+                local = slice(block.start - n_frames, block.stop - n_frames)
+                payload = serialize_block(*self._count_contacts(chunk, local))
+                checkpoint.record(key, block, payload)
+            n_frames = stop
+
+        contacts = sum_blocks(checkpoint.results(key, n_frames))
+        return contacts + (n_frames,)
+
+    def _count_new_frames(self, skip):
+        """Counts for the frames after the first ``skip`` frames, followed
+        by the number of frames counted"""
+        n_frames = 0
+
+        def counts():
+            nonlocal n_frames
+            for chunk in self._chunks(skip=skip):
+                n_frames += len(chunk)
+                yield self._count_contacts(chunk, slice(0, len(chunk)))
+
+        contacts = merge_counts(counts())
+        return contacts + (n_frames,)
+
+    def update(self):
+        """Analyze the frames appended to the file since it was last read.
+
+        With a checkpoint, the new frames are also checkpointed; use
+        ``growing=True`` so that the checkpoint key doesn't change as the
+        file grows.
+
+        Returns
+        -------
+        int :
+            number of new frames
+        """
+        n_old_frames = self.n_frames
+        if self._options.checkpoint is not None:
+            contacts = self._build_contact_map(None)
+        else:
+            new_contacts = self._count_new_frames(skip=n_old_frames)
+            old_contacts = (self._atom_contacts, self._residue_contacts,
+                            self._frame_contacts)
+            contacts = (merge_counts([old_contacts, new_contacts[:3]])
+                        + (n_old_frames + new_contacts[3],))
+        (self._atom_contacts, self._residue_contacts,
+         self._frame_contacts, self._n_frames) = contacts
+        return self.n_frames - n_old_frames
@@ -0,0 +1,79 @@
+# pylint: disable=wildcard-import, missing-docstring, protected-access
+# pylint: disable=attribute-defined-outside-init, invalid-name, no-self-use
+# pylint: disable=wrong-import-order, unused-wildcard-import
+
+import shutil
+
+from .utils import *
+from .test_contact_map import traj
+
+from contact_map.cache import *
+from contact_map import ContactFrequency, ContactTrajectory
+
+
+class TestContactCache(object):
+    def setup(self):
+        self.directory = "test_cache"
+        self.cache = ContactCache(self.directory)
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_put(self):
+        assert self.cache.get('foo') is None
+        assert 'foo' not in self.cache
+        self.cache.put('foo', {'bar': 1})
+        assert 'foo' in self.cache
+        assert self.cache.get('foo') == {'bar': 1}
+
+    def test_get_or_compute(self):
+        calls = []
+        def compute():
+            calls.append(1)
+            return 5
+
+        assert self.cache.get_or_compute('foo', compute) == 5
+        assert self.cache.get_or_compute('foo', compute) == 5
+        assert len(calls) == 1
+
+    def test_eviction(self):
+        self.cache.put('first', list(range(100)))
+        self.cache.put('second', list(range(100)))
+        self.cache.max_size = self.cache.size
+        os.utime(self.cache._path('first'), (0, 0))
+        os.utime(self.cache._path('second'), (1, 1))
+        # using 'first' marks it as the most recently used
+        assert self.cache.get('first') is not None
+        self.cache.put('third', list(range(100)))
+        assert 'first' in self.cache
+        assert 'second' not in self.cache
+        assert 'third' in self.cache
+
+    def test_put_larger_than_cache(self):
+        self.cache.put('small', 1)
+        self.cache.max_size = self.cache.size + 10
+        with pytest.warns(UserWarning):
+            self.cache.put('large', list(range(100)))
+        assert 'large' not in self.cache
+        assert 'small' in self.cache
+        assert os.listdir(self.directory) == ['small.pkl']
+
+    def test_clear(self):
+        self.cache.put('foo', 1)
+        self.cache.clear()
+        assert self.cache.size == 0
+
+    @pytest.mark.parametrize('cls', [ContactFrequency, ContactTrajectory])
+    def test_contact_object_cache(self, cls, monkeypatch):
+        cmap = cls(traj, cutoff=0.075, n_neighbors_ignored=0,
+                   cache=self.cache)
+        def recalculate(*args, **kwargs):
+            raise AssertionError("Recalculated cached result")
+        build = {ContactFrequency: '_build_contact_map',
+                 ContactTrajectory: '_build_contacts'}[cls]
+        monkeypatch.setattr(cls, build, recalculate)
+        cached = cls(traj, cutoff=0.075, n_neighbors_ignored=0,
+                     cache=self.cache)
+        assert cached == cmap
+        with pytest.raises(AssertionError):
+            cls(traj, cutoff=0.075, n_neighbors_ignored=1, cache=self.cache)
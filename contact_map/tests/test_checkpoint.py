@@ -0,0 +1,109 @@
+# pylint: disable=wildcard-import, missing-docstring, protected-access
+# pylint: disable=attribute-defined-outside-init, invalid-name, no-self-use
+# pylint: disable=wrong-import-order, unused-wildcard-import
+
+from .utils import *
+from .test_contact_map import traj
+
+from contact_map.checkpoint import *
+
+
+class TestContactCheckpoint(object):
+    def setup(self):
+        self.filename = "test_checkpoint.jsonl"
+        self.checkpoint = ContactCheckpoint(self.filename, interval=2)
+
+    def teardown(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def test_missing_slices_empty(self):
+        assert self.checkpoint.missing_slices('foo', 5) == \
+                [slice(0, 2), slice(2, 4), slice(4, 5)]
+
+    def test_record_and_missing_slices(self):
+        self.checkpoint.record('foo', slice(2, 4), {'bar': 1})
+        self.checkpoint.record('baz', slice(0, 2), {'bar': 2})
+        assert self.checkpoint.completed('foo') == {(2, 4): {'bar': 1}}
+        assert self.checkpoint.missing_slices('foo', 7) == \
+                [slice(0, 2), slice(4, 6), slice(6, 7)]
+
+    def test_missing_slices_start(self):
+        self.checkpoint.record('foo', slice(2, 4), {'bar': 1})
+        assert self.checkpoint.missing_slices('foo', 7, start=3) == \
+                [slice(4, 6), slice(6, 7)]
+        assert self.checkpoint.missing_slices('foo', 4, start=1) == \
+                [slice(1, 2)]
+
+    def test_missing_slices_done_past_total(self):
+        self.checkpoint = ContactCheckpoint(self.filename, interval=10)
+        self.checkpoint.record('foo', slice(20, 30), {})
+        assert self.checkpoint.missing_slices('foo', 5) == [slice(0, 5)]
+        assert self.checkpoint.missing_slices('foo', 25, start=5) == \
+                [slice(5, 15), slice(15, 20)]
+
+    def test_results_overlapping(self):
+        self.checkpoint.record('foo', slice(0, 4), {'bar': 1})
+        self.checkpoint.record('foo', slice(2, 6), {'bar': 2})
+        with pytest.raises(RuntimeError):
+            self.checkpoint.results('foo', 6)
+
+    def test_results_past_total(self):
+        self.checkpoint.record('foo', slice(0, 2), {'bar': 1})
+        self.checkpoint.record('foo', slice(2, 6), {'bar': 2})
+        self.checkpoint.record('foo', slice(6, 8), {'bar': 3})
+        assert self.checkpoint.results('foo', 2) == [{'bar': 1}]
+        assert self.checkpoint.results('foo', 6) == [{'bar': 1},
+                                                      {'bar': 2}]
+        with pytest.raises(RuntimeError):
+            self.checkpoint.results('foo', 4)
+
+    def test_appended_by_other(self):
+        self.checkpoint.record('foo', slice(0, 2), {'bar': 1})
+        assert self.checkpoint.completed_frames('foo') == 2
+        other = ContactCheckpoint(self.filename, interval=2)
+        other.record('foo', slice(2, 4), {'bar': 2})
+        self.checkpoint.record('foo', slice(4, 6), {'bar': 3})
+        assert self.checkpoint.completed_frames('foo') == 6
+        assert self.checkpoint.results('foo', 6) == [{'bar': 1},
+                                                     {'bar': 2},
+                                                     {'bar': 3}]
+
+    def test_completed_frames(self):
+        assert self.checkpoint.completed_frames('foo') == 0
+        self.checkpoint.record('foo', slice(2, 4), {'bar': 1})
+        assert self.checkpoint.completed_frames('foo') == 0
+        self.checkpoint.record('foo', slice(0, 2), {'bar': 1})
+        self.checkpoint.record('foo', slice(5, 6), {'bar': 1})
+        assert self.checkpoint.completed_frames('foo') == 4
+
+    def test_truncated_record(self):
+        self.checkpoint.record('foo', slice(0, 2), {'bar': 1})
+        with open(self.filename, "a") as f:
+            f.write('{"key": "foo", "sta')
+        assert self.checkpoint.completed('foo') == {(0, 2): {'bar': 1}}
+        self.checkpoint.record('foo', slice(2, 4), {'bar': 2})
+        assert self.checkpoint.completed('foo') == {(0, 2): {'bar': 1},
+                                                    (2, 4): {'bar': 2}}
+
+    def test_run(self):
+        computed = []
+        def compute(block):
+            computed.append(block)
+            return block.stop - block.start
+
+        assert self.checkpoint.run('foo', 5, compute) == [2, 2, 1]
+        assert computed == [slice(0, 2), slice(2, 4), slice(4, 5)]
+        assert self.checkpoint.run('foo', 5, compute) == [2, 2, 1]
+        assert len(computed) == 3
+
+
+def test_trajectory_fingerprint():
+    assert trajectory_fingerprint(traj) == trajectory_fingerprint(traj[:])
+    assert trajectory_fingerprint(traj) != trajectory_fingerprint(traj[:4])
+
+
+def test_file_fingerprint():
+    filename = find_testfile("trajectory.pdb")
+    assert file_fingerprint(filename) == file_fingerprint(filename)
+    assert file_fingerprint(filename) != file_fingerprint(filename, top=None)
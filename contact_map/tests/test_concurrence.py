@@ -2,6 +2,8 @@
 # pylint: disable=attribute-defined-outside-init, invalid-name, no-self-use
 # pylint: disable=wrong-import-order, unused-wildcard-import
 
+import itertools
+
 from .utils import *
 
 from contact_map.concurrence import *
@@ -43,6 +45,76 @@ def test_regularize_contact_input_bad_type():
         regularize(contacts, "foo")
 
 
+class TestConcurrence(object):
+    def setup(self):
+        self.values = [[True, False, True, True, False, False, True, False,
+                        True, True],
+                       [False, False, False, True, True, True, False, False,
+                        False, True]]
+        self.concurrence = Concurrence(self.values, labels=['a', 'b'])
+
+    def test_storage(self):
+        assert self.concurrence._packed.dtype == np.uint8
+        assert self.concurrence._packed.shape == (2, 2)
+        assert self.concurrence.n_frames == 10
+        assert self.concurrence.n_contacts == 2
+
+    def test_values(self):
+        assert self.concurrence.values == self.values
+        assert self.concurrence.array.dtype == bool
+        assert_array_equal(self.concurrence.array, np.array(self.values))
+        assert self.concurrence['b'] == self.values[1]
+
+    def test_set_values(self):
+        self.concurrence.values = np.array(self.values)[:, :3]
+        assert self.concurrence.n_frames == 3
+        assert self.concurrence.values == [[True, False, True],
+                                           [False, False, False]]
+
+    def test_packed_input(self):
+        packed = np.packbits(np.array(self.values), axis=1)
+        concurrence = Concurrence(packed, n_frames=10)
+        assert concurrence.values == self.values
+
+    @pytest.mark.parametrize('chunk_size', [1, 8, 2**16])
+    def test_cooccurrence(self, chunk_size):
+        values = np.array(self.values, dtype=int)
+        counts = self.concurrence.cooccurrence(chunk_size)
+        assert counts.dtype == np.int64
+        assert_array_equal(counts, values @ values.T)
+        assert_array_equal(counts, [[6, 2], [2, 4]])
+
+    @pytest.mark.parametrize('chunk_size', [0, -8])
+    def test_cooccurrence_bad_chunk_size(self, chunk_size):
+        with pytest.raises(RuntimeError):
+            self.concurrence.cooccurrence(chunk_size)
+
+    def test_cooccurrence_large_chunk_size(self):
+        counts = self.concurrence.cooccurrence(2**40)
+        assert_array_equal(counts, [[6, 2], [2, 4]])
+
+    def test_conditional_probabilities(self):
+        concurrence = Concurrence(self.values + [[False] * 10])
+        probabilities = concurrence.conditional_probabilities()
+        assert_allclose(probabilities[:2, :2], [[1.0, 2.0 / 6.0],
+                                                [0.5, 1.0]])
+        assert_allclose(probabilities[:2, 2], [0.0, 0.0])
+        assert np.all(np.isnan(probabilities[2]))
+
+    def test_runs(self):
+        runs = self.concurrence.runs()
+        assert len(runs) == 2
+        assert_array_equal(runs[0][0], [0, 2, 6, 8])
+        assert_array_equal(runs[0][1], [1, 4, 7, 10])
+        assert_array_equal(runs[1][0], [3, 9])
+        assert_array_equal(runs[1][1], [6, 10])
+
+    def test_empty(self):
+        concurrence = Concurrence([])
+        assert concurrence.n_contacts == 0
+        assert concurrence.values == []
+
+
 class ContactConcurrenceTester(object):
     def _test_default_labels(self, concurrence):
         assert len(concurrence.labels) == len(self.labels) / 2
@@ -156,6 +228,34 @@ class TestResidueContactConcurrence(ContactConcurrenceTester):
         self._test_getitem(concurrence, pair_to_expected)
 
 
+@pytest.mark.parametrize('chunk_size', [1, 7, 2**24])
+@pytest.mark.parametrize('select', ["", "and symbol != 'H'"])
+def test_residue_concurrence_values(chunk_size, select):
+    from contact_map.concurrence import _residue_concurrence_bits
+    top = traj.topology
+    residue_pairs = list(itertools.combinations(top.residues, 2))
+    bits = _residue_concurrence_bits(traj, residue_pairs, 0.051, select,
+                                     chunk_size=chunk_size)
+    values = Concurrence(bits, n_frames=len(traj)).array
+    assert values.dtype == bool
+    assert values.shape == (len(residue_pairs), len(traj))
+    for (res_A, res_B), pair_values in zip(residue_pairs, values):
+        atom_pairs = list(itertools.product(
+            top.select("resid " + str(res_A.index) + " " + select),
+            top.select("resid " + str(res_B.index) + " " + select)
+        ))
+        distances = md.compute_distances(traj, atom_pairs)
+        assert_array_equal(pair_values, distances.min(axis=1) < 0.051)
+
+
+def test_residue_concurrence_values_no_atoms():
+    from contact_map.concurrence import _residue_concurrence_bits
+    residue_pairs = list(itertools.combinations(traj.topology.residues, 2))
+    bits = _residue_concurrence_bits(traj, residue_pairs, 0.051,
+                                     "and symbol == 'Xe'")
+    assert not bits.any()
+
+
 class TestConcurrencePlotter(object):
     def setup(self):
         self.concurrence = ResidueContactConcurrence(
@@ -191,3 +291,78 @@ class TestConcurrencePlotter(object):
         # SMOKE TEST ONLY
         pytest.importorskip('matplotlib.pyplot')
         self.plotter.plot()
+
+    @pytest.mark.parametrize('decimate', [False, True, 2])
+    def test_plot_segments(self, decimate):
+        plt = pytest.importorskip('matplotlib.pyplot')
+        plt.close('all')
+        concurrence = Concurrence([[True, True, False, True, False],
+                                   [False, False, False, False, True]],
+                                  labels=['a', 'b'])
+        plotter = ConcurrencePlotter(concurrence)
+        _, ax, lgd = plotter.plot(style="segments", decimate=decimate)
+        bars = ax.collections
+        assert [bar.get_label() for bar in bars] == ['a', 'b']
+        n_bars = [len(bar.get_paths()) for bar in bars]
+        # with 2 pixels for 5 frames, the 1-frame gap is merged
+        assert n_bars == ([1, 1] if decimate == 2 else [2, 1])
+        assert len(lgd.get_texts()) == 2
+        plt.close('all')
+
+    def test_plot_bad_style(self):
+        pytest.importorskip('matplotlib.pyplot')
+        with pytest.raises(RuntimeError):
+            self.plotter.plot(style="foo")
+
+
+def test_true_runs():
+    from contact_map.concurrence import _true_runs
+    row = np.array([True, True, False, True, False, False, True])
+    starts, stops = _true_runs(row)
+    assert_array_equal(starts, [0, 3, 6])
+    assert_array_equal(stops, [2, 4, 7])
+    starts, stops = _true_runs(np.zeros(4, dtype=bool))
+    assert len(starts) == len(stops) == 0
+
+
+def test_merge_runs():
+    from contact_map.concurrence import _merge_runs
+    starts, stops = _merge_runs(np.array([0, 3, 10]), np.array([2, 4, 12]),
+                                min_gap=2)
+    assert_array_equal(starts, [0, 10])
+    assert_array_equal(stops, [4, 12])
+    starts, stops = _merge_runs(np.array([], dtype=int),
+                                np.array([], dtype=int), min_gap=2)
+    assert len(starts) == len(stops) == 0
+
+
+@pytest.mark.parametrize('values', [
+    [[True] * 10 + [False] * 10, [False] * 20],  # always-absent contact
+    np.zeros((2, 0), dtype=bool),  # no frames
+])
+def test_plot_segments_empty_rows(values):
+    plt = pytest.importorskip('matplotlib.pyplot')
+    plt.close('all')
+    concurrence = Concurrence(np.array(values), labels=['a', 'b'])
+    _, ax, _ = ConcurrencePlotter(concurrence).plot(style="segments",
+                                                    decimate=5)
+    assert [bar.get_label() for bar in ax.collections] == ['a', 'b']
+
+
+@pytest.mark.parametrize('conc_type', ['atom', 'residue'])
+def test_concurrence_cache(conc_type):
+    import shutil
+    from contact_map import ContactCache
+    directory = "test_cache"
+    cache = ContactCache(directory)
+    cls, contact_count = {
+        'atom': (AtomContactConcurrence, contacts.atom_contacts),
+        'residue': (ResidueContactConcurrence, contacts.residue_contacts)
+    }[conc_type]
+    concurrence = cls(traj, contact_count.most_common(), cutoff=0.051,
+                      cache=cache)
+    assert cache.size > 0
+    cached = cls(traj, contact_count.most_common(), cutoff=0.051,
+                 cache=cache)
+    assert cached.values == concurrence.values
+    shutil.rmtree(directory)
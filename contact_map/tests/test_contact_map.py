@@ -13,6 +13,8 @@ from .utils import *
 # stuff to be testing in this file
 from contact_map.contact_map import *
 from contact_map.contact_count import HAS_MATPLOTLIB, ContactCount
+from contact_map.checkpoint import ContactCheckpoint
+from contact_map.atom_indexer import AtomSlicedIndexer, IdentityIndexer
 
 traj = md.load(find_testfile("trajectory.pdb"))
 
@@ -542,6 +544,236 @@ class TestContactFrequency(object):
         assert test_subject.residue_contacts.counter == \
             last_frame.residue_contacts.counter
 
+    def test_checkpoint(self):
+        filename = "test_checkpoint.jsonl"
+        checkpoint = ContactCheckpoint(filename, interval=2)
+        cmap = ContactFrequency(trajectory=traj, cutoff=0.075,
+                                n_neighbors_ignored=0,
+                                checkpoint=checkpoint)
+        _contact_object_compare(cmap, self.map)
+        with open(filename) as f:
+            lines = f.readlines()
+        assert len(lines) == 3
+
+        # simulate an interrupted run: only the first block was written
+        with open(filename, "w") as f:
+            f.write(lines[0])
+        restarted = ContactFrequency(trajectory=traj, cutoff=0.075,
+                                     n_neighbors_ignored=0,
+                                     checkpoint=checkpoint)
+        _contact_object_compare(restarted, self.map)
+        with open(filename) as f:
+            assert len(f.readlines()) == 3
+        os.remove(filename)
+
+    @pytest.mark.parametrize("query", [None, [4, 5]])
+    def test_from_cutoffs(self, query):
+        cutoffs = [0.1, 0.05, 0.075]
+        maps = ContactFrequency.from_cutoffs(traj, cutoffs, query=query,
+                                             n_neighbors_ignored=0)
+        assert set(maps) == set(cutoffs)
+        for cutoff in cutoffs:
+            expected = ContactFrequency(traj, cutoff=cutoff, query=query,
+                                        n_neighbors_ignored=0)
+            assert maps[cutoff] == expected
+
+    @pytest.mark.parametrize("n_neighbors_ignored", [0, 1, 2, 3])
+    def test_with_neighbors_ignored(self, n_neighbors_ignored):
+        cmap = self.map.with_neighbors_ignored(n_neighbors_ignored)
+        expected = ContactFrequency(trajectory=traj, cutoff=0.075,
+                                    n_neighbors_ignored=n_neighbors_ignored)
+        _contact_object_compare(cmap, expected)
+        assert cmap == expected
+
+    def test_with_neighbors_ignored_from_json(self):
+        reloaded = ContactFrequency.from_json(self.map.to_json())
+        cmap = reloaded.with_neighbors_ignored(2)
+        expected = ContactFrequency(trajectory=traj, cutoff=0.075,
+                                    n_neighbors_ignored=2)
+        assert cmap == expected
+
+    def test_with_neighbors_ignored_frames(self):
+        cmap = ContactFrequency(trajectory=traj, cutoff=0.075,
+                                n_neighbors_ignored=0, store_frames=True)
+        filtered = cmap.with_neighbors_ignored(1).subset(query=[4, 5])
+        expected = ContactFrequency(trajectory=traj, cutoff=0.075,
+                                    n_neighbors_ignored=1, query=[4, 5])
+        assert filtered == expected
+
+    def test_with_neighbors_ignored_error(self):
+        cmap = ContactFrequency(trajectory=traj, cutoff=0.075,
+                                n_neighbors_ignored=1)
+        with pytest.raises(RuntimeError):
+            cmap.with_neighbors_ignored(0)
+
+    @pytest.mark.parametrize("selection", ["query", "haystack", "both"])
+    def test_subset(self, selection):
+        cmap = ContactFrequency(trajectory=traj, cutoff=0.075,
+                                n_neighbors_ignored=0, store_frames=True)
+        subset_atoms = [0, 1, 4, 5]
+        kwargs = {'query': {'query': subset_atoms},
+                  'haystack': {'haystack': subset_atoms},
+                  'both': {'query': [4, 5],
+                           'haystack': [0, 1, 6, 7, 8, 9]}}[selection]
+        subset = cmap.subset(**kwargs)
+        expected = ContactFrequency(trajectory=traj, cutoff=0.075,
+                                    n_neighbors_ignored=0, **kwargs)
+        _contact_object_compare(subset, expected)
+        assert subset.atom_contacts.counter == expected.atom_contacts.counter
+        assert subset.residue_contacts.counter == \
+                expected.residue_contacts.counter
+
+    def test_subset_add_contact_frequency(self):
+        half0 = ContactFrequency(trajectory=traj[:2], cutoff=0.075,
+                                 n_neighbors_ignored=0, store_frames=True)
+        half1 = ContactFrequency(trajectory=traj[2:], cutoff=0.075,
+                                 n_neighbors_ignored=0, store_frames=True)
+        half0.add_contact_frequency(half1)
+        expected = ContactFrequency(trajectory=traj, cutoff=0.075,
+                                    n_neighbors_ignored=0, query=[4, 5])
+        subset = half0.subset(query=[4, 5])
+        assert subset.residue_contacts.counter == \
+                expected.residue_contacts.counter
+
+    def test_subset_errors(self):
+        # without per-frame information
+        with pytest.raises(RuntimeError):
+            self.map.subset(query=[4, 5])
+
+        cmap = ContactFrequency(trajectory=traj, cutoff=0.075,
+                                n_neighbors_ignored=0, query=[4, 5],
+                                store_frames=True)
+        # new selection is not a subset of the old one
+        with pytest.raises(RuntimeError):
+            cmap.subset(query=[4, 6])
+
+    def test_store_frames_dtype(self):
+        cmap = ContactFrequency(trajectory=traj, cutoff=0.075,
+                                n_neighbors_ignored=0, store_frames=True)
+        keys, offsets = cmap._frame_contacts
+        assert keys.dtype == np.int64
+        assert offsets.dtype == np.int64
+
+    def test_store_frames_serialization(self):
+        cmap = ContactFrequency(trajectory=traj, cutoff=0.075,
+                                n_neighbors_ignored=0, store_frames=True)
+        reloaded = ContactFrequency.from_json(cmap.to_json())
+        assert reloaded.subset(query=[4, 5]) == cmap.subset(query=[4, 5])
+
+    @pytest.mark.parametrize("level", ["atom", "residue"])
+    def test_contact_levels(self, level):
+        cmap = ContactFrequency(trajectory=traj, cutoff=0.075,
+                                n_neighbors_ignored=0, contacts=(level,))
+        other = {'atom': 'residue', 'residue': 'atom'}[level]
+        assert getattr(cmap, level + '_contacts').counter == \
+                getattr(self.map, level + '_contacts').counter
+        assert getattr(cmap, '_' + other + '_contacts') is None
+        with pytest.raises(RuntimeError):
+            getattr(cmap, other + '_contacts')
+
+        # missing levels survive serialization, addition, and filtering
+        reloaded = ContactFrequency.from_json(cmap.to_json())
+        assert reloaded == cmap
+        cmap.add_contact_frequency(self.map)
+        assert getattr(cmap, '_' + other + '_contacts') is None
+        filtered = cmap.with_neighbors_ignored(1)
+        assert getattr(filtered, '_' + other + '_contacts') is None
+
+    def test_contact_levels_errors(self):
+        with pytest.raises(RuntimeError):
+            ContactFrequency(trajectory=traj, cutoff=0.075,
+                             contacts=("atom", "chain"))
+        with pytest.raises(RuntimeError):
+            ContactFrequency(trajectory=traj, cutoff=0.075,
+                             contacts=("residue",), store_frames=True)
+
+    def test_contact_levels_checkpoint(self, tmpdir):
+        checkpoint = ContactCheckpoint(str(tmpdir.join("ckpt.jsonl")),
+                                       interval=2)
+        cmap = ContactFrequency(trajectory=traj, cutoff=0.075,
+                                n_neighbors_ignored=0, checkpoint=checkpoint,
+                                contacts=("residue",))
+        assert cmap._atom_contacts is None
+        assert cmap.residue_contacts.counter == \
+                self.map.residue_contacts.counter
+        # the full calculation is not confused with the residue-only one
+        full = ContactFrequency(trajectory=traj, cutoff=0.075,
+                                n_neighbors_ignored=0, checkpoint=checkpoint)
+        assert full == self.map
+
+    @pytest.mark.parametrize("n_threads", [2, 3])
+    def test_n_threads(self, n_threads, monkeypatch):
+        monkeypatch.setattr(AtomSlicedIndexer, 'block_size', 2)
+        monkeypatch.setattr(IdentityIndexer, 'block_size', 2)
+        cmap = ContactFrequency(trajectory=traj, cutoff=0.075,
+                                n_neighbors_ignored=0, store_frames=True,
+                                n_threads=n_threads)
+        expected = ContactFrequency(trajectory=traj, cutoff=0.075,
+                                    n_neighbors_ignored=0, store_frames=True)
+        assert cmap == expected
+        for (threaded, single) in zip(cmap._frame_contacts,
+                                      expected._frame_contacts):
+            assert_array_equal(threaded, single)
+
+    @pytest.mark.parametrize("store_frames", [True, False])
+    def test_extend(self, store_frames):
+        cmap = ContactFrequency(trajectory=traj[:2], cutoff=0.075,
+                                n_neighbors_ignored=0,
+                                store_frames=store_frames)
+        indexer = cmap.indexer
+        cmap.extend(traj[2:4])
+        cmap.extend(traj[4:])
+        expected = ContactFrequency(trajectory=traj, cutoff=0.075,
+                                    n_neighbors_ignored=0,
+                                    store_frames=store_frames)
+        assert cmap.indexer is indexer
+        assert cmap.n_frames == len(traj)
+        assert cmap == expected
+        if store_frames:
+            for (extended, full) in zip(cmap._frame_contacts,
+                                        expected._frame_contacts):
+                assert_array_equal(extended, full)
+        else:
+            assert cmap._frame_contacts is None
+
+    @pytest.mark.parametrize("store_frames", [True, False])
+    @pytest.mark.parametrize("query", [None, [4, 5]])
+    def test_extend_from_json(self, store_frames, query):
+        cmap = ContactFrequency(trajectory=traj[:3], cutoff=0.075,
+                                n_neighbors_ignored=0, query=query,
+                                store_frames=store_frames, n_threads=2)
+        reloaded = ContactFrequency.from_json(cmap.to_json())
+        reloaded.extend(traj[3:])
+        expected = ContactFrequency(trajectory=traj, cutoff=0.075,
+                                    n_neighbors_ignored=0, query=query,
+                                    store_frames=store_frames)
+        assert reloaded.n_frames == len(traj)
+        assert reloaded == expected
+        if store_frames:
+            for (extended, full) in zip(reloaded._frame_contacts,
+                                        expected._frame_contacts):
+                assert_array_equal(extended, full)
+
+    def test_extend_wrong_atoms(self):
+        with pytest.raises(RuntimeError):
+            self.map.extend(traj.atom_slice(self.atoms))
+
+    @pytest.mark.parametrize("use_atom_slice", [True, False])
+    def test_slice_blocks(self, use_atom_slice, monkeypatch):
+        class_default = ContactFrequency._class_use_atom_slice
+        ContactFrequency._class_use_atom_slice = use_atom_slice
+        cmap = ContactFrequency(trajectory=traj, cutoff=0.075,
+                                n_neighbors_ignored=0, query=self.atoms,
+                                haystack=self.atoms)
+        monkeypatch.setattr(type(cmap.indexer), 'block_size', 2)
+        blocks = list(cmap.indexer.slice_blocks(traj, slice(1, 5)))
+        assert [block for block, _ in blocks] == [slice(1, 3), slice(3, 5)]
+        # blocked calculation gives the same result
+        counts = cmap._count_contacts(traj, slice(0, len(traj)))
+        assert counts[0] == cmap._atom_contacts
+        assert counts[1] == cmap._residue_contacts
+        ContactFrequency._class_use_atom_slice = class_default
+
     @pytest.mark.parametrize("use_atom_slice", [True, False, None])
     def test_use_atom_slice(self, use_atom_slice):
         # Set class default before init
@@ -576,6 +808,12 @@ class TestContactFrequency(object):
             else:
                 assert sliced_traj is traj
 
+            blocks = list(m.indexer.slice_blocks(traj))
+            assert [block for block, _ in blocks] == [slice(0, len(traj))]
+            assert blocks[0][1].topology.n_atoms == \
+                    sliced_traj.topology.n_atoms
+            assert np.all(blocks[0][1].xyz == sliced_traj.xyz)
+
             # Test counters
             self.test_counters()
         # Reset class default as pytest does not re-import
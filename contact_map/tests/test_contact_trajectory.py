@@ -12,6 +12,9 @@ import mdtraj as md
 
 from contact_map.contact_trajectory import *
 from contact_map.contact_count import ContactCount
+from contact_map.checkpoint import ContactCheckpoint
+from contact_map.concurrence import (AtomContactConcurrence,
+                                     ResidueContactConcurrence)
 
 TRAJ_ATOM_CONTACTS = [
     [[1, 4], [4, 6], [5, 6]],
@@ -135,6 +138,132 @@ class TestContactTrajectory(object):
         _contact_object_compare(self.map, reloaded)
         assert self.map == reloaded
 
+    def test_checkpoint(self, monkeypatch):
+        filename = "test_checkpoint.jsonl"
+        checkpoint = ContactCheckpoint(filename, interval=2)
+        cmap = ContactTrajectory(self.traj, cutoff=0.075,
+                                 n_neighbors_ignored=0,
+                                 checkpoint=checkpoint)
+        assert cmap == self.map
+        # rerun only reads from the checkpoint
+        def recalculate(*args, **kwargs):
+            raise AssertionError("Recalculated checkpointed frames")
+        monkeypatch.setattr(ContactTrajectory, '_frame_contacts',
+                            recalculate)
+        reloaded = ContactTrajectory(self.traj, cutoff=0.075,
+                                     n_neighbors_ignored=0,
+                                     checkpoint=checkpoint)
+        assert reloaded == self.map
+        os.remove(filename)
+
+    @pytest.mark.parametrize('n_neighbors_ignored', [0, 1, 2])
+    def test_with_neighbors_ignored(self, n_neighbors_ignored):
+        cmap = self.map.with_neighbors_ignored(n_neighbors_ignored)
+        expected = ContactTrajectory(self.traj, cutoff=0.075,
+                                     n_neighbors_ignored=n_neighbors_ignored)
+        _contact_object_compare(cmap, expected)
+        assert cmap == expected
+
+    def test_with_neighbors_ignored_from_json(self):
+        reloaded = ContactTrajectory.from_json(self.map.to_json())
+        cmap = reloaded.with_neighbors_ignored(2)
+        expected = ContactTrajectory(self.traj, cutoff=0.075,
+                                     n_neighbors_ignored=2)
+        assert cmap == expected
+
+    @pytest.mark.parametrize('contact_type', ['atom', 'residue'])
+    def test_subset(self, contact_type):
+        query = [4, 5]
+        haystack = [0, 1, 6, 7, 8, 9]
+        subset = self.map.subset(query=query, haystack=haystack)
+        expected = ContactTrajectory(self.traj, query=query,
+                                     haystack=haystack, cutoff=0.075,
+                                     n_neighbors_ignored=0)
+        assert len(subset) == len(expected)
+        _contact_object_compare(subset, expected)
+        contacts = {'atom': (subset.atom_contacts, expected.atom_contacts),
+                    'residue': (subset.residue_contacts,
+                                expected.residue_contacts)}[contact_type]
+        for contact, expect in zip(*contacts):
+            assert contact.counter == expect.counter
+
+    def test_n_threads(self):
+        ctraj = ContactTrajectory(self.traj, cutoff=0.075,
+                                  n_neighbors_ignored=0, n_threads=2)
+        assert ctraj == self.map
+
+    def test_extend(self):
+        ctraj = ContactTrajectory(self.traj[:2], cutoff=0.075,
+                                  n_neighbors_ignored=0)
+        ctraj.extend(self.traj[2:])
+        assert len(ctraj) == len(self.map)
+        assert ctraj == self.map
+        with pytest.raises(RuntimeError):
+            ctraj.extend(self.traj.atom_slice(range(5)))
+
+    @pytest.mark.parametrize('level', ['atom', 'residue'])
+    def test_concurrence(self, level):
+        freq = self.map.contact_frequency()
+        contacts = freq.contacts[level].most_common()
+        concurrence = self.map.concurrence(contacts, level=level)
+        if level == 'atom':
+            expected = AtomContactConcurrence(self.traj, contacts,
+                                              cutoff=0.075)
+        else:
+            expected = ResidueContactConcurrence(self.traj, contacts,
+                                                 cutoff=0.075, select="")
+        assert concurrence.labels == expected.labels
+        assert concurrence.values == expected.values
+        # other input types are also accepted
+        assert self.map.concurrence(freq, level).values == expected.values
+
+    def test_concurrence_repeated_and_absent(self):
+        top = self.traj.topology
+        # repeated contact, and a contact that is never made
+        contacts = [([top.atom(4), top.atom(6)], 1.0),
+                    ([top.atom(0), top.atom(9)], 0.2),
+                    ([top.atom(6), top.atom(4)], 1.0),
+                    ([top.atom(2), top.atom(3)], 0.0)]
+        concurrence = self.map.concurrence(contacts, level="atom")
+        assert concurrence.values == [[True] * 5,
+                                      [False] * 4 + [True],
+                                      [True] * 5,
+                                      [False] * 5]
+        assert self.map.concurrence([], level="atom").values == []
+
+    def test_lifetimes(self):
+        contacts = self.map.contact_frequency().residue_contacts
+        lifetimes = self.map.lifetimes(contacts, level="residue")
+        concurrence = self.map.concurrence(contacts, level="residue")
+        assert lifetimes.n_frames == len(self.map)
+        for (lengths, row) in zip(lifetimes.lifetimes(), concurrence.values):
+            assert lengths.sum() == sum(row)
+
+    def test_concurrence_errors(self):
+        contacts = self.map.contact_frequency().atom_contacts
+        with pytest.raises(RuntimeError):
+            self.map.concurrence(contacts, level="foo")
+        ctraj = ContactTrajectory(self.traj, cutoff=0.075,
+                                  n_neighbors_ignored=0,
+                                  contacts=("residue",))
+        with pytest.raises(RuntimeError):
+            ctraj.concurrence(contacts, level="atom")
+
+    def test_residue_contacts_only(self):
+        ctraj = ContactTrajectory(self.traj, cutoff=0.075,
+                                  n_neighbors_ignored=0,
+                                  contacts=("residue",))
+        assert len(ctraj) == len(self.map)
+        for contacts, expected in zip(ctraj.residue_contacts,
+                                      self.map.residue_contacts):
+            assert contacts.counter == expected.counter
+        with pytest.raises(RuntimeError):
+            ctraj.atom_contacts
+        freq = ctraj.contact_frequency()
+        assert freq._atom_contacts is None
+        assert freq.residue_contacts.counter == \
+                self.map.contact_frequency().residue_contacts.counter
+
     def test_from_contact_maps(self):
         maps = [ContactFrequency(frame, cutoff=0.075, n_neighbors_ignored=0)
                 for frame in self.traj]
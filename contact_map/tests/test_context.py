@@ -0,0 +1,81 @@
+# pylint: disable=wildcard-import, missing-docstring, protected-access
+# pylint: disable=attribute-defined-outside-init, invalid-name, no-self-use
+# pylint: disable=wrong-import-order, unused-wildcard-import
+
+from .utils import *
+from .test_contact_map import traj
+
+import mdtraj as md
+import contact_map.context
+from contact_map.context import *
+from contact_map import ContactFrequency, ContactTrajectory
+
+
+class TestContactContext(object):
+    def setup(self):
+        clear_context_cache()
+        self.topology = traj.topology
+
+    def test_get_context_shared(self):
+        context = get_context(self.topology, n_neighbors_ignored=0)
+        assert get_context(self.topology, n_neighbors_ignored=0) is context
+        assert get_context(self.topology, query=list(range(10)),
+                           n_neighbors_ignored=0) is context
+        other = get_context(self.topology, n_neighbors_ignored=1)
+        assert other is not context
+        assert other != context
+        assert hash(context) == hash(get_context(self.topology,
+                                                 n_neighbors_ignored=0))
+
+    def test_context_attributes(self):
+        context = get_context(self.topology, query=[4, 5],
+                              haystack=[0, 1, 4], n_neighbors_ignored=0)
+        assert context.query == frozenset([4, 5])
+        assert context.haystack == frozenset([0, 1, 4])
+        assert context.all_atoms == (0, 1, 4, 5)
+        assert context.all_residues == frozenset([0, 2])
+        assert context.use_atom_slice
+        assert context.fingerprint == memoized_fingerprint(self.topology)
+        query, haystack_mask = context.sliced_selections
+        assert list(query) == [2, 3]
+        assert list(haystack_mask) == [True, True, True, False]
+
+    def test_shared_by_contact_objects(self):
+        cmap = ContactFrequency(traj, cutoff=0.075, n_neighbors_ignored=0)
+        ctraj = ContactTrajectory(traj, cutoff=0.075, n_neighbors_ignored=0)
+        assert cmap._context is ctraj._context
+        assert cmap.indexer is ctraj.indexer
+        for frame_map in ctraj:
+            assert frame_map.indexer is ctraj.indexer
+
+    def test_cache_bounded(self, monkeypatch):
+        monkeypatch.setattr(contact_map.context, 'CONTEXT_CACHE_SIZE', 2)
+        first = get_context(self.topology, n_neighbors_ignored=0)
+        get_context(self.topology, n_neighbors_ignored=1)
+        get_context(self.topology, n_neighbors_ignored=2)
+        assert len(contact_map.context._contexts) == 2
+        # the least recently used context was removed
+        assert get_context(self.topology, n_neighbors_ignored=0) \
+                is not first
+
+
+@pytest.mark.parametrize('n_neighbors_ignored', [0, 1, 2])
+def test_residue_ignored_atoms(n_neighbors_ignored):
+    topology = md.load(find_testfile("concurrence.pdb")).topology
+    query = list(range(0, topology.n_atoms, 3))
+    context = get_context(topology, query=query,
+                          n_neighbors_ignored=n_neighbors_ignored)
+    exclusion = context.exclusion
+    ignored = exclusion.residue_ignored_atoms
+    assert set(ignored) == set(context.indexer.residue_query_atom_idxs)
+    for (residue_idx, atoms) in ignored.items():
+        residue = topology.residue(residue_idx)
+        expected = set(
+            idx for (idx, res_idx)
+            in enumerate(context.indexer.atom_idx_to_residue_idx)
+            if topology.residue(res_idx).chain == residue.chain
+            and abs(res_idx - residue_idx) <= n_neighbors_ignored
+        )
+        assert atoms == expected
+    # built once
+    assert exclusion.residue_ignored_atoms is ignored
@@ -67,3 +67,45 @@ class TestDaskContactFrequency(object):
         assert dask_freq0._use_atom_slice is True
         assert dask_freq1._use_atom_slice is False
         assert dask_freq0 == dask_freq1
+
+    def test_dask_checkpoint(self):
+        dask = pytest.importorskip('dask')  # pylint: disable=W0612
+        distributed = pytest.importorskip('dask.distributed')
+        from contact_map import ContactCheckpoint
+        cluster = dask_setup_test_cluster(distributed, n_workers=4)
+        client = distributed.Client(cluster)
+        filename = find_testfile("trajectory.pdb")
+        checkpoint_file = "test_checkpoint.jsonl"
+        checkpoint = ContactCheckpoint(checkpoint_file, interval=2)
+
+        dask_freq = DaskContactFrequency(client, filename, cutoff=0.075,
+                                         n_neighbors_ignored=0,
+                                         checkpoint=checkpoint)
+        rerun = DaskContactFrequency(client, filename, cutoff=0.075,
+                                     n_neighbors_ignored=0,
+                                     checkpoint=checkpoint)
+        client.close()
+        with open(checkpoint_file) as f:
+            assert len(f.readlines()) == 3
+        os.remove(checkpoint_file)
+        local_freq = ContactFrequency(md.load(filename), cutoff=0.075,
+                                      n_neighbors_ignored=0)
+        assert dask_freq == local_freq
+        assert rerun == local_freq
+
+    def test_dask_execution_options(self):
+        dask = pytest.importorskip('dask')  # pylint: disable=W0612
+        distributed = pytest.importorskip('dask.distributed')
+        cluster = dask_setup_test_cluster(distributed, n_workers=2)
+        client = distributed.Client(cluster)
+        filename = find_testfile("trajectory.pdb")
+        options = dict(engine="kdtree", residue_prefilter=True, n_threads=2)
+
+        dask_freq = DaskContactFrequency(client, filename, cutoff=0.075,
+                                         n_neighbors_ignored=0, **options)
+        client.close()
+        for (name, value) in options.items():
+            assert dask_freq.parameters[name] == value
+        local_freq = ContactFrequency(md.load(filename), cutoff=0.075,
+                                      n_neighbors_ignored=0)
+        assert dask_freq == local_freq
@@ -0,0 +1,105 @@
+# pylint: disable=wildcard-import, missing-docstring, protected-access
+# pylint: disable=attribute-defined-outside-init, invalid-name, no-self-use
+# pylint: disable=wrong-import-order, unused-wildcard-import
+
+from .utils import *
+from .test_contact_map import traj
+from .test_neighbor_search import _sparse_trajectory
+
+from contact_map.engines import *
+from contact_map import ContactFrequency, ContactTrajectory, NearestAtoms
+
+ENGINE_NAMES = ["mdtraj", "kdtree", "cell_list", "numba", "auto"]
+
+
+def _skip_unavailable(name):
+    if not ENGINES[name].is_available():
+        pytest.skip("engine " + name + " is not available")
+
+
+def _pair_set(first, second):
+    return set(zip(first.tolist(), second.tolist()))
+
+
+@pytest.mark.parametrize("name", ENGINE_NAMES)
+@pytest.mark.parametrize("periodic", [True, False])
+def test_engine_search(name, periodic):
+    _skip_unavailable(name)
+    trajectory = _sparse_trajectory(periodic)
+    xyz = trajectory.xyz[0]
+    box = frame_box(trajectory, 0)
+    query = np.arange(0, 90)
+    haystack = np.arange(30, trajectory.n_atoms)
+    expected = _pair_set(*get_engine("mdtraj").search(xyz, box, query,
+                                                      haystack, 0.3))
+    pairs = _pair_set(*get_engine(name).search(xyz, box, query, haystack,
+                                               0.3))
+    assert len(expected) > 0
+    assert pairs == expected
+
+
+def test_engine_triclinic_fallback():
+    trajectory = _sparse_trajectory(periodic=True)
+    trajectory.unitcell_angles = np.full((len(trajectory), 3), 80.0)
+    xyz = trajectory.xyz[0]
+    box = frame_box(trajectory, 0)
+    atoms = np.arange(trajectory.n_atoms)
+    expected = _pair_set(*get_engine("mdtraj").search(xyz, box, atoms,
+                                                      atoms, 0.3))
+    assert _pair_set(*get_engine("kdtree").search(xyz, box, atoms, atoms,
+                                                  0.3)) == expected
+
+
+def test_get_engine():
+    engine = KDTreeEngine()
+    assert get_engine(engine) is engine
+    assert isinstance(get_engine("cell_list"), CellListEngine)
+    assert "mdtraj" in available_engines()
+    with pytest.raises(RuntimeError):
+        get_engine("foo")
+
+
+def test_register_engine():
+    @register_engine
+    class ReversedEngine(NeighborSearchEngine):
+        name = "reversed"
+
+        def _search(self, xyz, box, lengths, query, haystack, cutoff):
+            first, second = MDTrajEngine()._search(xyz, box, lengths,
+                                                   query, haystack, cutoff)
+            return first[::-1], second[::-1]
+
+    try:
+        cmap = ContactFrequency(traj, cutoff=0.075, n_neighbors_ignored=0,
+                                engine="reversed")
+        assert cmap == ContactFrequency(traj, cutoff=0.075,
+                                        n_neighbors_ignored=0)
+    finally:
+        del ENGINES["reversed"]
+
+
+def test_auto_engine_calibration(monkeypatch):
+    monkeypatch.setattr(AutoEngine, 'small_system', 0)
+    monkeypatch.setattr(AutoEngine, '_choices', {})
+    trajectory = _sparse_trajectory(periodic=True)
+    engine = get_engine("auto")
+    cmap = ContactFrequency(trajectory, cutoff=0.3, engine=engine)
+    assert engine.engine.name in available_engines()
+    assert len(AutoEngine._choices) == 1
+    assert cmap == ContactFrequency(trajectory, cutoff=0.3)
+
+
+@pytest.mark.parametrize("name", ENGINE_NAMES)
+def test_contact_objects_engine(name):
+    _skip_unavailable(name)
+    kwargs = dict(cutoff=0.075, n_neighbors_ignored=0)
+    assert ContactFrequency(traj, engine=name, **kwargs) \
+            == ContactFrequency(traj, **kwargs)
+    assert ContactTrajectory(traj, engine=name, **kwargs) \
+            == ContactTrajectory(traj, **kwargs)
+    nearest = NearestAtoms(traj, cutoff=0.075, engine=name)
+    expected = NearestAtoms(traj, cutoff=0.075)
+    assert nearest.nearest == expected.nearest
+    maps = ContactFrequency.from_cutoffs(traj, [0.05, 0.075], engine=name,
+                                         n_neighbors_ignored=0)
+    assert maps[0.075] == ContactFrequency(traj, **kwargs)
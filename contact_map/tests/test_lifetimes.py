@@ -0,0 +1,102 @@
+# pylint: disable=wildcard-import, missing-docstring, protected-access
+# pylint: disable=attribute-defined-outside-init, invalid-name, no-self-use
+# pylint: disable=wrong-import-order, unused-wildcard-import
+
+import itertools
+
+from .utils import *
+
+from contact_map.lifetimes import *
+from contact_map.concurrence import Concurrence
+
+VALUES = [
+    [True, True, False, True, False, False, True, True, True, False],
+    [False, False, True, True, True, True, True, False, True, True],
+    [False] * 10,
+    [True] * 10,
+]
+
+
+def _brute_force_runs(row):
+    runs = []
+    for (value, group) in itertools.groupby(enumerate(row),
+                                            key=lambda x: x[1]):
+        group = list(group)
+        if value:
+            runs.append((group[0][0], len(group)))
+    return runs
+
+
+class TestContactLifetimes(object):
+    def setup(self):
+        self.concurrence = Concurrence(VALUES, labels=list('abcd'))
+        self.lifetimes = ContactLifetimes.from_concurrence(self.concurrence)
+
+    @pytest.mark.parametrize('chunk_size', [1, 3, 8])
+    def test_add_chunks(self, chunk_size):
+        lifetimes = ContactLifetimes(len(VALUES))
+        values = np.array(VALUES)
+        for start in range(0, values.shape[1], chunk_size):
+            lifetimes.add(values[:, start:start + chunk_size])
+        lifetimes.add(values[:, :0])  # empty block changes nothing
+        assert lifetimes.n_frames == 10
+        for (result, expected) in zip(lifetimes.lifetimes(),
+                                      self.lifetimes.lifetimes()):
+            assert_array_equal(result, expected)
+
+    def test_lifetimes(self):
+        for (lengths, row) in zip(self.lifetimes.lifetimes(), VALUES):
+            expected = [length for (_, length) in _brute_force_runs(row)]
+            assert_array_equal(lengths, expected)
+        assert self.lifetimes.labels == list('abcd')
+
+    def test_lifetimes_no_truncated(self):
+        lengths = self.lifetimes.lifetimes(include_truncated=False)
+        assert_array_equal(lengths[0], [1, 3])
+        assert_array_equal(lengths[1], [5])
+        assert len(lengths[2]) == len(lengths[3]) == 0
+
+    def test_mean_lifetimes(self):
+        means = self.lifetimes.mean_lifetimes()
+        assert_allclose(means[:2], [2.0, 3.5])
+        assert np.isnan(means[2])
+        assert means[3] == 10
+        means = self.lifetimes.mean_lifetimes(include_truncated=False)
+        assert_allclose(means[:2], [2.0, 5.0])
+
+    def test_transitions(self):
+        assert_array_equal(self.lifetimes.n_formed, [2, 2, 0, 0])
+        assert_array_equal(self.lifetimes.n_broken, [3, 1, 0, 0])
+        assert_allclose(self.lifetimes.formation_rates[:3],
+                        [2.0 / 4.0, 2.0 / 3.0, 0.0])
+        assert np.isnan(self.lifetimes.formation_rates[3])
+        assert_allclose(self.lifetimes.breaking_rates[[0, 1, 3]],
+                        [3.0 / 6.0, 1.0 / 7.0, 0.0])
+        assert np.isnan(self.lifetimes.breaking_rates[2])
+
+    def test_survival(self):
+        survival = self.lifetimes.survival()
+        assert survival.shape == (4, 11)
+        # contact a: runs of 2, 1, 3
+        assert_allclose(survival[0, :5], [1.0, 2.0 / 3.0, 1.0 / 3.0, 0.0,
+                                          0.0])
+        assert np.all(np.isnan(survival[2]))
+        assert_allclose(survival[3], [1.0] * 10 + [0.0])
+
+    def test_concurrence_lifetimes(self):
+        lifetimes = self.concurrence.lifetimes
+        assert isinstance(lifetimes, ContactLifetimes)
+        assert_array_equal(lifetimes.n_formed, self.lifetimes.n_formed)
+
+
+@pytest.mark.parametrize("concurrence", [
+    Concurrence(np.zeros((0, 5), dtype=bool)),
+    Concurrence([], n_frames=5),  # already packed
+])
+def test_no_contacts(concurrence):
+    lifetimes = ContactLifetimes.from_concurrence(concurrence, chunk_size=8)
+    assert lifetimes.n_frames == 5
+    assert lifetimes.lifetimes() == []
+    assert lifetimes.mean_lifetimes().shape == (0,)
+    assert lifetimes.n_formed.shape == (0,)
+    assert lifetimes.survival().shape == (0, 1)
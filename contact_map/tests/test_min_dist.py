@@ -3,6 +3,7 @@
 # pylint: disable=missing-docstring, no-self-use, protected-access
 # pylint: disable=attribute-defined-outside-init, invalid-name
 
+import collections
 import mdtraj as md
 
 #includes pytest
@@ -106,6 +107,112 @@ class TestNearestAtoms(object):
             assert expected in sorted_distances
 
 
+def _line_trajectory(positions):
+    # one atom per residue, along the x axis
+    topology = md.Topology()
+    chain = topology.add_chain()
+    for _ in positions:
+        residue = topology.add_residue('ALA', chain)
+        topology.add_atom('CA', md.element.carbon, residue)
+    xyz = np.zeros((1, len(positions), 3), dtype=np.float32)
+    xyz[0, :, 0] = positions
+    return md.Trajectory(xyz, topology)
+
+
+def test_nearest_atoms_ties():
+    # atom 1 is equally far from atoms 0 and 2: the smaller index wins
+    trajectory = _line_trajectory([0.0, 0.25, 0.5, 1.5])
+    nearest = NearestAtoms(trajectory, cutoff=0.3)
+    assert nearest.nearest == {0: 1, 1: 0, 2: 1}
+    assert nearest.nearest_distance == pytest.approx({0: 0.25, 1: 0.25,
+                                                      2: 0.25})
+
+
+def test_nearest_atoms_none_in_cutoff():
+    nearest = NearestAtoms(traj, cutoff=0.001)
+    assert nearest.nearest == {}
+    assert nearest.nearest_distance == {}
+
+
+@pytest.mark.parametrize("excluded", [None, {}, {4: [6], 6: [4, 5]}])
+def test_nearest_atoms_brute_force(excluded):
+    nearest = NearestAtoms(traj, cutoff=0.075, frame_number=4,
+                           excluded=excluded)
+    parsed = NearestAtoms._parse_excluded(excluded, traj)
+    for atom in range(traj.n_atoms):
+        others = [other for other in range(traj.n_atoms)
+                  if other != atom and other not in parsed.get(atom, [])]
+        distances = md.compute_distances(
+            traj[4], [[atom, other] for other in others]
+        )[0]
+        close = [(dist, other) for (dist, other) in zip(distances, others)
+                 if dist <= 0.075]
+        if close:
+            dist, other = min(close)
+            assert nearest.nearest[atom] == other
+            assert nearest.nearest_distance[atom] == pytest.approx(dist)
+        else:
+            assert atom not in nearest.nearest
+
+
+class TestNearestAtomsTrajectory(object):
+    def setup(self):
+        self.nearest = NearestAtomsTrajectory(traj, cutoff=0.075,
+                                              chunk_size=2)
+
+    def test_initialization(self):
+        assert self.nearest.nearest.shape == (len(traj), traj.n_atoms)
+        assert self.nearest.nearest_distance.shape == (len(traj),
+                                                       traj.n_atoms)
+        assert self.nearest.excluded == NearestAtoms._parse_excluded(None,
+                                                                     traj)
+
+    @pytest.mark.parametrize("frame", range(5))
+    def test_matches_nearest_atoms(self, frame):
+        single = NearestAtoms(traj, cutoff=0.075, frame_number=frame)
+        nearest = self.nearest.nearest[frame]
+        distances = self.nearest.nearest_distance[frame]
+        assert set(np.nonzero(nearest >= 0)[0]) == set(single.nearest)
+        for (atom, other) in single.nearest.items():
+            assert nearest[atom] == other
+            assert distances[atom] == \
+                pytest.approx(single.nearest_distance[atom])
+        assert np.all(np.isnan(distances[nearest < 0]))
+
+    @pytest.mark.parametrize("chunk_size", [1, 2, 10])
+    def test_iter_chunks(self, chunk_size):
+        chunks = list(NearestAtomsTrajectory.iter_chunks(
+            traj, cutoff=0.075, chunk_size=chunk_size
+        ))
+        assert [start for (start, _, _) in chunks] == \
+            list(range(0, len(traj), chunk_size))
+        np.testing.assert_array_equal(
+            np.concatenate([nearest for (_, nearest, _) in chunks]),
+            self.nearest.nearest
+        )
+
+    def test_iter_chunks_iterable(self):
+        trajectory_chunks = (traj[start:start + 2] for start in range(0, 5, 2))
+        chunks = list(NearestAtomsTrajectory.iter_chunks(
+            trajectory_chunks, cutoff=0.075, chunk_size=3
+        ))
+        assert [start for (start, _, _) in chunks] == [0, 3]
+        np.testing.assert_allclose(
+            np.concatenate([dist for (_, _, dist) in chunks]),
+            self.nearest.nearest_distance
+        )
+
+    @pytest.mark.parametrize("threshold, expected", [
+        (0.051, 0), (0.048, 1), (0.045, None)
+    ])
+    def test_first_frame_below(self, threshold, expected):
+        # smallest nearest distances: 0.05 in frame 3, 0.047 in frame 4
+        trajectory = traj[3:]
+        assert NearestAtomsTrajectory.first_frame_below(
+            trajectory, threshold, chunk_size=1
+        ) == expected
+
+
 class TestMinimumDistanceCounter(object):
     def setup(self):
         self.topology = traj.topology
@@ -180,3 +287,38 @@ class TestMinimumDistanceCounter(object):
         actual_count = {frozenset(k): v
                         for (k, v) in self.min_dist.residue_count.items()}
         assert actual_count == expected_count
+
+    def test_counts_match_history(self):
+        assert self.min_dist.atom_count == \
+            collections.Counter(self.min_dist.atom_history)
+        assert self.min_dist.residue_count == \
+            collections.Counter(self.min_dist.residue_history)
+
+    def test_count_pairs(self):
+        pairs = np.array([[3, 1], [0, 2], [3, 1], [1, 3]])
+        unique, counts = MinimumDistanceCounter._count_pairs(pairs, 4)
+        assert unique.tolist() == [[0, 2], [1, 3], [3, 1]]
+        assert counts.tolist() == [1, 1, 2]
+
+
+@pytest.mark.parametrize("box", [None, "orthorhombic", "triclinic"])
+def test_minimum_distance_counter_brute_force(box):
+    trajectory = traj[:]
+    if box == "orthorhombic":
+        trajectory.unitcell_vectors = np.tile(np.diag([0.5, 0.6, 0.7]),
+                                              (len(traj), 1, 1))
+    elif box == "triclinic":
+        trajectory.unitcell_vectors = np.tile(
+            np.array([[0.6, 0, 0], [0.2, 0.6, 0], [0.1, 0.1, 0.6]]),
+            (len(traj), 1, 1)
+        )
+    query = [0, 1, 4]
+    haystack = [2, 3, 6, 8, 9]
+    min_dist = MinimumDistanceCounter(trajectory, query, haystack,
+                                      chunk_size=2)
+    distances = md.compute_distances(trajectory, min_dist.atom_pairs)
+    np.testing.assert_allclose(min_dist.minimum_distances,
+                               distances.min(axis=1), rtol=1e-5)
+    expected = [min_dist.atom_pairs[idx] for idx in distances.argmin(axis=1)]
+    assert [tuple(pair) for pair in min_dist._min_pairs.tolist()] \
+        == expected
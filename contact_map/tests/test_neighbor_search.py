@@ -0,0 +1,90 @@
+# pylint: disable=wildcard-import, missing-docstring, protected-access
+# pylint: disable=attribute-defined-outside-init, invalid-name, no-self-use
+# pylint: disable=wrong-import-order, unused-wildcard-import
+
+import mdtraj as md
+
+from .utils import *
+from .test_contact_map import traj
+
+from contact_map.neighbor_search import *
+from contact_map import ContactFrequency, ContactTrajectory
+
+
+def _brute_force_pairs(points, max_distance, box=None):
+    n_points = len(points)
+    first, second = np.triu_indices(n_points, k=1)
+    delta = minimum_image(points[first] - points[second], box)
+    close = np.linalg.norm(delta, axis=1) < max_distance
+    return set(zip(first[close].tolist(), second[close].tolist()))
+
+
+def _sparse_trajectory(periodic, n_residues=60, n_frames=2, box=4.0):
+    # residues with 3 atoms each, scattered in a (periodic) box
+    rng = np.random.default_rng(42)
+    topology = md.Topology()
+    chain = topology.add_chain()
+    for _ in range(n_residues):
+        residue = topology.add_residue('ALA', chain)
+        for name in ['N', 'CA', 'C']:
+            topology.add_atom(name, md.element.carbon, residue)
+    centers = rng.uniform(0, box, (n_frames, n_residues, 1, 3))
+    offsets = rng.normal(0, 0.1, (n_frames, n_residues, 3, 3))
+    xyz = (centers + offsets).reshape(n_frames, -1, 3)
+    unitcell = {}
+    if periodic:
+        xyz = xyz % box
+        unitcell = {'unitcell_lengths': np.full((n_frames, 3), box),
+                    'unitcell_angles': np.full((n_frames, 3), 90.0)}
+    return md.Trajectory(xyz.astype(np.float32), topology, **unitcell)
+
+
+@pytest.mark.parametrize("periodic", [True, False])
+@pytest.mark.parametrize("cell_size", [0.3, 1.5, 5.0])
+def test_cell_list_pairs(periodic, cell_size):
+    rng = np.random.default_rng(0)
+    box = np.array([4.0, 3.0, 5.0]) if periodic else None
+    points = rng.uniform(0, 4.0, (200, 3))
+    first, second = cell_list_pairs(points, cell_size, box)
+    assert np.all(first < second)
+    pairs = set(zip(first.tolist(), second.tolist()))
+    assert len(pairs) == len(first)
+    assert _brute_force_pairs(points, cell_size, box) <= pairs
+
+
+@pytest.mark.parametrize("periodic", [True, False])
+def test_residue_spheres(periodic):
+    trajectory = _sparse_trajectory(periodic)
+    cmap = ContactFrequency(trajectory, cutoff=0.3, n_neighbors_ignored=0)
+    spheres = cmap._residue_spheres
+    box = box_lengths(trajectory, 0)
+    centers, radii = spheres.spheres(trajectory.xyz[0], box)
+    delta = minimum_image(trajectory.xyz[0] - centers[spheres.atom_group],
+                          box)
+    distances = np.linalg.norm(delta, axis=1)
+    assert np.all(distances <= radii[spheres.atom_group] + 1e-6)
+
+
+@pytest.mark.parametrize("periodic", [True, False])
+@pytest.mark.parametrize("n_neighbors_ignored", [0, 2])
+def test_residue_prefilter(periodic, n_neighbors_ignored):
+    trajectory = _sparse_trajectory(periodic)
+    query = list(range(90))
+    cmap = ContactFrequency(trajectory, cutoff=0.3, query=query,
+                            n_neighbors_ignored=n_neighbors_ignored)
+    prefiltered = ContactFrequency(trajectory, cutoff=0.3, query=query,
+                                   n_neighbors_ignored=n_neighbors_ignored,
+                                   residue_prefilter=True)
+    assert len(cmap.atom_contacts.counter) > 0
+    assert prefiltered == cmap
+
+
+def test_residue_prefilter_test_trajectory():
+    cmap = ContactFrequency(traj, cutoff=0.075, n_neighbors_ignored=0)
+    prefiltered = ContactFrequency(traj, cutoff=0.075, n_neighbors_ignored=0,
+                                   residue_prefilter=True)
+    assert prefiltered == cmap
+    ctraj = ContactTrajectory(traj, cutoff=0.075, n_neighbors_ignored=0,
+                              residue_prefilter=True)
+    assert ctraj == ContactTrajectory(traj, cutoff=0.075,
+                                      n_neighbors_ignored=0)
@@ -0,0 +1,49 @@
+# pylint: disable=wildcard-import, missing-docstring, protected-access
+# pylint: disable=attribute-defined-outside-init, invalid-name, no-self-use
+# pylint: disable=wrong-import-order, unused-wildcard-import
+
+from .utils import *
+from .test_contact_map import traj
+
+from contact_map import ContactFrequency
+from contact_map.options import *
+
+
+class TestExecutionOptions(object):
+    def test_defaults(self):
+        options = ExecutionOptions()
+        assert options.checkpoint is None
+        assert options.cache is None
+        assert options.residue_prefilter is False
+        assert options.engine == "mdtraj"
+        assert options.n_threads == 1
+
+    def test_none_gives_defaults(self):
+        options = ExecutionOptions(residue_prefilter=None, engine=None,
+                                   n_threads=None)
+        assert options.residue_prefilter is False
+        assert options.engine == "mdtraj"
+        assert options.n_threads == 1
+
+    def test_from_kwargs(self):
+        kwargs = {'engine': "kdtree", 'n_threads': 2, 'top': "foo.pdb"}
+        options = ExecutionOptions.from_kwargs(kwargs)
+        assert options.engine == "kdtree"
+        assert options.n_threads == 2
+        assert kwargs == {'top': "foo.pdb"}
+
+
+def test_contact_frequency_options():
+    cmap = ContactFrequency(traj, cutoff=0.075, n_neighbors_ignored=0,
+                            engine="kdtree", n_threads=2)
+    assert cmap._options.engine == "kdtree"
+    assert cmap._options.n_threads == 2
+    assert cmap == ContactFrequency(traj, cutoff=0.075,
+                                    n_neighbors_ignored=0)
+    reloaded = ContactFrequency.from_json(cmap.to_json())
+    assert reloaded._options.engine == "mdtraj"
+
+
+def test_contact_frequency_bad_option():
+    with pytest.raises(TypeError):
+        ContactFrequency(traj, cutoff=0.075, n_threds=2)
@@ -0,0 +1,222 @@
+# pylint: disable=wildcard-import, missing-docstring, protected-access
+# pylint: disable=attribute-defined-outside-init, invalid-name, no-self-use
+# pylint: disable=wrong-import-order, unused-wildcard-import
+
+import threading
+
+import mdtraj as md
+
+from .utils import *
+from .test_contact_map import traj
+
+from contact_map.streaming import *
+from contact_map import ContactFrequency, ContactCheckpoint, ContactCache
+from contact_map.checkpoint import file_fingerprint
+
+
+def test_prefetched():
+    assert list(prefetched(range(10), size=3)) == list(range(10))
+    assert list(prefetched([])) == []
+
+
+def test_prefetched_error():
+    def failing():
+        yield 1
+        raise ValueError("bad frame")
+
+    items = prefetched(failing())
+    assert next(items) == 1
+    with pytest.raises(ValueError):
+        next(items)
+
+
+def test_prefetched_bounded():
+    produced = []
+
+    def producer():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    items = prefetched(producer(), size=2)
+    assert next(items) == 0
+    # give the thread a chance to run ahead; it stops when the queue is full
+    for _ in range(20):
+        threading.Event().wait(0.01)
+    assert len(produced) <= 4
+    items.close()
+    assert len(produced) <= 4
+
+
+def test_prefetched_bad_size():
+    with pytest.raises(RuntimeError):
+        list(prefetched(range(3), size=0))
+
+
+class TestStreamingContactFrequency(object):
+    def setup(self):
+        self.filename = find_testfile("trajectory.pdb")
+        self.expected = ContactFrequency(traj, cutoff=0.075,
+                                         n_neighbors_ignored=0)
+
+    @pytest.mark.parametrize("prefetch", [0, 2])
+    @pytest.mark.parametrize("chunk", [1, 3, 100])
+    def test_frequency(self, prefetch, chunk):
+        freq = StreamingContactFrequency(self.filename, cutoff=0.075,
+                                         n_neighbors_ignored=0, chunk=chunk,
+                                         prefetch=prefetch)
+        assert freq.n_frames == len(traj)
+        assert freq == self.expected
+
+    def test_store_frames(self):
+        freq = StreamingContactFrequency(self.filename, cutoff=0.075,
+                                         n_neighbors_ignored=0, chunk=2,
+                                         store_frames=True)
+        expected = ContactFrequency(traj, cutoff=0.075,
+                                    n_neighbors_ignored=0, store_frames=True)
+        for (keys, expected_keys) in zip(freq._frame_contacts,
+                                         expected._frame_contacts):
+            assert_array_equal(keys, expected_keys)
+
+    def test_kwargs(self, tmpdir):
+        xtc = str(tmpdir.join("traj.xtc"))
+        traj.save_xtc(xtc)
+        loaded = md.load(xtc, top=self.filename)
+        freq = StreamingContactFrequency(xtc, cutoff=0.075,
+                                         n_neighbors_ignored=0, chunk=2,
+                                         top=self.filename)
+        assert freq == ContactFrequency(loaded, cutoff=0.075,
+                                        n_neighbors_ignored=0)
+
+    def test_checkpoint(self, tmpdir):
+        checkpoint = ContactCheckpoint(str(tmpdir.join("ckpt.jsonl")),
+                                       interval=2)
+        freq = StreamingContactFrequency(self.filename, cutoff=0.075,
+                                         n_neighbors_ignored=0, chunk=3,
+                                         checkpoint=checkpoint)
+        assert freq == self.expected
+        key = freq._calculation_key(freq._build_kind(),
+                                    freq._input_identity(None))
+        # blocks never cross chunks or checkpoint intervals
+        assert sorted(checkpoint.completed(key)) == \
+                [(0, 2), (2, 3), (3, 5)]
+
+        # restarting skips the completed frames
+        counted = []
+        original = StreamingContactFrequency._count_contacts
+
+        def count_contacts(obj, trajectory, frames):
+            counted.append(frames)
+            return original(obj, trajectory, frames)
+
+        StreamingContactFrequency._count_contacts = count_contacts
+        try:
+            restarted = StreamingContactFrequency(
+                self.filename, cutoff=0.075, n_neighbors_ignored=0, chunk=3,
+                checkpoint=checkpoint
+            )
+        finally:
+            StreamingContactFrequency._count_contacts = original
+        assert counted == []
+        assert restarted == self.expected
+
+    def test_checkpoint_done_past_chunk(self, tmpdir):
+        # a later block is already done (e.g., by the dask runner), and
+        # the chunks are smaller than the checkpoint interval
+        checkpoint = ContactCheckpoint(str(tmpdir.join("ckpt.jsonl")),
+                                       interval=2)
+        freq = StreamingContactFrequency(self.filename, cutoff=0.075,
+                                         n_neighbors_ignored=0, chunk=5,
+                                         checkpoint=checkpoint)
+        key = freq._calculation_key(freq._build_kind(),
+                                    freq._input_identity(None))
+        lines = open(checkpoint.filename).readlines()
+        with open(checkpoint.filename, "w") as f:
+            f.writelines(lines[-1:])
+        assert sorted(checkpoint.completed(key)) == [(4, 5)]
+
+        checkpoint.interval = 10
+        restarted = StreamingContactFrequency(self.filename, cutoff=0.075,
+                                              n_neighbors_ignored=0,
+                                              chunk=3, checkpoint=checkpoint)
+        assert sorted(checkpoint.completed(key)) == [(0, 3), (3, 4), (4, 5)]
+        assert restarted == self.expected
+
+    def test_cache(self, tmpdir):
+        cache = ContactCache(str(tmpdir.join("cache")))
+        freq = StreamingContactFrequency(self.filename, cutoff=0.075,
+                                         n_neighbors_ignored=0, cache=cache)
+        cached = StreamingContactFrequency(self.filename, cutoff=0.075,
+                                           n_neighbors_ignored=0,
+                                           cache=cache)
+        assert len(list(cache._entries())) == 1
+        assert cached == freq
+        assert cached.n_frames == len(traj)
+
+    def test_checkpoint_seek(self, tmpdir):
+        # formats that can seek don't read the checkpointed frames at all
+        xtc = str(tmpdir.join("traj.xtc"))
+        traj.save_xtc(xtc)
+        expected = ContactFrequency(md.load(xtc, top=self.filename),
+                                    cutoff=0.075, n_neighbors_ignored=0)
+        checkpoint = ContactCheckpoint(str(tmpdir.join("ckpt.jsonl")),
+                                       interval=2)
+        freq = StreamingContactFrequency(xtc, cutoff=0.075,
+                                         n_neighbors_ignored=0, chunk=2,
+                                         checkpoint=checkpoint,
+                                         top=self.filename)
+        key = freq._calculation_key(freq._build_kind(),
+                                    freq._input_identity(None))
+        # forget the last block; only that one should be read again
+        lines = open(checkpoint.filename).readlines()
+        with open(checkpoint.filename, "w") as f:
+            f.writelines(lines[:-1])
+        assert checkpoint.completed_frames(key) == 4
+        assert [len(chunk) for chunk in freq._chunks(skip=4)] == [1]
+        restarted = StreamingContactFrequency(xtc, cutoff=0.075,
+                                              n_neighbors_ignored=0, chunk=2,
+                                              checkpoint=checkpoint,
+                                              top=self.filename)
+        assert restarted == expected
+
+    def test_growing(self, tmpdir):
+        xtc = str(tmpdir.join("traj.xtc"))
+        top = self.filename
+        traj[:3].save_xtc(xtc)
+        checkpoint = ContactCheckpoint(str(tmpdir.join("ckpt.jsonl")))
+        kwargs = dict(cutoff=0.075, n_neighbors_ignored=0,
+                      checkpoint=checkpoint, growing=True, top=top)
+        freq = StreamingContactFrequency(xtc, **kwargs)
+        assert freq.n_frames == 3
+
+        traj.save_xtc(xtc)  # same first frames, with more frames appended
+        loaded = md.load(xtc, top=top)
+        expected = ContactFrequency(loaded, cutoff=0.075,
+                                    n_neighbors_ignored=0)
+        key = freq._calculation_key(
+            freq._build_kind(), file_fingerprint(xtc, growing=True, top=top)
+        )
+        assert checkpoint.completed_frames(key) == 3
+        assert freq.update() == 2
+        assert freq == expected
+        assert sorted(checkpoint.completed(key)) == [(0, 3), (3, 5)]
+        assert freq.update() == 0
+        assert StreamingContactFrequency(xtc, **kwargs) == expected
+        assert sorted(checkpoint.completed(key)) == [(0, 3), (3, 5)]
+
+    def test_update(self, tmpdir):
+        xtc = str(tmpdir.join("traj.xtc"))
+        traj[:2].save_xtc(xtc)
+        freq = StreamingContactFrequency(xtc, cutoff=0.075,
+                                         n_neighbors_ignored=0,
+                                         store_frames=True,
+                                         top=self.filename)
+        traj.save_xtc(xtc)
+        expected = ContactFrequency(md.load(xtc, top=self.filename),
+                                    cutoff=0.075, n_neighbors_ignored=0,
+                                    store_frames=True)
+        assert freq.update() == 3
+        assert freq == expected
+        for (updated, full) in zip(freq._frame_contacts,
+                                   expected._frame_contacts):
+            assert_array_equal(updated, full)
@@ -1,6 +1,21 @@
+import hashlib
+import numpy as np
 import mdtraj as md
 
 
+def topology_fingerprint(topology):
+    """Hash identifying the atoms, residues, and chains of a topology"""
+    sha = hashlib.sha1()
+    for atom in topology.atoms:
+        element = atom.element.symbol if atom.element else ""
+        residue = atom.residue
+        sha.update("{0} {1} {2} {3} {4} {5}\n".format(
+            atom.index, atom.name, element, residue.index, residue.name,
+            residue.chain.index
+        ).encode('utf-8'))
+    return sha.hexdigest()
+
+
 def check_atoms_ok(top0, top1, atoms):
     """Check if two topologies are equal on an atom level"""
     genatom = (atoms_eq(top0.atom(i), top1.atom(i)) for i in atoms)
@@ -129,3 +144,31 @@ def check_topologies(map0, map1, override_topology):
         topology = md.Topology()
 
     return all_atoms_ok, all_res_ok, topology
+
+
+def _residue_separation(topology, first, second):
+    """Sequence separation of residues; -1 if they are in different chains
+
+    Parameters
+    ----------
+    topology : mdtraj.Topology
+    first, second : np.array
+        residue indices for each pair
+
+    Returns
+    -------
+    np.array :
+        number of residues between each pair in the chain sequence
+    """
+    residue_chain = np.fromiter((res.chain.index
+                                 for res in topology.residues),
+                                dtype=np.int64, count=topology.n_residues)
+    separation = np.abs(first - second)
+    separation[residue_chain[first] != residue_chain[second]] = -1
+    return separation
+
+
+def _beyond_neighbors(topology, first, second, n_neighbors_ignored):
+    """Whether the residue pairs are not within the ignored neighbors"""
+    separation = _residue_separation(topology, first, second)
+    return (separation == -1) | (separation > n_neighbors_ignored)